@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 庫存分配
+部分品項（尤其是蠟燭）庫存有限，批次需求超過庫存時，依優先順序決定哪些明細可以出貨、哪些要等補貨
+
+- 需求不超過庫存的品項全部出貨，不需排序（需求直接取自 item_stats）
+- 缺貨的品項只對該品項的明細依優先順序取前 N 支（heap，N 為庫存），十萬支以上也只要一次掃描
+優先順序：
+- order：依訂單順序，先下單先出貨
+- customer：客人輪流，每位客人先分到一支，再分第二支……（依客人第一次出現的順序）
+- whole_order：整筆訂單優先，缺貨品項需求較少的訂單先整筆出貨，剩下的庫存再依訂單順序分配
+"""
+
+import heapq
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+from order_formatter import OrderFormatter, parse_reference_data
+
+# 優先順序代碼 -> 說明
+PRIORITIES = {
+    'order': '依訂單順序',
+    'customer': '客人輪流（每位客人先分一支）',
+    'whole_order': '整筆訂單優先（需求少的訂單先整筆出貨）',
+}
+
+DEFAULT_PRIORITY = 'order'
+
+
+def parse_stock(stock_text: str) -> Dict[str, int]:
+    """庫存文字與參考數據格式相同，例如：孔雀王祈願蠟燭 40 支、三色蠟燭 12 支"""
+    return parse_reference_data(stock_text)
+
+
+class ItemAllocation(NamedTuple):
+    """單一品項的分配結果"""
+    item: str
+    stock: int
+    demand: int
+    allocated: int
+    backordered: int
+    remaining: int
+
+
+class Allocation:
+    """庫存分配結果：可出貨與待補貨的明細、各品項分配情形與剩餘庫存"""
+
+    def __init__(self, priority: str, fulfilled: List[Dict], backordered: List[Dict],
+                 items: List[ItemAllocation]):
+        self.priority = priority
+        self.fulfilled = fulfilled
+        self.backordered = backordered
+        self.items = items
+
+    @property
+    def remaining(self) -> Dict[str, int]:
+        """剩餘庫存 {品項: 數量}"""
+        return {entry.item: entry.remaining for entry in self.items}
+
+    @property
+    def has_backorders(self) -> bool:
+        return bool(self.backordered)
+
+    def summary(self) -> str:
+        """一行文字摘要，例如：可出貨 310 支 • 待補貨 4 支（2 筆訂單）• 缺貨品項 1 種"""
+        orders = len({row['order_index'] for row in self.backordered})
+        short = sum(1 for entry in self.items if entry.backordered)
+        return (f"可出貨 {len(self.fulfilled)} 支 • 待補貨 {len(self.backordered)} 支（{orders} 筆訂單）"
+                f" • 缺貨品項 {short} 種")
+
+    def to_dict(self) -> Dict:
+        """可 JSON 序列化的分配結果"""
+        return {
+            'priority': self.priority,
+            'summary': {
+                'fulfilled': len(self.fulfilled),
+                'backordered': len(self.backordered),
+                'backordered_orders': len({row['order_index'] for row in self.backordered}),
+            },
+            'items': [entry._asdict() for entry in self.items],
+            'remaining': self.remaining,
+            'fulfilled': self.fulfilled,
+            'backordered': self.backordered,
+        }
+
+    def render_markdown(self) -> str:
+        """Markdown 分配報告（品項分配表與待補貨明細）"""
+        def cell(text):
+            return str(text).replace('|', '\\|')
+
+        result = ["# 📦 庫存分配報告\n", f"**優先順序**：{PRIORITIES[self.priority]}\n", f"**{self.summary()}**\n"]
+
+        result.append("| 品項名稱 | 庫存 | 需求 | 已分配 | 待補貨 | 剩餘庫存 |")
+        result.append("|----------|------|------|--------|--------|----------|")
+        for entry in self.items:
+            mark = ' ⚠️' if entry.backordered else ''
+            result.append(f"| {cell(entry.item)}{mark} | {entry.stock} | {entry.demand} | {entry.allocated} | "
+                          f"{entry.backordered} | {entry.remaining} |")
+
+        if not self.backordered:
+            result.append("\n**✅ 庫存足夠，所有明細都可出貨！**")
+            return '\n'.join(result)
+
+        result.append(f"\n## ⏳ 待補貨明細（{len(self.backordered)} 支）\n")
+        result.append("| 編號 | 訂單 | 品項 | 主要人物 | 對象 |")
+        result.append("|------|------|------|----------|------|")
+        for row in self.backordered:
+            result.append(f"| {row['index']} | {row['order_index']} | {cell(row['item'])} | "
+                          f"{cell(row['main_person'])} | {cell(row['target_person'])} |")
+        return '\n'.join(result)
+
+
+def _unit_keys(formatter: OrderFormatter, positions: List[int], priority: str) -> List[tuple]:
+    """缺貨品項各明細的排序鍵（越小越優先），最後一欄為明細位置"""
+    rows = formatter.expanded_orders
+    if priority == 'order':
+        # 明細本來就依訂單順序排列
+        return [(position,) for position in positions]
+
+    # customer：同一客人的第 n 支排在所有客人的第 n-1 支之後
+    customer_of = {}
+    customer_rank = {}
+    taken = defaultdict(int)
+    keys = []
+    for position in positions:
+        order_index = rows[position]['order_index']
+        customer = customer_of.get(order_index)
+        if customer is None:
+            customer = customer_of[order_index] = formatter.get_order(order_index)['main_info'].key
+        rank = customer_rank.setdefault(customer, len(customer_rank))
+        keys.append((taken[customer], rank, position))
+        taken[customer] += 1
+    return keys
+
+
+def _whole_order_winners(rows: List[Dict], shortage: Dict[str, List[int]], stock: Dict[str, int]) -> set:
+    """整筆訂單優先：缺貨品項需求少的訂單先整筆分配，放不下的訂單之後再依訂單順序分配剩餘庫存"""
+    demand = defaultdict(lambda: defaultdict(list))  # 訂單編號 -> 品項 -> 明細位置
+    for item, positions in shortage.items():
+        for position in positions:
+            demand[rows[position]['order_index']][item].append(position)
+
+    left = {item: stock[item] for item in shortage}
+    heap = [(sum(len(p) for p in items.values()), order_index) for order_index, items in demand.items()]
+    heapq.heapify(heap)
+
+    winners = set()
+    deferred = []
+    while heap:
+        _, order_index = heapq.heappop(heap)
+        items = demand[order_index]
+        if all(len(positions) <= left[item] for item, positions in items.items()):
+            for item, positions in items.items():
+                left[item] -= len(positions)
+                winners.update(positions)
+        else:
+            deferred.append(order_index)
+
+    # 剩餘庫存依訂單順序分給沒能整筆出貨的訂單
+    for order_index in sorted(deferred):
+        for item, positions in demand[order_index].items():
+            take = min(left[item], len(positions))
+            if take:
+                winners.update(positions[:take])
+                left[item] -= take
+    return winners
+
+
+def allocate(formatter: OrderFormatter, stock: Dict[str, int], priority: str = DEFAULT_PRIORITY) -> Allocation:
+    """
+    依庫存分配展開明細，stock 為 {品項: 庫存數量}（沒列出的品項視為不限量）
+    例如：allocate(formatter, {'孔雀王祈願蠟燭': 40}, priority='customer')
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"不支援的優先順序：{priority}（可用：{', '.join(PRIORITIES)}）")
+
+    rows = formatter.expanded_orders
+    # 只有需求超過庫存的品項需要挑選
+    shortage = {item: [] for item, quantity in stock.items() if formatter.item_stats.get(item, 0) > quantity}
+
+    backordered_positions = set()
+    if shortage:
+        for position, row in enumerate(rows):
+            positions = shortage.get(row['item'])
+            if positions is not None:
+                positions.append(position)
+
+        if priority == 'whole_order':
+            winners = _whole_order_winners(rows, shortage, stock)
+            for positions in shortage.values():
+                backordered_positions.update(p for p in positions if p not in winners)
+        else:
+            for item, positions in shortage.items():
+                keys = _unit_keys(formatter, positions, priority)
+                winners = {key[-1] for key in heapq.nsmallest(max(stock[item], 0), keys)}
+                backordered_positions.update(p for p in positions if p not in winners)
+
+    fulfilled = []
+    backordered = []
+    for position, row in enumerate(rows):
+        (backordered if position in backordered_positions else fulfilled).append(row)
+
+    short_counts = defaultdict(int)
+    for row in backordered:
+        short_counts[row['item']] += 1
+    items = []
+    for item in sorted(stock):
+        demand = formatter.item_stats.get(item, 0)
+        allocated = demand - short_counts[item]
+        items.append(ItemAllocation(item, stock[item], demand, allocated, short_counts[item],
+                                    stock[item] - allocated))
+
+    return Allocation(priority, fulfilled, backordered, items)
+
@@ -6,127 +6,33 @@
 
 import streamlit as st
 import streamlit.components.v1 as components
-from order_formatter import OrderFormatter
+from order_formatter import DIAGNOSTIC_LABELS, OrderFormatter, AggregationCube
+from order_formatter import convert_multi_line_format as core_convert_multi_line_format
+from allocation import PRIORITIES, allocate, parse_stock
+from batch_cache import BatchCache, batch_key
+from batch_diff import BATCH_EXTENSIONS, diff_batches, load_batch
+from html_report import render_html_report
+from import_ledger import DEFAULT_LEDGER_PATH, ImportLedger
+from item_sheets import SHEET_FORMATS, build_item_sheets_zip
+from labels import DEFAULT_SHEET, LABEL_SHEETS, render_labels
+from scheduling import GROUPINGS, parse_capacity, schedule_units
+from report_archive import DEFAULT_ARCHIVE_DIR, ReportArchive
+from order_import import FIELD_LABELS, FIELDS, REQUIRED_FIELDS, guess_mapping, load_table, read_header
 from version import APP_RELEASE_DATE, APP_RELEASE_NOTE, APP_VERSION
+from contextlib import nullcontext
 from datetime import datetime
-import re
+import hashlib
 import html
+import io
+import json
+import os
+import time
+import uuid
 
 # 轉換多行格式為 Tab 分隔格式
 def convert_multi_line_format(order_data):
-    """轉換多行格式為 Tab 分隔格式"""
-    lines = order_data.split('\n')
-
-    # 解析多行格式
-    orders = []
-    current_order = []
-
-    for i, line in enumerate(lines):
-        line = line.strip()
-
-        if not line:
-            # 遇到空行表示一筆訂單結束
-            if current_order:
-                filtered_order = [item for item in current_order if item]
-                if filtered_order:
-                    orders.append(filtered_order)
-                current_order = []
-            continue
-
-        # 檢查是否為新訂單的品項行（包含 x數量 或 *數量 格式）
-        # 匹配：品項名 + 可選空格 + x/X/×/* + 可選空格 + 數字
-        # 必須是行的主要內容，不是生日或其他格式
-        is_item_line = bool(re.search(r'^[^\d]+\s*[xX×*]\s*\d+', line))
-
-        # 如果當前行是品項行，且已經有資料在 current_order 中
-        # 表示這是新訂單的開始，需要先保存前一筆訂單
-        if is_item_line and current_order:
-            # 檢查 current_order 是否已經是完整訂單（至少有願望行）
-            has_wish = any('願望' in item or '愿望' in item or '祈' in item or '蠟燭' in item for item in current_order)
-            if has_wish:
-                # 保存前一筆訂單
-                filtered_order = [item for item in current_order if item]
-                if filtered_order:
-                    orders.append(filtered_order)
-                current_order = []
-
-        # 非空行加入當前訂單
-        current_order.append(line)
-
-    # 處理最後一筆訂單
-    if current_order:
-        filtered_order = [item for item in current_order if item]
-        if filtered_order:
-            orders.append(filtered_order)
-
-    # 轉換格式
-    converted_orders = []
-
-    for order_lines in orders:
-        if len(order_lines) < 2:
-            continue
-
-        # 第1行：品項
-        item = order_lines[0]
-
-        # 找到主要人物（姓名 生日）- 通常是第2行或第3行
-        main_person = "—"
-        target_person = "—"
-        wish = ""
-
-        # 從第二行開始查找
-        person_index = 1
-        wish_index = -1
-
-        # 查找願望行的位置（支援「願望」「祈」「蠟燭」等開頭）
-        for idx, line in enumerate(order_lines[1:], start=1):
-            if '願望' in line or '祈' in line or '蠟燭' in line:
-                wish_index = idx
-                # 處理願望的第一行
-                wish_first = line.replace('願望：', '').replace('願望:', '')
-                wish_first = wish_first.replace('蠟燭：', '').replace('蠟燭:', '').strip()
-                
-                # 收集願望後續的多行內容（直到遇到下一筆訂單的品項行或結束）
-                wish_lines = [wish_first]
-                for extra_idx in range(idx + 1, len(order_lines)):
-                    extra_line = order_lines[extra_idx].strip()
-                    # 檢查是否為新訂單的品項行（停止收集）
-                    if re.search(r'^[^\d]+\s*[xX×*]\s*\d+', extra_line):
-                        break
-                    wish_lines.append(extra_line)
-                
-                wish = ' '.join(wish_lines)
-                break
-
-        # 在願望之前的行中找人物資料
-        person_lines = order_lines[1:wish_index] if wish_index > 0 else order_lines[1:]
-
-        # 解析人物資料的輔助函數
-        def parse_person(person_line):
-            """解析人物資料，返回格式化的字符串"""
-            # 嘗試匹配 "姓名 生日" 或 "姓名生日" 格式
-            # 支援多種日期格式：1988/6/30, 1988.6.30, 1988-6-30
-            match = re.match(r'^(.+?)\s*(\d{4}[/\.\-]?\d{1,2}[/\.\-]?\d{1,2})$', person_line)
-            if match:
-                name = match.group(1).strip()
-                birth = match.group(2).replace('/', '.').replace('-', '.')
-                return f"{name}/{birth}"
-            else:
-                # 如果匹配失敗，返回原字符串
-                return person_line
-
-        # 解析人物資料
-        if len(person_lines) >= 1:
-            # 第一個人物（主要人物）
-            main_person = parse_person(person_lines[0])
-
-        if len(person_lines) >= 2:
-            # 第二個人物（對象）
-            target_person = parse_person(person_lines[1])
-
-        # 組合成 Tab 分隔格式
-        converted = f"{item}\t{main_person}\t{target_person}\t{wish}"
-        converted_orders.append(converted)
+    """轉換多行格式為 Tab 分隔格式（核心邏輯在 order_formatter）"""
+    converted_orders = core_convert_multi_line_format(order_data)
 
     if not converted_orders:
         st.error("❌ 無法解析資料格式！請確認資料是多行格式。")
@@ -134,12 +40,12 @@ def convert_multi_line_format(order_data):
 
     # 調試信息 - 版本標記
     result = '\n'.join(converted_orders)
-    st.info(f"🔍 版本 {APP_VERSION} | 解析: {len(orders)} 組 → 轉換: {len(converted_orders)} 筆")
+    st.info(f"🔍 版本 {APP_VERSION} | 轉換: {len(converted_orders)} 筆")
     st.success(f"✅ 成功轉換 {len(converted_orders)} 筆訂單！")
 
     # 調試：顯示前3筆
     with st.expander("🔍 查看前3筆轉換結果"):
-        for i, line in enumerate(result.split('\n')[:3], 1):
+        for i, line in enumerate(converted_orders[:3], 1):
             st.code(f"{i}. {line}", language="text")
 
     return result
@@ -152,6 +58,110 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 伺服器共用的批次快取（所有 session 共用同一個實例）
+@st.cache_resource
+def get_batch_cache():
+    """建立批次快取，記憶體上限與閒置時限可用環境變數調整"""
+    return BatchCache(
+        max_bytes=int(os.environ.get('ORDER_CACHE_MAX_MB', '512')) * 1024 * 1024,
+        session_ttl=float(os.environ.get('ORDER_CACHE_SESSION_TTL', '1800'))
+    )
+
+
+# 匯入紀錄（已匯入過的訂單識別碼），整個伺服器共用一份
+LEDGER_PATH = os.environ.get('ORDER_LEDGER_PATH', DEFAULT_LEDGER_PATH)
+
+
+def ledger_version():
+    """匯入紀錄的版本：有新紀錄時改變，讓「略過已匯入」的批次不會沿用舊的快取"""
+    with ImportLedger(LEDGER_PATH) as ledger:
+        return ledger.version()
+
+
+# 歷史報表封存，整個伺服器共用一份
+ARCHIVE_DIR = os.environ.get('ORDER_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR)
+
+
+def table_batch_key(table):
+    """上傳檔的來源鍵：檔案內容與欄位對應相同時共用快取"""
+    filename, content, mapping = table
+    source = hashlib.sha256(content).hexdigest() + json.dumps(mapping, ensure_ascii=False, sort_keys=True)
+    return batch_key(source)
+
+
+def render_reports(formatter, reference_data):
+    """生成三種報表字串（formatter 已渲染過的區段直接沿用，只改參考數據時只重算差異比對）"""
+    return {
+        'full_report': formatter.generate_full_report(reference_data),
+        'plain_details': formatter.generate_plain_details(),
+        'plain_statistics': formatter.generate_plain_statistics(),
+    }
+
+
+def build_batch(order_data, reference_data, table=None, skip_imported=False):
+    """
+    解析訂單並預先生成三種報表字串，回傳 (formatter, reports)
+    table 為 (檔名, 檔案內容, 欄位對應) 時改為逐列讀取上傳的試算表／CSV
+    skip_imported 為 True 時依匯入紀錄略過已匯入過的訂單（只檢查，按「記為已匯入」才寫入）
+    """
+    formatter = OrderFormatter()
+    # 設定 ORDER_TRACE_MEMORY=1 時，用 tracemalloc 量測載入與報表生成的記憶體配置（會變慢）
+    trace = os.environ.get('ORDER_TRACE_MEMORY') == '1'
+
+    with (formatter.trace_memory('load') if trace else nullcontext()):
+        if table is None:
+            formatter.load_data(order_data)
+        else:
+            filename, content, mapping = table
+            load_table(formatter, io.BytesIO(content), filename, mapping)
+    if skip_imported:
+        with ImportLedger(LEDGER_PATH) as ledger:
+            ledger.screen(formatter, skip=True)
+            ledger.rollback()
+    if len(formatter.orders) == 0:
+        return formatter, None
+
+    with (formatter.trace_memory('render') if trace else nullcontext()):
+        reports = render_reports(formatter, reference_data)
+
+    # 設定 ORDER_METRICS_LOG 時，把各階段耗時附加到紀錄檔以追蹤趨勢
+    metrics_log = os.environ.get('ORDER_METRICS_LOG')
+    if metrics_log:
+        formatter.metrics.write_log(metrics_log, source='web')
+    return formatter, reports
+
+
+def cached_batch(session_id, key, source_key, source):
+    """
+    取得批次，回傳 (快取中的批次或 None, formatter)
+    - 同樣的批次已快取：直接共用
+    - 同一來源已解析過（只改了參考數據）：沿用那份解析結果，只重新渲染報表
+    - 否則用 source 完整解析（沒有任何訂單時批次為 None）
+    其他 session 正在解析同一來源時先等它完成，再直接共用
+    """
+    with batch_cache.building(source_key):
+        batch = batch_cache.get(session_id, key)
+        if batch is not None:
+            return batch, batch.formatter
+        parsed = batch_cache.parsed(source_key)
+        if parsed is not None:
+            with parsed.lock:
+                reports = render_reports(parsed.formatter, source[1])
+            batch = batch_cache.put(session_id, key, parsed.formatter, reports, source=source_key)
+            return batch, batch.formatter
+        formatter, reports = build_batch(*source)
+        if reports is None:
+            return None, formatter
+        return batch_cache.put(session_id, key, formatter, reports, source=source_key), formatter
+
+
+batch_cache = get_batch_cache()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+batch_cache.touch(session_id)
+batch_cache.expire_idle_sessions()
+
 # 自訂 CSS 樣式 - 現代設計系統
 st.markdown("""
 <style>
@@ -337,7 +347,7 @@ with st.sidebar:
     st.info("💡 提示：建議從 Excel 複製貼上，會自動保留 Tab 分隔")
 
 # 主要內容區
-tab1, tab2, tab3 = st.tabs(["📝 訂單輸入", "📊 報表結果", "ℹ️ 關於"])
+tab1, tab2, tab_diff, tab_archive, tab3 = st.tabs(["📝 訂單輸入", "📊 報表結果", "🔀 批次比對", "🗄️ 歷史封存", "ℹ️ 關於"])
 
 with tab1:
     st.header("訂單資料輸入")
@@ -358,6 +368,31 @@ with tab1:
     # 更新 session state
     st.session_state.order_data = order_data
 
+    # 直接匯入表單匯出的試算表／CSV（逐列讀取，不必複製貼上）
+    table = None
+    with st.expander("📂 從試算表／CSV 匯入"):
+        uploaded = st.file_uploader("選擇檔案", type=['csv', 'xlsx'], help="第一列需為表頭")
+        if uploaded is not None:
+            try:
+                header = [name.strip() for name in read_header(uploaded, uploaded.name) if name and name.strip()]
+            except (ImportError, ValueError, UnicodeDecodeError) as e:
+                header = None
+                st.error(f"❌ 無法讀取檔案：{e}")
+            if header:
+                st.caption("欄位對應（同一欄位選多欄時以空白串接，例如姓名＋生日）")
+                guessed = guess_mapping(header)
+                mapping = {}
+                mapping_cols = st.columns(len(FIELDS))
+                for field, column in zip(FIELDS, mapping_cols):
+                    with column:
+                        mapping[field] = st.multiselect(
+                            FIELD_LABELS[field] + ('（必填）' if field in REQUIRED_FIELDS else ''),
+                            options=header,
+                            default=guessed[field],
+                            key=f"import_mapping_{field}"
+                        )
+                table = (uploaded.name, uploaded.getvalue(), mapping)
+
     # 顯示轉換成功訊息
     if st.session_state.get('conversion_done', False):
         st.success("✅ 轉換完成！資料已更新到輸入框中，現在可以點擊「📊 生成報表」")
@@ -382,7 +417,6 @@ with tab1:
         st.success("✅ 轉換完成！請複製下方結果，貼回上面的輸入框，然後點擊「📊 生成報表」")
 
         # 一鍵複製按鈕
-        import json
         escaped_converted = json.dumps(st.session_state.converted_result)[1:-1]
         copy_converted_html = f"""
         <div style="margin-bottom: 10px;">
@@ -462,36 +496,60 @@ with tab1:
             help="用於比對統計數量是否正確"
         )
 
+    skip_imported = st.checkbox(
+        "📥 略過已匯入過的訂單",
+        key="skip_imported",
+        help="依匯入紀錄略過內容相同、先前已「記為已匯入」的訂單，重複貼上有重疊的匯出也不會重複計算"
+    )
+
     # 生成報表按鈕
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         generate_button = st.button("🚀 生成報表", type="primary", use_container_width=True)
+        if table is not None:
+            import_button = st.button("📥 以上傳檔案生成報表", use_container_width=True)
+        else:
+            import_button = False
 
 # 處理報表生成
-if generate_button:
-    if not order_data.strip():
+if generate_button or import_button:
+    if import_button and not all(table[2][field] for field in REQUIRED_FIELDS):
+        st.error("❌ 請先選擇品項與主要人物對應的欄位！")
+    elif generate_button and not order_data.strip():
         st.error("❌ 請先輸入訂單資料！")
     else:
         try:
             with st.spinner("🔄 處理中..."):
-                # 建立 formatter 並載入資料
-                formatter = OrderFormatter()
-                formatter.load_data(order_data)
+                reference_text = reference_data.strip() if reference_data else None
+                if import_button:
+                    source = ('', reference_text, table, skip_imported)
+                    source_key = table_batch_key(table)
+                else:
+                    source = (order_data, reference_text, None, skip_imported)
+                    source_key = batch_key(order_data)
+                if skip_imported:
+                    # 依匯入紀錄略過的解析結果只在紀錄沒變動時沿用
+                    source_key += f"|imported:{ledger_version()}"
+                key = batch_key(source_key, reference_text)
+
+                # 同樣的資料已被任一 session 解析過時，直接共用快取；只改了參考數據時只重新渲染差異比對
+                batch, formatter = cached_batch(session_id, key, source_key, source)
+                skipped_orders = sum(1 for d in formatter.diagnostics if d.kind == 'reimport_skipped')
 
                 # 檢查是否成功載入
-                if len(formatter.orders) == 0:
+                if batch is None and skipped_orders:
+                    st.info(f"📥 {skipped_orders} 筆訂單都已匯入過，沒有新訂單")
+                elif batch is None:
                     st.error("❌ 無法解析訂單資料！請檢查資料格式。")
                 else:
-                    # 儲存到 session state
-                    st.session_state.formatter = formatter
-                    st.session_state.reference_data = reference_data.strip() if reference_data else None
-
-                    # 生成報表
-                    st.session_state.full_report = formatter.generate_full_report(st.session_state.reference_data)
-                    st.session_state.plain_details = formatter.generate_plain_details()
-                    st.session_state.plain_statistics = formatter.generate_plain_statistics()
+                    # session 只保存批次鍵與原始資料（批次被淘汰時可重新生成）
+                    st.session_state.batch_key = key
+                    st.session_state.batch_source_key = source_key
+                    st.session_state.batch_source = source
 
                     st.success(f"✅ 報表生成成功！共處理 {len(formatter.orders)} 筆訂單，展開為 {len(formatter.expanded_orders)} 筆明細")
+                    if skipped_orders:
+                        st.info(f"📥 已略過 {skipped_orders} 筆先前匯入過的訂單（詳見解析診斷）")
 
                     # 切換到結果頁籤
                     st.info("👉 請切換到「📊 報表結果」頁籤查看")
@@ -502,10 +560,22 @@ if generate_button:
 with tab2:
     st.header("報表結果")
 
-    if 'formatter' not in st.session_state:
+    current_batch = None
+    if 'batch_key' in st.session_state:
+        current_batch = batch_cache.get(session_id, st.session_state.batch_key)
+        if current_batch is None:
+            # 批次已被淘汰（記憶體上限或閒置過久），用保存的原始資料重新生成
+            with st.spinner("🔄 重新載入報表..."):
+                current_batch, _ = cached_batch(session_id, st.session_state.batch_key,
+                                                st.session_state.get('batch_source_key'), st.session_state.batch_source)
+
+    if current_batch is None:
         st.info("👈 請先在「📝 訂單輸入」頁籤輸入資料並生成報表")
     else:
-        formatter = st.session_state.formatter
+        formatter = current_batch.formatter
+        full_report = current_batch.reports['full_report']
+        plain_details = current_batch.reports['plain_details']
+        plain_statistics = current_batch.reports['plain_statistics']
 
         # 摘要資訊
         col1, col2, col3, col4 = st.columns(4)
@@ -522,6 +592,74 @@ with tab2:
         if formatter.anomalies:
             st.warning(f"⚠️ 發現 {len(formatter.anomalies)} 筆異常訂單")
 
+        if formatter.diagnostics:
+            skipped = sum(1 for d in formatter.diagnostics if d.skipped)
+            with st.expander(f"🩺 解析診斷 {len(formatter.diagnostics)} 則（{skipped} 則的內容未列入統計）"):
+                st.dataframe(
+                    [
+                        {
+                            "行號": d.span,
+                            "類型": DIAGNOSTIC_LABELS.get(d.kind, d.kind),
+                            "說明": d.message
+                        }
+                        for d in formatter.diagnostics
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+                # 跳到原文：顯示選取的診斷訊息對應的行（前後各多兩行）
+                source_text = st.session_state.batch_source[0]
+                located = [d for d in formatter.diagnostics if d.line]
+                if source_text and located:
+                    chosen = st.selectbox(
+                        "查看原文",
+                        options=range(len(located)),
+                        format_func=lambda i: f"第 {located[i].span} 行 • {located[i].message[:40]}",
+                        key="diagnostic_line"
+                    )
+                    diagnostic = located[chosen]
+                    source_lines = source_text.split('\n')
+                    first = max(1, diagnostic.line - 2)
+                    last = min(len(source_lines), diagnostic.last_line + 2)
+                    st.code('\n'.join(
+                        f"{'▶' if diagnostic.line <= n <= diagnostic.last_line else ' '} {n:>5} | {source_lines[n - 1]}"
+                        for n in range(first, last + 1)
+                    ), language="text")
+                elif located:
+                    st.caption("行號為上傳檔案中的列號")
+
+        # 匯入紀錄：確認這批訂單沒問題後記為已匯入，之後再貼上相同的訂單可以略過
+        record_col1, record_col2 = st.columns([1, 2])
+        with record_col1:
+            if st.session_state.get('imported_key') != st.session_state.batch_key:
+                if st.button("📥 記為已匯入", use_container_width=True,
+                             help="把這批訂單的識別碼寫入匯入紀錄，勾選「略過已匯入過的訂單」時會被略過"):
+                    with ImportLedger(LEDGER_PATH) as ledger:
+                        added = ledger.record(formatter, source='網頁版')
+                    st.session_state.imported_key = st.session_state.batch_key
+                    st.session_state.imported_count = added
+        with record_col2:
+            if st.session_state.get('imported_key') == st.session_state.batch_key:
+                added = st.session_state.imported_count
+                st.success(f"📥 已記錄 {added} 筆新訂單"
+                           + (f"（{len(formatter.orders) - added} 筆先前已記錄）" if added < len(formatter.orders) else ""))
+
+        # 歷史封存：把這批報表與訂單壓縮保存，之後可在「🗄️ 歷史封存」依客人、品項、日期查詢
+        archive_col1, archive_col2 = st.columns([1, 2])
+        with archive_col1:
+            if st.session_state.get('archived_key') != st.session_state.batch_key:
+                if st.button("📦 封存這批報表", use_container_width=True,
+                             help="壓縮保存完整報表與訂單，之後可在「🗄️ 歷史封存」頁籤查詢"):
+                    with st.spinner("📦 封存中..."):
+                        entry = ReportArchive(ARCHIVE_DIR).add(
+                            formatter, full_report, name=f"網頁版 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+                        )
+                    st.session_state.archived_key = st.session_state.batch_key
+                    st.session_state.archived_number = entry.number
+        with archive_col2:
+            if st.session_state.get('archived_key') == st.session_state.batch_key:
+                st.success(f"📦 已封存為 #{st.session_state.archived_number}")
+
         st.divider()
 
         # 下載按鈕
@@ -534,7 +672,7 @@ with tab2:
             filename = f"訂單報表_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
             st.download_button(
                 label="📄 下載完整報表",
-                data=st.session_state.full_report,
+                data=full_report,
                 file_name=filename,
                 mime="text/markdown",
                 use_container_width=True
@@ -544,7 +682,7 @@ with tab2:
             # 純明細下載
             st.download_button(
                 label="📋 下載純明細（Tab分隔）",
-                data=st.session_state.plain_details,
+                data=plain_details,
                 file_name=f"訂單明細_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
                 mime="text/plain",
                 use_container_width=True,
@@ -555,32 +693,108 @@ with tab2:
             # 純統計下載
             st.download_button(
                 label="📊 下載品項統計表",
-                data=st.session_state.plain_statistics,
+                data=plain_statistics,
                 file_name=f"品項統計_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
                 mime="text/plain",
                 use_container_width=True
             )
 
+        # 品項工作單：每個品項一份，打包成 zip
+        sheet_col1, sheet_col2 = st.columns([1, 2])
+        with sheet_col1:
+            sheet_format = st.selectbox(
+                "品項工作單格式",
+                options=list(SHEET_FORMATS),
+                format_func=lambda fmt: SHEET_FORMATS[fmt][0],
+                key="item_sheet_format"
+            )
+        with sheet_col2:
+            # 同一批次同一格式只打包一次，放在批次快取中（計入記憶體上限，批次淘汰時一併釋放）
+            sheet_artifact = f"item_sheets:{sheet_format}"
+            sheets_zip = batch_cache.artifact(current_batch.key, sheet_artifact)
+            if sheets_zip is None:
+                if st.button("🏷️ 產生品項工作單", use_container_width=True):
+                    try:
+                        with st.spinner("正在產生品項工作單..."):
+                            sheets_zip = batch_cache.add_artifact(current_batch.key, sheet_artifact,
+                                                                  build_item_sheets_zip(formatter, sheet_format))
+                    except ImportError as e:
+                        st.caption(f"⚠️ {e}")
+            if sheets_zip is not None:
+                st.download_button(
+                    label="🏷️ 下載品項工作單（zip）",
+                    data=sheets_zip,
+                    file_name=f"品項工作單_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                    mime="application/zip",
+                    use_container_width=True,
+                    help="每個品項一份工作單，另附索引"
+                )
+
+        # 標籤貼紙：每一支一張，排進標籤紙格線
+        label_col1, label_col2 = st.columns([1, 2])
+        with label_col1:
+            label_sheet = st.selectbox(
+                "標籤紙規格",
+                options=list(LABEL_SHEETS),
+                format_func=lambda sheet: LABEL_SHEETS[sheet].description,
+                key="label_sheet"
+            )
+        with label_col2:
+            label_artifact = f"labels:{label_sheet}"
+            labels_html = batch_cache.artifact(current_batch.key, label_artifact)
+            if labels_html is None:
+                if st.button("🏷️ 產生標籤", use_container_width=True):
+                    with st.spinner("正在產生標籤..."):
+                        labels_html = batch_cache.add_artifact(current_batch.key, label_artifact,
+                                                               render_labels(formatter, label_sheet))
+            if labels_html is not None:
+                st.download_button(
+                    label="🏷️ 下載標籤（列印用網頁）",
+                    data=labels_html,
+                    file_name=f"標籤_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
+                    mime="text/html",
+                    use_container_width=True,
+                    help="用瀏覽器開啟後列印，列印時邊界請選「無」"
+                )
+
+        # 離線網頁報表：明細嵌入一次，用瀏覽器開啟即可排序、篩選
+        html_page = batch_cache.artifact(current_batch.key, 'html')
+        if html_page is None:
+            if st.button("🌐 產生離線網頁報表", use_container_width=True):
+                with st.spinner("正在產生網頁報表..."):
+                    html_page = batch_cache.add_artifact(
+                        current_batch.key, 'html',
+                        render_html_report(formatter, st.session_state.batch_source[1]))
+        if html_page is not None:
+            st.download_button(
+                label="🌐 下載離線網頁報表（HTML）",
+                data=html_page,
+                file_name=f"訂單報表_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
+                mime="text/html",
+                use_container_width=True,
+                help="不需網路即可開啟，明細可排序、篩選"
+            )
+
         st.divider()
 
         # 顯示報表內容
         st.subheader("📊 報表預覽")
 
         # 使用 tabs 顯示不同內容
-        preview_tab1, preview_tab2, preview_tab3, preview_tab4 = st.tabs([
-            "完整報表", "訂單明細", "品項統計", "異常訂單"
+        (preview_tab1, preview_tab2, preview_tab3, preview_tab4, preview_tab5, preview_tab6, preview_tab7,
+         preview_tab8) = st.tabs([
+            "完整報表", "訂單明細", "品項統計", "異常訂單", "篩選查詢", "分組統計", "庫存分配", "法事排程"
         ])
 
         with preview_tab1:
-            st.markdown(st.session_state.full_report)
+            st.markdown(full_report)
 
         with preview_tab2:
             st.subheader("📋 訂單明細表")
             st.caption("使用說明：直接複製以下內容即可")
             
             # 使用更安全的轉義方式
-            import json
-            escaped_content = json.dumps(st.session_state.plain_details)[1:-1]  # 移除首尾引號
+            escaped_content = json.dumps(plain_details)[1:-1]  # 移除首尾引號
             
             copy_button_html = f"""
             <div style="margin-bottom: 15px;">
@@ -638,11 +852,11 @@ with tab2:
             """
             components.html(copy_button_html, height=70)
             
-            st.text(st.session_state.plain_details)
+            st.text(plain_details)
             st.info("💡 可直接複製貼到 Excel，會自動分欄")
 
         with preview_tab3:
-            st.text(st.session_state.plain_statistics)
+            st.text(plain_statistics)
 
         with preview_tab4:
             if formatter.anomalies:
@@ -657,6 +871,424 @@ with tab2:
             else:
                 st.success("✅ 未發現異常訂單！")
 
+        with preview_tab5:
+            st.subheader("🔎 篩選查詢")
+            st.caption("多個條件同時填寫時，會列出全部符合的明細")
+
+            query_col1, query_col2 = st.columns(2)
+            with query_col1:
+                query_item = st.selectbox("品項", [""] + sorted(formatter.item_stats.keys()))
+                query_person = st.text_input("人物（主要人物或對象）", placeholder="例如：方譯緯")
+            with query_col2:
+                query_target = st.text_input("對象", placeholder="例如：方譯緯")
+                query_wish = st.text_input("願望關鍵字", placeholder="例如：復合")
+
+            if query_item or query_person or query_target or query_wish:
+                query_start = time.perf_counter()
+                matched_rows = formatter.query(
+                    item=query_item or None,
+                    person=query_person or None,
+                    target=query_target or None,
+                    wish=query_wish or None
+                )
+                query_ms = (time.perf_counter() - query_start) * 1000
+
+                st.info(f"🔎 共 {len(matched_rows)} 筆符合（{query_ms:.1f} ms）")
+                if matched_rows:
+                    st.dataframe(
+                        [
+                            {
+                                "編號": row['index'],
+                                "品項": row['item'],
+                                "主要人物": row['main_person'],
+                                "對象": row['target_person'],
+                                "願望": row['wish']
+                            }
+                            for row in matched_rows
+                        ],
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                    st.download_button(
+                        label="📋 下載查詢結果（Tab分隔）",
+                        data='\n'.join(
+                            f"{row['index']}\t{row['item']}\t{row['main_person']}\t{row['target_person']}\t{row['wish']}"
+                            for row in matched_rows
+                        ),
+                        file_name=f"查詢結果_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                        mime="text/plain"
+                    )
+            else:
+                st.info("👆 輸入任一條件開始查詢")
+
+        with preview_tab6:
+            st.subheader("📊 分組統計")
+            st.caption("依品項、客人、對象、批次任意組合彙總，直接讀取預先彙總的結果")
+
+            dimension_labels = AggregationCube.DIMENSION_LABELS
+            group_dims = st.multiselect(
+                "分組維度",
+                options=list(AggregationCube.DIMENSIONS),
+                default=['item', 'main'],
+                format_func=lambda dim: dimension_labels[dim]
+            )
+
+            if group_dims:
+                headers, group_rows = formatter.cube.group_by_table(*group_dims)
+                st.dataframe(
+                    [dict(zip(headers, row)) for row in group_rows],
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+                group_name = '×'.join(dimension_labels[dim] for dim in group_dims)
+                group_col1, group_col2, group_col3 = st.columns(3)
+                with group_col1:
+                    st.download_button(
+                        label="📄 下載 Markdown",
+                        data=formatter.generate_group_statistics(*group_dims),
+                        file_name=f"分組統計_{group_name}.md",
+                        mime="text/markdown",
+                        use_container_width=True
+                    )
+                with group_col2:
+                    st.download_button(
+                        label="📋 下載 Tab 分隔",
+                        data=formatter.cube.render_plain(*group_dims),
+                        file_name=f"分組統計_{group_name}.txt",
+                        mime="text/plain",
+                        use_container_width=True
+                    )
+                with group_col3:
+                    try:
+                        xlsx_buffer = io.BytesIO()
+                        formatter.cube.write_xlsx(xlsx_buffer, *group_dims)
+                        st.download_button(
+                            label="📗 下載 Excel",
+                            data=xlsx_buffer.getvalue(),
+                            file_name=f"分組統計_{group_name}.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            use_container_width=True
+                        )
+                    except ImportError as e:
+                        st.caption(f"⚠️ {e}")
+            else:
+                st.info("👆 請至少選擇一個分組維度")
+
+        with preview_tab7:
+            st.subheader("📦 庫存分配")
+            st.caption("輸入有限品項的庫存（格式同參考數據），需求超過庫存時依優先順序決定哪些明細先出貨；沒列出的品項視為不限量")
+            stock_col1, stock_col2 = st.columns([2, 1])
+            with stock_col1:
+                stock_text = st.text_area("庫存", height=100, key="stock_text",
+                                          placeholder="孔雀王祈願蠟燭 40 支、三色蠟燭 12 支")
+            with stock_col2:
+                priority = st.selectbox("優先順序", options=list(PRIORITIES),
+                                        format_func=lambda code: PRIORITIES[code], key="allocation_priority")
+
+            stock = parse_stock(stock_text) if stock_text.strip() else {}
+            if stock_text.strip() and not stock:
+                st.warning("⚠️ 沒有可辨識的庫存，請確認格式（例如：三色蠟燭 12 支）")
+            elif stock:
+                allocation = allocate(formatter, stock, priority)
+                if allocation.has_backorders:
+                    st.warning(f"⚠️ {allocation.summary()}")
+                else:
+                    st.success(f"✅ {allocation.summary()}")
+
+                st.dataframe(
+                    [
+                        {
+                            "品項名稱": entry.item,
+                            "庫存": entry.stock,
+                            "需求": entry.demand,
+                            "已分配": entry.allocated,
+                            "待補貨": entry.backordered,
+                            "剩餘庫存": entry.remaining
+                        }
+                        for entry in allocation.items
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+                alloc_col1, alloc_col2, alloc_col3 = st.columns(3)
+                with alloc_col1:
+                    st.download_button(
+                        label="✅ 下載可出貨明細（Tab分隔）",
+                        data=OrderFormatter.DETAIL_LINE.render_lines(allocation.fulfilled),
+                        file_name=f"可出貨明細_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                        mime="text/plain",
+                        use_container_width=True
+                    )
+                with alloc_col2:
+                    st.download_button(
+                        label="⏳ 下載待補貨明細（Tab分隔）",
+                        data=OrderFormatter.DETAIL_LINE.render_lines(allocation.backordered),
+                        file_name=f"待補貨明細_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                        mime="text/plain",
+                        use_container_width=True
+                    )
+                with alloc_col3:
+                    st.download_button(
+                        label="📄 下載分配報告",
+                        data=allocation.render_markdown(),
+                        file_name=f"庫存分配_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                        mime="text/markdown",
+                        use_container_width=True
+                    )
+
+        with preview_tab8:
+            st.subheader("📅 法事排程")
+            st.caption("輸入各品項每天能做的數量（格式同參考數據），依下單順序排進各天，同一位客人的品項盡量排在同一天；沒列出的品項不限量")
+            capacity_col1, capacity_col2, capacity_col3 = st.columns([2, 1, 1])
+            with capacity_col1:
+                capacity_text = st.text_area("每日產能", height=100, key="capacity_text",
+                                             placeholder="帕猜佛蠟燭 60 支、拆散 10 支")
+            with capacity_col2:
+                grouping = st.selectbox("分組方式", options=list(GROUPINGS),
+                                        format_func=lambda code: GROUPINGS[code], key="schedule_grouping")
+            with capacity_col3:
+                schedule_start = st.date_input("第一天", key="schedule_start")
+
+            capacities = parse_capacity(capacity_text) if capacity_text.strip() else {}
+            schedule = None
+            if capacity_text.strip() and not capacities:
+                st.warning("⚠️ 沒有可辨識的產能，請確認格式（例如：帕猜佛蠟燭 60 支）")
+            elif capacities:
+                try:
+                    schedule = schedule_units(formatter, capacities, grouping, schedule_start)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+
+            if schedule:
+                st.success(f"✅ {schedule.summary()}")
+                st.dataframe(
+                    [
+                        {"日期": day.date, "天數": day.day, "支數": len(day.rows),
+                         **{item: count for item, count in sorted(day.item_counts().items())}}
+                        for day in schedule.days
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+                schedule_col1, schedule_col2 = st.columns(2)
+                with schedule_col1:
+                    st.download_button(
+                        label="📄 下載排程報告",
+                        data=schedule.render_markdown(),
+                        file_name=f"法事排程_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                        mime="text/markdown",
+                        use_container_width=True
+                    )
+                with schedule_col2:
+                    st.download_button(
+                        label="📋 下載排程明細（Tab分隔）",
+                        data=schedule.render_plain(),
+                        file_name=f"排程明細_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                        mime="text/plain",
+                        use_container_width=True
+                    )
+
+                # 單日的標籤：只印當天排到的明細
+                day_col1, day_col2 = st.columns([1, 2])
+                with day_col1:
+                    label_day = st.selectbox("列印哪一天的標籤", options=range(len(schedule.days)),
+                                             format_func=lambda position: schedule.days[position].label,
+                                             key="schedule_label_day")
+                with day_col2:
+                    day = schedule.days[label_day]
+                    st.download_button(
+                        label=f"🏷️ 下載 {day.date} 的標籤（{len(day.rows)} 支）",
+                        data=render_labels(formatter, st.session_state.get('label_sheet', DEFAULT_SHEET),
+                                           title=f"{day.label} 標籤", rows=day.rows),
+                        file_name=f"標籤_{day.date}.html",
+                        mime="text/html",
+                        use_container_width=True,
+                        help="標籤紙規格沿用上方「標籤紙規格」的選擇"
+                    )
+
+with tab_diff:
+    st.header("批次比對")
+    st.caption("比對同一天訂單修正前後的兩份匯出，列出新增、刪除、修改的訂單與品項數量、金額的淨變化")
+
+    diff_types = [extension.lstrip('.') for extension in BATCH_EXTENSIONS]
+    diff_col1, diff_col2 = st.columns(2)
+    with diff_col1:
+        st.subheader("先前的批次")
+        old_file = st.file_uploader("上傳檔案", type=diff_types, key="diff_old_file",
+                                    help="訂單文字、命令列 -f json 的輸出、CSV 或 Excel")
+        old_text = st.text_area("或貼上訂單資料", height=150, key="diff_old_text")
+    with diff_col2:
+        st.subheader("新的批次")
+        new_file = st.file_uploader("上傳檔案", type=diff_types, key="diff_new_file",
+                                    help="訂單文字、命令列 -f json 的輸出、CSV 或 Excel")
+        new_text = st.text_area("或貼上訂單資料", height=150, key="diff_new_text")
+        if current_batch is not None:
+            st.caption("未提供時使用目前「📊 報表結果」的批次")
+
+    if st.button("🔀 開始比對", type="primary", use_container_width=True):
+        def load_side(uploaded, text, fallback=None):
+            if uploaded is not None:
+                return load_batch(uploaded.getvalue(), uploaded.name)
+            if text.strip():
+                return load_batch(text.encode('utf-8'), 'pasted.txt')
+            return fallback
+
+        try:
+            with st.spinner("🔄 比對中..."):
+                old_formatter = load_side(old_file, old_text)
+                new_formatter = load_side(new_file, new_text,
+                                          current_batch.formatter if current_batch is not None else None)
+            if old_formatter is None or new_formatter is None:
+                st.error("❌ 請提供兩個要比對的批次！")
+            else:
+                st.session_state.batch_diff = diff_batches(old_formatter, new_formatter)
+        except Exception as e:
+            st.error(f"❌ 比對失敗：{str(e)}")
+
+    batch_diff_result = st.session_state.get('batch_diff')
+    if batch_diff_result is not None:
+        st.divider()
+        metric_cols = st.columns(5)
+        metric_cols[0].metric("未變動", f"{batch_diff_result.unchanged} 筆")
+        metric_cols[1].metric("新增", f"{len(batch_diff_result.added)} 筆")
+        metric_cols[2].metric("刪除", f"{len(batch_diff_result.removed)} 筆")
+        metric_cols[3].metric("修改", f"{len(batch_diff_result.modified)} 筆")
+        amount_diff = batch_diff_result.new_amount - batch_diff_result.old_amount
+        metric_cols[4].metric("總金額", f"${batch_diff_result.new_amount:,}", delta=f"{amount_diff:+,}")
+
+        if not batch_diff_result.has_changes:
+            st.success("✅ 兩個批次的訂單完全相同！")
+        else:
+            if batch_diff_result.item_changes:
+                st.subheader("📊 品項淨變化")
+                st.dataframe(
+                    [
+                        {"品項": change.item, "原數量": change.old_quantity, "新數量": change.new_quantity,
+                         "數量變化": change.quantity_diff, "金額變化": change.amount_diff}
+                        for change in batch_diff_result.item_changes
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+            def order_table(orders):
+                return [
+                    {"編號": order['index'], "品項": order['raw_items'], "主要人物": order['main_person'],
+                     "對象": order['target_person'], "願望": order['wish']}
+                    for order in orders
+                ]
+
+            if batch_diff_result.modified:
+                with st.expander(f"✏️ 修改的訂單（{len(batch_diff_result.modified)} 筆）", expanded=True):
+                    st.dataframe(
+                        [
+                            {"原編號": change.old['index'], "新編號": change.new['index'],
+                             "主要人物": change.new['main_person'], "變動欄位": '、'.join(change.fields),
+                             "原品項": change.old['raw_items'], "新品項": change.new['raw_items'],
+                             "原願望": change.old['wish'], "新願望": change.new['wish']}
+                            for change in batch_diff_result.modified
+                        ],
+                        use_container_width=True,
+                        hide_index=True
+                    )
+            if batch_diff_result.added:
+                with st.expander(f"➕ 新增的訂單（{len(batch_diff_result.added)} 筆）"):
+                    st.dataframe(order_table(batch_diff_result.added), use_container_width=True, hide_index=True)
+            if batch_diff_result.removed:
+                with st.expander(f"➖ 刪除的訂單（{len(batch_diff_result.removed)} 筆）"):
+                    st.dataframe(order_table(batch_diff_result.removed), use_container_width=True, hide_index=True)
+
+        diff_download_col1, diff_download_col2 = st.columns(2)
+        with diff_download_col1:
+            st.download_button(
+                label="📄 下載比對報告",
+                data=batch_diff_result.render_markdown(),
+                file_name=f"批次比對_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                mime="text/markdown",
+                use_container_width=True
+            )
+        with diff_download_col2:
+            st.download_button(
+                label="🧾 下載 JSON",
+                data=json.dumps(batch_diff_result.to_dict(), ensure_ascii=False, indent=2),
+                file_name=f"批次比對_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json",
+                use_container_width=True
+            )
+
+with tab_archive:
+    st.header("歷史封存")
+    st.caption("依客人、品項、日期查詢封存過的報表；只用索引篩選，列出訂單時也只解壓縮符合的那幾筆")
+
+    archive = ReportArchive(ARCHIVE_DIR)
+    search_col1, search_col2, search_col3, search_col4 = st.columns(4)
+    with search_col1:
+        archive_customer = st.text_input("客人", key="archive_customer", placeholder="姓名或生日的一部分")
+    with search_col2:
+        archive_item = st.text_input("品項", key="archive_item", placeholder="品項名稱的一部分")
+    with search_col3:
+        archive_since = st.text_input("起始日期", key="archive_since", placeholder="YYYY-MM-DD")
+    with search_col4:
+        archive_until = st.text_input("結束日期", key="archive_until", placeholder="YYYY-MM-DD")
+
+    criteria = {
+        'customer': archive_customer.strip() or None,
+        'item': archive_item.strip() or None,
+        'since': archive_since.strip() or None,
+        'until': archive_until.strip() or None,
+    }
+    entries = archive.find(**criteria)
+    stats = archive.stats()
+    st.caption(f"🗄️ 共 {stats['entries']} 筆封存（{stats['orders']} 筆訂單，封存檔 "
+               f"{stats['data_bytes'] / 1024 / 1024:.1f} MB），符合 {len(entries)} 筆")
+
+    if not entries:
+        st.info("沒有符合的封存。在「📊 報表結果」按「📦 封存這批報表」即可加入封存")
+    else:
+        st.dataframe(
+            [
+                {"編號": entry.number, "封存時間": entry.created, "名稱": entry.name,
+                 "訂單": entry.orders, "支數": entry.units, "金額": entry.amount}
+                for entry in entries
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+
+        chosen_entry = st.selectbox(
+            "查看哪一筆封存",
+            options=range(len(entries)),
+            format_func=lambda i: f"#{entries[i].number} • {entries[i].created} • {entries[i].name}",
+            key="archive_entry"
+        )
+        entry = entries[chosen_entry]
+        archived_report = archive.report(entry)
+        st.download_button(
+            label=f"📥 下載封存 #{entry.number} 的完整報表",
+            data=archived_report,
+            file_name=f"封存報表_{entry.number}_{entry.created[:10]}.md",
+            mime="text/markdown",
+            use_container_width=True
+        )
+        with st.expander("📄 預覽報表"):
+            st.markdown(archived_report)
+
+        # 有客人或品項條件時列出符合的訂單
+        if criteria['customer'] or criteria['item']:
+            st.subheader("🔎 符合的訂單")
+            matches = []
+            for archive_entry, order in archive.find_orders(**criteria):
+                matches.append({"封存": archive_entry.number, "日期": archive_entry.date,
+                                "品項": order['raw_items'], "主要人物": order['main_person'],
+                                "對象": order['target_person'], "願望": order['wish']})
+                # 只列前 2000 筆，避免表格過大
+                if len(matches) >= 2000:
+                    break
+            st.dataframe(matches, use_container_width=True, hide_index=True)
+
 with tab3:
     st.header("關於本工具")
 
@@ -708,6 +1340,84 @@ with tab3:
     💬 如有問題或建議，歡迎透過 GitHub Issues 回報
     """)
 
+# 側邊欄 - 批次快取狀態
+with st.sidebar:
+    with st.expander("🗄️ 伺服器批次快取"):
+        cache_status = batch_cache.status()
+        used_mb = cache_status['total_bytes'] / 1024 / 1024
+        max_mb = cache_status['max_bytes'] / 1024 / 1024
+        st.progress(min(1.0, used_mb / max_mb) if max_mb else 0.0,
+                    text=f"記憶體 {used_mb:.1f} / {max_mb:.0f} MB")
+        st.caption(
+            f"批次 {len(cache_status['batches'])} 個（解析結果 {cache_status['parsed']} 份）• "
+            f"使用中 session {cache_status['sessions']} 個 • "
+            f"命中 {cache_status['hits']} • 未命中 {cache_status['misses']} • 淘汰 {cache_status['evictions']}"
+        )
+        if cache_status['batches']:
+            st.dataframe(
+                [
+                    {
+                        "批次": entry['key'],
+                        "解析結果": entry['source'],
+                        "訂單": entry['orders'],
+                        "明細": entry['units'],
+                        "報表與下載檔(MB)": round(entry['bytes'] / 1024 / 1024, 2),
+                        "解析(MB)": round(entry['parsed_bytes'] / 1024 / 1024, 2),
+                        "session": entry['sessions'],
+                        "閒置(秒)": entry['idle_seconds']
+                    }
+                    for entry in cache_status['batches']
+                ],
+                use_container_width=True,
+                hide_index=True
+            )
+
+# 側邊欄 - 目前批次的處理效能
+with st.sidebar:
+    with st.expander("⏱️ 處理效能"):
+        if current_batch is None:
+            st.caption("生成報表後顯示各階段耗時")
+        else:
+            metrics = current_batch.formatter.metrics.to_dict()
+            st.dataframe(
+                [
+                    {
+                        "階段": name,
+                        "次數": entry['calls'],
+                        "耗時(ms)": round(entry['seconds'] * 1000, 2),
+                        "輸出(KB)": round(entry['bytes'] / 1024, 1)
+                    }
+                    for name, entry in metrics['stages'].items()
+                ],
+                use_container_width=True,
+                hide_index=True
+            )
+            counters = metrics['counters']
+            st.caption(
+                f"讀取 {counters.get('lines_read', 0)} 行 • 訂單 {counters.get('orders_parsed', 0)} 筆 • "
+                f"展開 {counters.get('units_expanded', 0)} 支 • "
+                f"人物快取命中 {counters.get('person_cache_hits', 0)} / 未命中 {counters.get('person_cache_misses', 0)}"
+            )
+
+# 側邊欄 - 目前批次的記憶體用量
+with st.sidebar:
+    with st.expander("🧠 記憶體用量"):
+        if current_batch is None:
+            st.caption("生成報表後顯示各資料結構佔用的記憶體")
+        else:
+            memory = current_batch.memory
+            rows = [{"項目": name, "大小(MB)": round(size / 1024 / 1024, 2)}
+                    for name, size in memory['structures'].items()]
+            rows += [{"項目": f"報表：{name}", "大小(MB)": round(size / 1024 / 1024, 2)}
+                     for name, size in memory['reports'].items()]
+            rows += [{"項目": f"下載檔：{name}", "大小(MB)": round(size / 1024 / 1024, 2)}
+                     for name, size in memory.get('artifacts', {}).items()]
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            st.caption(f"合計約 {memory['total_bytes'] / 1024 / 1024:.1f} MB（放入快取時估算，共用字串只計一次）")
+            for name, traced in memory['traced'].items():
+                st.caption(f"tracemalloc {name}：保留 {traced['allocated'] / 1024 / 1024:.1f} MB，"
+                           f"峰值 {traced['peak'] / 1024 / 1024:.1f} MB")
+
 # 頁腳
 st.divider()
 st.markdown("""
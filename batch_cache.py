@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+伺服器共用的批次快取
+- 同樣的訂單資料只解析、保存一次，各個 session 只拿到一個輕量的批次鍵
+- 解析結果依來源（訂單資料）保存一份，各種參考數據的報表字串另外依批次鍵保存、共用同一個 formatter
+- 使用者要下載時才產生的檔案（工作單、標籤、網頁報表）也放在批次中，一起計入記憶體上限
+- 總記憶體超過上限時，依最久未使用（LRU）順序淘汰批次
+- 閒置超過時限的 session 會自動釋放它持有的批次
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+from order_formatter import estimate_size
+
+
+def batch_key(order_data: str, reference_data: Optional[str] = None) -> str:
+    """依訂單資料與參考數據產生批次鍵（內容相同的批次共用同一份快取）"""
+    digest = hashlib.sha256()
+    digest.update(order_data.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update((reference_data or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+def measure_batch(formatter, reports: Dict[str, str]) -> Dict:
+    """批次的記憶體明細（各資料結構與報表字串），見 OrderFormatter.memory_report"""
+    if hasattr(formatter, 'memory_report'):
+        return formatter.memory_report(reports)
+    size = estimate_size(formatter) + estimate_size(reports)
+    return {'structures': {}, 'reports': {}, 'total_bytes': size, 'traced': {}}
+
+
+class ParsedBatch:
+    """快取中的一份解析結果：同一來源的所有批次共用這個 formatter，大小只計一次"""
+
+    def __init__(self, key: str, formatter, size: int):
+        self.key = key
+        self.formatter = formatter
+        self.size = size
+        self.batches = set()          # 使用這份解析結果的批次鍵
+        self.lock = threading.Lock()  # 在共用的 formatter 上渲染報表時逐一進行（報表區段快取在 formatter 中）
+
+
+class CachedBatch:
+    """
+    快取中的一個批次：解析結果、預先生成的報表字串、下載檔、記憶體明細
+    size 只計報表字串與下載檔，解析結果的大小算在 ParsedBatch
+    """
+
+    def __init__(self, key: str, source: str, formatter, reports: Dict[str, str], memory: Dict):
+        self.key = key
+        self.source = source
+        self.formatter = formatter
+        self.reports = reports
+        self.memory = memory
+        self.artifacts = {}  # 下載檔名稱 -> bytes（使用者按下產生時才加入）
+        self.size = sum(memory.get('reports', {}).values())
+        self.created = time.time()
+        self.last_access = self.created
+        self.sessions = set()
+
+
+class BatchCache:
+    """
+    跨 session 的批次快取
+    - max_bytes：所有批次合計的記憶體上限
+    - session_ttl：session 閒置多少秒後釋放它持有的批次
+    - sizer：(formatter, reports) -> 記憶體明細（需含 total_bytes），預設為 measure_batch
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, session_ttl: float = 30 * 60,
+                 sizer: Callable = None):
+        self.max_bytes = max_bytes
+        self.session_ttl = session_ttl
+        self.sizer = sizer or measure_batch
+        self._batches = OrderedDict()   # 批次鍵 -> CachedBatch（越後面越近期使用）
+        self._parsed = {}               # 來源鍵 -> ParsedBatch
+        self._sessions = {}             # session id -> (批次鍵, 最後活動時間)
+        self._building = {}             # 來源鍵 -> [建立鎖, 等待中的數量]
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, session_id: str, key: str, formatter, reports: Dict[str, str],
+            source: Optional[str] = None) -> CachedBatch:
+        """
+        放入批次（已存在時直接共用），並讓 session 持有它
+        source 為來源鍵（同一份訂單資料、不含參考數據）：同一來源已有解析結果時沿用那個 formatter，不重複計算大小
+        """
+        source = source or key
+        with self._lock:
+            batch = self._batches.get(key)
+            parsed = self._parsed.get(source)
+            if parsed is not None:
+                formatter = parsed.formatter
+
+        if batch is None:
+            # 估算大小要走訪整個 formatter，在全域鎖之外進行，其他 session 的 get/status 不必等待
+            # 共用的 formatter 可能正有其他 session 在渲染報表，估算時持有它的鎖
+            with (parsed.lock if parsed is not None else nullcontext()):
+                memory = self.sizer(formatter, reports)
+
+        with self._lock:
+            if batch is None:
+                batch = self._batches.get(key)
+            if batch is None:
+                parsed = self._parsed.get(source)
+                if parsed is not None:
+                    formatter = parsed.formatter
+                batch = CachedBatch(key, source, formatter, reports, memory)
+                structure_bytes = memory['total_bytes'] - batch.size
+                if parsed is None:
+                    parsed = self._parsed[source] = ParsedBatch(source, formatter, structure_bytes)
+                    self.total_bytes += structure_bytes
+                else:
+                    # 新的報表會加入區段快取：以這次的估計更新解析結果的大小
+                    self.total_bytes += structure_bytes - parsed.size
+                    parsed.size = structure_bytes
+                parsed.batches.add(key)
+                self._batches[key] = batch
+                self.total_bytes += batch.size
+            self._attach(session_id, batch)
+            self._evict(keep=key)
+            return batch
+
+    @contextmanager
+    def building(self, source: str):
+        """
+        同一來源同時只建立一次：多個 session 同時送出相同的訂單資料時，
+        後到的等先到的解析完成，再直接共用快取中的結果（不重複解析）
+        """
+        with self._lock:
+            entry = self._building.get(source)
+            if entry is None:
+                entry = self._building[source] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._building[source]
+
+    def artifact(self, key: str, name: str) -> Optional[bytes]:
+        """取得批次已產生的下載檔（沒有產生過或批次已被淘汰時回傳 None）"""
+        with self._lock:
+            batch = self._batches.get(key)
+            return batch.artifacts.get(name) if batch else None
+
+    def add_artifact(self, key: str, name: str, data: bytes) -> bytes:
+        """
+        把下載檔加入批次並計入記憶體上限，回傳 data
+        批次已被淘汰時不保存（呼叫端照常提供下載，下次重新產生）
+        """
+        size = estimate_size(data)
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                return data
+            previous = batch.artifacts.get(name)
+            delta = size - (estimate_size(previous) if previous is not None else 0)
+            batch.artifacts[name] = data
+            batch.memory.setdefault('artifacts', {})[name] = size
+            batch.memory['total_bytes'] += delta
+            batch.size += delta
+            self.total_bytes += delta
+            self._evict(keep=key)
+        return data
+
+    def parsed(self, source: str) -> Optional[ParsedBatch]:
+        """取得某個來源已快取的解析結果（只改參考數據時沿用，不必重新解析）"""
+        with self._lock:
+            return self._parsed.get(source)
+
+    def get(self, session_id: str, key: str) -> Optional[CachedBatch]:
+        """取得 session 持有的批次；已被淘汰時回傳 None（呼叫端需重新生成）"""
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._attach(session_id, batch)
+            return batch
+
+    def release(self, session_id: str):
+        """session 不再需要它的批次"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry:
+                batch = self._batches.get(entry[0])
+                if batch:
+                    batch.sessions.discard(session_id)
+
+    def touch(self, session_id: str):
+        """更新 session 活動時間"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry:
+                self._sessions[session_id] = (entry[0], time.time())
+
+    def expire_idle_sessions(self, now: float = None) -> int:
+        """釋放閒置過久的 session，回傳釋放數量"""
+        now = now or time.time()
+        with self._lock:
+            idle = [sid for sid, (_, last) in self._sessions.items() if now - last > self.session_ttl]
+            for session_id in idle:
+                self.release(session_id)
+            # 沒有任何 session 持有、且閒置超過時限的批次直接移除
+            for key in [k for k, b in self._batches.items()
+                        if not b.sessions and now - b.last_access > self.session_ttl]:
+                self._remove(key)
+            return len(idle)
+
+    def _attach(self, session_id: str, batch: CachedBatch):
+        previous = self._sessions.get(session_id)
+        if previous and previous[0] != batch.key:
+            old = self._batches.get(previous[0])
+            if old:
+                old.sessions.discard(session_id)
+        now = time.time()
+        self._sessions[session_id] = (batch.key, now)
+        batch.sessions.add(session_id)
+        batch.last_access = now
+        self._batches.move_to_end(batch.key)
+
+    def _remove(self, key: str):
+        batch = self._batches.pop(key)
+        self.total_bytes -= batch.size
+        self.evictions += 1
+        # 最後一個使用這份解析結果的批次移除時，解析結果一併釋放
+        parsed = self._parsed[batch.source]
+        parsed.batches.discard(key)
+        if not parsed.batches:
+            del self._parsed[batch.source]
+            self.total_bytes -= parsed.size
+
+    def _evict(self, keep: str = None):
+        """超過上限時，從最久未使用的批次開始淘汰（剛放入的批次保留）"""
+        for key in list(self._batches):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(key)
+
+    def status(self) -> Dict:
+        """快取狀態（給狀態面板顯示）"""
+        now = time.time()
+        with self._lock:
+            batches: List[Dict] = [
+                {
+                    'key': batch.key[:8],
+                    'source': batch.source[:8],
+                    'orders': len(batch.formatter.orders),
+                    'units': len(batch.formatter.expanded_orders),
+                    'bytes': batch.size,
+                    'parsed_bytes': self._parsed[batch.source].size,
+                    'sessions': len(batch.sessions),
+                    'idle_seconds': int(now - batch.last_access),
+                }
+                for batch in reversed(self._batches.values())
+            ]
+            return {
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'sessions': len(self._sessions),
+                'parsed': len(self._parsed),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'batches': batches,
+            }
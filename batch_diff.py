@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 批次比對
+同一天的訂單重新匯出（修正過）後，找出新增、刪除與修改的訂單，以及各品項數量與金額的淨變化
+
+每筆訂單以正規化後的（品項、主要人物、對象、願望）計算指紋：
+- 指紋相同視為未變動（同樣內容出現多次時逐筆配對）
+- 剩下的訂單以主要人物配對，配到的是修改、配不到的是新增或刪除
+全程只用雜湊表，時間與訂單數成線性
+"""
+
+import hashlib
+import io
+import json
+import os
+from collections import defaultdict, deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from order_formatter import OrderFormatter, normalize_order_text
+from order_import import load_table
+
+# 指紋各欄位的名稱（修改的訂單列出哪些欄位不同）
+SIGNATURE_FIELDS = ('品項', '主要人物', '對象', '願望')
+
+BATCH_EXTENSIONS = ('.txt', '.json', '.csv', '.xlsx')
+
+
+def order_signature(formatter: OrderFormatter, order: Dict) -> Tuple[str, str, str, str]:
+    """正規化後的訂單內容 (品項, 主要人物, 對象, 願望)，與訂單識別碼使用相同的正規化"""
+    return formatter.order_signature(order)
+
+
+def order_fingerprint(signature: Tuple[str, ...]) -> bytes:
+    """訂單指紋（16 位元組雜湊）"""
+    return hashlib.blake2b('\x1f'.join(signature).encode('utf-8'), digest_size=16).digest()
+
+
+class ModifiedOrder(NamedTuple):
+    """同一客人內容有變動的訂單"""
+    old: Dict
+    new: Dict
+    fields: List[str]   # 不同的欄位，例如 ['品項', '願望']
+
+
+class ItemChange(NamedTuple):
+    """單一品項的數量與金額變化"""
+    item: str
+    old_quantity: int
+    new_quantity: int
+    quantity_diff: int
+    amount_diff: int
+
+
+class BatchDiff:
+    """兩個批次的比對結果"""
+
+    def __init__(self, unchanged: int, added: List[Dict], removed: List[Dict],
+                 modified: List[ModifiedOrder], item_changes: List[ItemChange],
+                 old_amount: int, new_amount: int):
+        self.unchanged = unchanged
+        self.added = added
+        self.removed = removed
+        self.modified = modified
+        self.item_changes = item_changes
+        self.old_amount = old_amount
+        self.new_amount = new_amount
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.removed or self.modified)
+
+    def summary(self) -> str:
+        """一行文字摘要，例如：未變動 80 筆 • 新增 2 筆 • 刪除 1 筆 • 修改 3 筆 • 金額 +$560"""
+        amount_diff = self.new_amount - self.old_amount
+        return (f"未變動 {self.unchanged} 筆 • 新增 {len(self.added)} 筆 • 刪除 {len(self.removed)} 筆 • "
+                f"修改 {len(self.modified)} 筆 • 金額 {'+' if amount_diff >= 0 else '-'}${abs(amount_diff):,}")
+
+    def to_dict(self) -> Dict:
+        """可 JSON 序列化的比對結果"""
+        def plain(order):
+            return {key: order[key] for key in ('index', 'raw_items', 'main_person', 'target_person', 'wish')}
+
+        return {
+            'summary': {
+                'unchanged': self.unchanged,
+                'added': len(self.added),
+                'removed': len(self.removed),
+                'modified': len(self.modified),
+                'old_amount': self.old_amount,
+                'new_amount': self.new_amount,
+                'amount_diff': self.new_amount - self.old_amount,
+            },
+            'added': [plain(order) for order in self.added],
+            'removed': [plain(order) for order in self.removed],
+            'modified': [{'old': plain(change.old), 'new': plain(change.new), 'fields': change.fields}
+                         for change in self.modified],
+            'item_changes': [change._asdict() for change in self.item_changes],
+        }
+
+    def render_markdown(self) -> str:
+        """Markdown 比對報告"""
+        def cell(text):
+            return str(text).replace('|', '\\|')
+
+        def signed(value, money=False):
+            sign = '+' if value > 0 else ('-' if value < 0 else '')
+            return f"{sign}${abs(value):,}" if money else f"{sign}{abs(value)}"
+
+        result = ["# 🔀 批次比對報告\n", f"**{self.summary()}**\n"]
+
+        if not self.has_changes:
+            result.append("**✅ 兩個批次的訂單完全相同！**")
+            return '\n'.join(result)
+
+        if self.item_changes:
+            result.append("\n## 📊 品項淨變化\n")
+            result.append("| 品項名稱 | 原數量 | 新數量 | 數量變化 | 金額變化 |")
+            result.append("|----------|--------|--------|----------|----------|")
+            for change in self.item_changes:
+                result.append(f"| {cell(change.item)} | {change.old_quantity} | {change.new_quantity} | "
+                              f"{signed(change.quantity_diff)} | {signed(change.amount_diff, money=True)} |")
+            result.append(f"\n**總金額：${self.old_amount:,} → ${self.new_amount:,}"
+                          f"（{signed(self.new_amount - self.old_amount, money=True)}）**")
+
+        if self.modified:
+            result.append(f"\n## ✏️ 修改的訂單（{len(self.modified)} 筆）\n")
+            result.append("| 原編號 | 新編號 | 主要人物 | 變動欄位 | 原品項 | 新品項 |")
+            result.append("|--------|--------|----------|----------|--------|--------|")
+            for change in self.modified:
+                result.append(f"| {change.old['index']} | {change.new['index']} | {cell(change.new['main_person'])} | "
+                              f"{'、'.join(change.fields)} | {cell(change.old['raw_items'])} | "
+                              f"{cell(change.new['raw_items'])} |")
+
+        for title, orders in (("➕ 新增的訂單", self.added), ("➖ 刪除的訂單", self.removed)):
+            if not orders:
+                continue
+            result.append(f"\n## {title}（{len(orders)} 筆）\n")
+            result.append("| 編號 | 品項 | 主要人物 | 對象 | 願望 |")
+            result.append("|------|------|----------|------|------|")
+            for order in orders:
+                result.append(f"| {order['index']} | {cell(order['raw_items'])} | {cell(order['main_person'])} | "
+                              f"{cell(order['target_person'])} | {cell(order['wish'])} |")
+
+        return '\n'.join(result)
+
+
+def diff_batches(old: OrderFormatter, new: OrderFormatter) -> BatchDiff:
+    """比對兩個批次（old 為先前的版本）"""
+    old_signed = [(order, order_signature(old, order)) for order in old.orders]
+    new_signed = [(order, order_signature(new, order)) for order in new.orders]
+
+    # 第一輪：指紋相同的訂單逐筆配對
+    new_by_print = defaultdict(deque)
+    for position, (_, signature) in enumerate(new_signed):
+        new_by_print[order_fingerprint(signature)].append(position)
+
+    unchanged = 0
+    matched_new = set()
+    old_left = []
+    for order, signature in old_signed:
+        positions = new_by_print.get(order_fingerprint(signature))
+        if positions:
+            matched_new.add(positions.popleft())
+            unchanged += 1
+        else:
+            old_left.append((order, signature))
+
+    # 第二輪：剩下的訂單以主要人物配對，配到的視為修改
+    old_by_person = defaultdict(deque)
+    for entry in old_left:
+        old_by_person[entry[1][1]].append(entry)
+
+    added = []
+    modified = []
+    for position, (order, signature) in enumerate(new_signed):
+        if position in matched_new:
+            continue
+        candidates = old_by_person.get(signature[1])
+        if candidates:
+            old_order, old_signature = candidates.popleft()
+            fields = [name for name, before, after in zip(SIGNATURE_FIELDS, old_signature, signature)
+                      if before != after]
+            modified.append(ModifiedOrder(old_order, order, fields))
+        else:
+            added.append(order)
+
+    removed = [order for candidates in old_by_person.values() for order, _ in candidates]
+    removed.sort(key=lambda order: order['index'])
+
+    # 品項淨變化直接由兩邊的統計相減
+    item_changes = []
+    for item in sorted(set(old.item_stats) | set(new.item_stats)):
+        old_quantity, new_quantity = old.item_stats.get(item, 0), new.item_stats.get(item, 0)
+        amount_diff = new.item_amounts.get(item, 0) - old.item_amounts.get(item, 0)
+        if old_quantity != new_quantity or amount_diff:
+            item_changes.append(ItemChange(item, old_quantity, new_quantity, new_quantity - old_quantity, amount_diff))
+
+    return BatchDiff(unchanged, added, removed, modified, item_changes,
+                     sum(old.item_amounts.values()), sum(new.item_amounts.values()))
+
+
+def load_batch(source, filename: Optional[str] = None) -> OrderFormatter:
+    """
+    載入要比對的批次
+    - source：檔案路徑，或檔案內容（bytes，需同時給 filename 判斷格式）
+    - .json 為 process -f json 的輸出；.csv／.xlsx 依表頭猜測欄位；其他視為訂單文字
+    """
+    if isinstance(source, str):
+        filename = filename or source
+        with open(source, 'rb') as f:
+            return load_batch(f.read(), filename)
+
+    extension = os.path.splitext(filename or '')[1].lower()
+    formatter = OrderFormatter()
+
+    if extension == '.json':
+        data = json.loads(source.decode('utf-8-sig'))
+        rows = ([order['raw_items'], order['main_person'], order['target_person'], order['wish']]
+                for order in data['orders'])
+        formatter.load_rows(rows, batch=data.get('summary', {}).get('batch'))
+    elif extension in ('.csv', '.xlsx'):
+        load_table(formatter, io.BytesIO(source), filename)
+    else:
+        formatter.load_data(normalize_order_text(source.decode('utf-8-sig')))
+    return formatter
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+統計效能測試：比較 defaultdict 逐筆累加、純 Python 欄式統計、NumPy 向量化統計
+使用方式：python benchmark.py [展開後總支數，預設 1000000]
+"""
+
+import random
+import sys
+import time
+from collections import defaultdict
+
+from order_formatter import ItemColumns, OrderFormatter, np
+
+
+def build_columns(total_units: int, use_numpy: bool) -> ItemColumns:
+    """產生指定總支數的模擬批次（每筆品項 1~7 支，每筆訂單 1~3 個品項）"""
+    rng = random.Random(20261019)
+    item_names = list(OrderFormatter.PRICE_LIST.keys())
+    columns = ItemColumns(use_numpy=use_numpy)
+
+    units = 0
+    order_id = 1
+    while units < total_units:
+        for _ in range(rng.randint(1, 3)):
+            quantity = min(rng.randint(1, 7), total_units - units)
+            columns.append(rng.choice(item_names), quantity, order_id)
+            units += quantity
+            if units >= total_units:
+                break
+        order_id += 1
+    return columns
+
+
+def timed(label: str, func, repeat: int = 3) -> float:
+    """執行多次取最佳時間（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<28}{best * 1000:>10.1f} ms")
+    return best
+
+
+def main():
+    total_units = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    prices = OrderFormatter.PRICE_LIST
+    reference = {name: 100 for name in prices}
+
+    python_columns = build_columns(total_units, use_numpy=False)
+    print(f"模擬批次：{total_units} 支，{len(python_columns)} 筆品項")
+
+    def dict_baseline():
+        # 舊做法：每筆品項逐一累加 defaultdict
+        item_stats = defaultdict(int)
+        item_amounts = defaultdict(int)
+        for code, quantity in zip(python_columns.codes, python_columns.quantities):
+            item_name = python_columns.names[code]
+            item_stats[item_name] += quantity
+            item_amounts[item_name] += prices.get(item_name, 0) * quantity
+        return item_stats, item_amounts
+
+    print("\n品項統計（item_stats / item_amounts）")
+    baseline = timed("defaultdict 逐筆累加", dict_baseline)
+    timed("純 Python 欄式", lambda: python_columns.item_totals(prices))
+
+    print("\n各訂單總計")
+    timed("純 Python 欄式", lambda: python_columns.order_totals(prices))
+
+    print("\n參考數據比對")
+    totals, _ = python_columns.item_totals(prices)
+    timed("純 Python 欄式", lambda: python_columns.reference_diff(totals, reference))
+
+    if np is None:
+        print("\n⚠️ 未安裝 NumPy，略過向量化測試（pip install numpy）")
+        return
+
+    numpy_columns = build_columns(total_units, use_numpy=True)
+    print("\nNumPy 向量化")
+    vectorized = timed("品項統計 np.bincount", lambda: numpy_columns.item_totals(prices))
+    timed("各訂單總計", lambda: numpy_columns.order_totals(prices))
+    totals, _ = numpy_columns.item_totals(prices)
+    timed("參考數據比對", lambda: numpy_columns.reference_diff(totals, reference))
+
+    print(f"\n品項統計加速：{baseline / vectorized:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
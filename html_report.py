@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 離線 HTML 報表
+整份報表寫成單一網頁：摘要、品項統計、差異比對、異常訂單以表格呈現，
+明細只以精簡的 JSON 陣列嵌入一次，由頁面內的虛擬捲動表格顯示（可排序、篩選）
+
+- 不引用任何外部 CSS／JS，離線也能開啟
+- 明細的字串（品項、人物、願望）只存一份，每一列只存編號與字串代碼
+- 邊寫邊輸出，二十萬列也不需要先組成整份網頁字串
+"""
+
+import html
+import io
+import json
+from typing import Dict, List, Optional
+
+from order_formatter import DIAGNOSTIC_LABELS, OrderFormatter
+
+# 每次寫出的明細列數
+CHUNK_ROWS = 5000
+
+# 明細欄位（對應 expanded_orders 的鍵）
+DETAIL_COLUMNS = (
+    ('index', '編號'),
+    ('item', '品項'),
+    ('main_person', '主要人物'),
+    ('target_person', '對象'),
+    ('wish', '願望'),
+)
+
+_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+  body {{ margin: 0 auto; max-width: 1200px; padding: 16px 24px 48px;
+         font-family: "Noto Sans TC", "PingFang TC", "Microsoft JhengHei", sans-serif; color: #222; }}
+  h1 {{ font-size: 22px; }}
+  h2 {{ font-size: 18px; margin-top: 32px; border-bottom: 1px solid #ddd; padding-bottom: 4px; }}
+  table {{ border-collapse: collapse; font-size: 14px; }}
+  th, td {{ border: 1px solid #ddd; padding: 4px 10px; text-align: left; }}
+  th {{ background: #f5f5f5; }}
+  td.num {{ text-align: right; }}
+  tr.total td {{ font-weight: bold; }}
+  .ok {{ color: #2e7d32; }}
+  .bad {{ color: #c62828; }}
+  ul.summary {{ padding-left: 20px; line-height: 1.8; }}
+  .toolbar {{ display: flex; gap: 8px; align-items: center; margin: 8px 0; font-size: 14px; }}
+  .toolbar input {{ flex: 1; padding: 4px 8px; font-size: 14px; }}
+  .grid {{ border: 1px solid #ddd; font-size: 14px; }}
+  .grid .tr {{ display: grid; grid-template-columns: 80px 160px 1fr 1fr 2fr; height: 28px; line-height: 28px; }}
+  .grid .tr > div {{ padding: 0 8px; overflow: hidden; white-space: nowrap; text-overflow: ellipsis;
+                     border-right: 1px solid #eee; }}
+  .grid .head {{ background: #f5f5f5; font-weight: bold; cursor: pointer; user-select: none; }}
+  .grid .viewport {{ height: 560px; overflow-y: auto; position: relative; }}
+  .grid .rows {{ position: absolute; left: 0; right: 0; top: 0; }}
+  .grid .rows .tr {{ border-top: 1px solid #f0f0f0; }}
+  .grid .rows .odd {{ background: #fafafa; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+_DETAILS_HEAD = """<h2>📋 訂單明細</h2>
+<div class="toolbar">
+  <input id="filter" type="search" placeholder="篩選（品項、姓名、生日、願望關鍵字）">
+  <select id="filter-column">
+    <option value="-1">全部欄位</option>
+{column_options}
+  </select>
+  <span id="count"></span>
+</div>
+<div class="grid">
+  <div class="tr head" id="grid-head">{column_heads}</div>
+  <div class="viewport" id="viewport"><div id="spacer"></div><div class="rows" id="rows"></div></div>
+</div>
+"""
+
+_SCRIPT = """<script>
+(function () {
+  var WIDTH = %(width)d, ROW_HEIGHT = 28;
+  var flat = JSON.parse(document.getElementById('detail-rows').textContent);
+  var strings = JSON.parse(document.getElementById('detail-strings').textContent);
+  var total = flat.length / WIDTH;
+  var lower = null, escaped = new Array(strings.length), rank = null;
+  var order = new Uint32Array(total), view = order, sortColumn = -1, sortDirection = 1;
+  for (var i = 0; i < total; i++) order[i] = i;
+
+  var viewport = document.getElementById('viewport');
+  var spacer = document.getElementById('spacer');
+  var rowsBox = document.getElementById('rows');
+  var counter = document.getElementById('count');
+  var filterInput = document.getElementById('filter');
+  var filterColumn = document.getElementById('filter-column');
+  var heads = document.getElementById('grid-head').children;
+  var labels = [];
+  for (var h = 0; h < heads.length; h++) labels.push(heads[h].textContent);
+
+  function text(code) {
+    var value = escaped[code];
+    if (value === undefined) {
+      value = escaped[code] = strings[code].replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    }
+    return value;
+  }
+
+  // 只畫出捲動位置看得到的列
+  function render() {
+    var first = Math.floor(viewport.scrollTop / ROW_HEIGHT);
+    var last = Math.min(view.length, first + Math.ceil(viewport.clientHeight / ROW_HEIGHT) + 2);
+    var out = [];
+    for (var r = first; r < last; r++) {
+      var p = view[r] * WIDTH;
+      out.push('<div class="tr' + (r & 1 ? ' odd' : '') + '" style="position:absolute;left:0;right:0;top:'
+        + (r * ROW_HEIGHT) + 'px">'
+        + '<div>' + flat[p] + '</div>');
+      for (var c = 1; c < WIDTH; c++) out.push('<div>' + text(flat[p + c]) + '</div>');
+      out.push('</div>');
+    }
+    rowsBox.innerHTML = out.join('');
+  }
+
+  function refresh() {
+    spacer.style.height = (view.length * ROW_HEIGHT) + 'px';
+    counter.textContent = view.length === total ? '共 ' + total + ' 筆' : view.length + ' / ' + total + ' 筆';
+    render();
+  }
+
+  // 篩選：先比對字串表（每個字串只比一次），再用代碼挑出符合的列
+  function applyFilter() {
+    var query = filterInput.value.trim().toLowerCase();
+    var column = parseInt(filterColumn.value, 10);
+    if (!query) {
+      view = order;
+    } else {
+      if (!lower) lower = strings.map(function (s) { return s.toLowerCase(); });
+      var hit = new Uint8Array(strings.length);
+      for (var s = 0; s < strings.length; s++) hit[s] = lower[s].indexOf(query) >= 0 ? 1 : 0;
+      var from = column < 0 ? 0 : column, to = column < 0 ? WIDTH : column + 1;
+      var matched = new Uint32Array(order.length), count = 0;
+      for (var k = 0; k < order.length; k++) {
+        var p = order[k] * WIDTH;
+        for (var c = from; c < to; c++) {
+          if (c === 0 ? String(flat[p]).indexOf(query) >= 0 : hit[flat[p + c]]) {
+            matched[count++] = order[k];
+            break;
+          }
+        }
+      }
+      view = matched.subarray(0, count);
+    }
+    viewport.scrollTop = 0;
+    refresh();
+  }
+
+  // 排序：字串先依字典序排一次得到名次，列之間只比較整數名次
+  function sortBy(column) {
+    sortDirection = column === sortColumn ? -sortDirection : 1;
+    sortColumn = column;
+    if (column > 0 && !rank) {
+      var collator = new Intl.Collator('zh-Hant', { numeric: true });
+      var codes = strings.map(function (_, code) { return code; });
+      codes.sort(function (a, b) { return collator.compare(strings[a], strings[b]); });
+      rank = new Uint32Array(strings.length);
+      for (var k = 0; k < codes.length; k++) rank[codes[k]] = k;
+    }
+    var direction = sortDirection;
+    order = order.slice().sort(function (a, b) {
+      var x = column === 0 ? flat[a * WIDTH] : rank[flat[a * WIDTH + column]];
+      var y = column === 0 ? flat[b * WIDTH] : rank[flat[b * WIDTH + column]];
+      return x === y ? a - b : (x < y ? -direction : direction);
+    });
+    for (var h = 0; h < heads.length; h++) {
+      heads[h].textContent = labels[h] + (h === column ? (direction > 0 ? ' ▲' : ' ▼') : '');
+    }
+    applyFilter();
+  }
+
+  var timer = null;
+  filterInput.addEventListener('input', function () {
+    clearTimeout(timer);
+    timer = setTimeout(applyFilter, 150);
+  });
+  filterColumn.addEventListener('change', applyFilter);
+  for (var c = 0; c < heads.length; c++) {
+    heads[c].addEventListener('click', sortBy.bind(null, c));
+  }
+  viewport.addEventListener('scroll', function () { window.requestAnimationFrame(render); });
+  refresh();
+})();
+</script>
+"""
+
+_PAGE_TAIL = """</body>
+</html>
+"""
+
+
+def _json_script(element_id: str, payload: str) -> str:
+    """把 JSON 放進 <script type="application/json">（跳脫 <，避免提早結束標籤）"""
+    payload = payload.replace('<', '\\u003c')
+    return f'<script type="application/json" id="{element_id}">{payload}</script>\n'
+
+
+class Markup(str):
+    """已是 HTML 的儲存格內容（不再跳脫）"""
+
+
+def _table(headers: List[str], rows: List[list], numeric: set = frozenset(), row_class: Dict[int, str] = None) -> str:
+    """小型靜態表格（統計、比對、異常訂單），欄位內容做 HTML 跳脫"""
+    escape = html.escape
+    out = ['<table><thead><tr>']
+    out.extend(f'<th>{escape(header)}</th>' for header in headers)
+    out.append('</tr></thead><tbody>')
+    for position, row in enumerate(rows):
+        css = (row_class or {}).get(position)
+        out.append(f'<tr class="{css}">' if css else '<tr>')
+        for column, value in enumerate(row):
+            cell = value if isinstance(value, Markup) else escape(str(value))
+            out.append(f'<td class="num">{cell}</td>' if column in numeric else f'<td>{cell}</td>')
+        out.append('</tr>')
+    out.append('</tbody></table>\n')
+    return ''.join(out)
+
+
+def _summary_section(formatter: OrderFormatter) -> str:
+    items = [
+        ('批次', formatter.batch),
+        ('總訂單數', f"{len(formatter.orders)} 筆"),
+        ('總品項數（展開後）', f"{len(formatter.expanded_orders)} 支"),
+        ('品項種類數', f"{len(formatter.item_stats)} 種"),
+        ('總金額', f"${sum(formatter.item_amounts.values())}"),
+        ('異常訂單數', f"{len(formatter.anomalies)} 筆"),
+    ]
+    lines = ''.join(f'<li><b>{html.escape(label)}</b>：{html.escape(value)}</li>' for label, value in items)
+    return f'<h2>📈 報表摘要</h2>\n<ul class="summary">{lines}</ul>\n'
+
+
+def _statistics_section(formatter: OrderFormatter) -> str:
+    rows = []
+    total_quantity = total_amount = 0
+    for name, quantity in sorted(formatter.item_stats.items()):
+        amount = formatter.item_amounts.get(name, 0)
+        rows.append([name, quantity, f"${formatter.PRICE_LIST.get(name, 0)}", f"${amount}"])
+        total_quantity += quantity
+        total_amount += amount
+    rows.append(['總計', total_quantity, '-', f"${total_amount}"])
+    table = _table(['品項名稱', '數量', '單價', '小計金額'], rows, numeric={1, 2, 3},
+                   row_class={len(rows) - 1: 'total'})
+    return '<h2>📊 品項統計總表</h2>\n' + table
+
+
+def _comparison_section(formatter: OrderFormatter, reference_data: str) -> str:
+    rows = []
+    mismatched = 0
+    for name, system_qty, ref_qty, diff in formatter.reference_differences(reference_data):
+        if diff:
+            mismatched += 1
+        status = Markup('<span class="ok">✅ 相符</span>' if diff == 0 else '<span class="bad">⚠️ 不符</span>')
+        rows.append([name, system_qty, ref_qty, f"+{diff}" if diff > 0 else str(diff), status])
+    note = ('<p class="ok"><b>✅ 所有品項數量完全相符！</b></p>' if not mismatched
+            else f'<p class="bad"><b>⚠️ 發現 {mismatched} 個品項數量不符，請檢查！</b></p>')
+    table = _table(['品項名稱', '系統統計', '參考數據', '差異', '狀態'], rows, numeric={1, 2, 3})
+    return '<h2>🔍 數量差異比對表</h2>\n' + table + note + '\n'
+
+
+def _anomaly_section(formatter: OrderFormatter) -> str:
+    if not formatter.anomalies:
+        return '<h2>✅ 異常訂單檢測</h2>\n<p class="ok"><b>未發現異常訂單！</b></p>\n'
+    rows = [
+        [a['original_index'], a['items'], a['main_person'], a['target_person'],
+         f"重複品項：{'、'.join(a['duplicates'])}",
+         '、'.join(f"{name}×{qty}" for name, qty in a['item_totals'].items())]
+        for a in formatter.anomalies
+    ]
+    table = _table(['編號', '品項', '主要人物', '對象', '問題說明', '各品項數量'], rows, numeric={0})
+    return f'<h2>⚠️ 異常訂單明細</h2>\n<p>共發現 {len(rows)} 筆異常訂單</p>\n' + table
+
+
+def _diagnostics_section(formatter: OrderFormatter) -> str:
+    rows = [[d.span, DIAGNOSTIC_LABELS.get(d.kind, d.kind), d.message] for d in formatter.diagnostics]
+    skipped = sum(1 for d in formatter.diagnostics if d.skipped)
+    table = _table(['行號', '類型', '說明'], rows, numeric={0})
+    return f'<h2>🩺 解析診斷</h2>\n<p>共 {len(rows)} 則，其中 {skipped} 則的內容未列入統計</p>\n' + table
+
+
+def write_detail_data(rows: List[Dict], target) -> int:
+    """
+    把明細寫成兩段 JSON：每列 [編號, 品項代碼, 主要人物代碼, 對象代碼, 願望代碼] 攤平成一個整數陣列，
+    以及代碼 -> 字串的字串表；回傳列數
+    """
+    codes = {}
+    strings = []
+    keys = [key for key, _ in DETAIL_COLUMNS[1:]]
+
+    def code(value: str) -> int:
+        found = codes.get(value)
+        if found is None:
+            found = codes[value] = len(strings)
+            strings.append(value)
+        return found
+
+    target.write('<script type="application/json" id="detail-rows">[')
+    count = 0
+    chunk = []
+    separator = ''
+    for row in rows:
+        chunk.append(row['index'])
+        chunk.extend(code(row[key]) for key in keys)
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            target.write(separator + ','.join(map(str, chunk)))
+            separator = ','
+            chunk = []
+    if chunk:
+        target.write(separator + ','.join(map(str, chunk)))
+    target.write(']</script>\n')
+
+    target.write(_json_script('detail-strings', json.dumps(strings, ensure_ascii=False, separators=(',', ':'))))
+    return count
+
+
+def write_html_report(formatter: OrderFormatter, target, reference_data: Optional[str] = None,
+                      title: Optional[str] = None) -> int:
+    """
+    把完整報表逐段寫到 target（檔案路徑或文字串流），回傳明細列數
+    """
+    title = title or f"訂單報表 {formatter.batch}"
+    if isinstance(target, str):
+        with open(target, 'w', encoding='utf-8') as f:
+            return write_html_report(formatter, f, reference_data, title)
+
+    target.write(_PAGE_HEAD.format(title=html.escape(title)))
+    target.write(_summary_section(formatter))
+    target.write(_statistics_section(formatter))
+    if reference_data:
+        target.write(_comparison_section(formatter, reference_data))
+    target.write(_anomaly_section(formatter))
+    if formatter.diagnostics:
+        target.write(_diagnostics_section(formatter))
+
+    target.write(_DETAILS_HEAD.format(
+        column_options='\n'.join(f'    <option value="{position}">{label}</option>'
+                                 for position, (_, label) in enumerate(DETAIL_COLUMNS)),
+        column_heads=''.join(f'<div>{label}</div>' for _, label in DETAIL_COLUMNS),
+    ))
+    count = write_detail_data(formatter.expanded_orders, target)
+    target.write(_SCRIPT % {'width': len(DETAIL_COLUMNS)})
+    target.write(_PAGE_TAIL)
+    return count
+
+
+def render_html_report(formatter: OrderFormatter, reference_data: Optional[str] = None,
+                       title: Optional[str] = None) -> bytes:
+    """產生完整 HTML 報表（UTF-8 位元組，給網頁版下載）；邊寫邊編碼，不另外保留整份字串"""
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    try:
+        write_html_report(formatter, text, reference_data, title)
+        text.flush()
+        return buffer.getvalue()
+    finally:
+        # 不要連同 buffer 一起關閉
+        text.detach()
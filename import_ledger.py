@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 匯入紀錄（重複匯入檢查）
+每筆訂單在解析時依內容得到固定的識別碼（見 OrderFormatter._assign_id），匯入紀錄把已匯入過的識別碼存在本機 SQLite 檔
+- 重新貼上有重疊的匯出時，逐筆以主鍵查詢識別碼，已匯入過的訂單略過（或保留並標示）
+- 檢查時先把這批新的識別碼「暫存」，同一次處理的後續檔案也會看到；報表輸出成功後才 commit 寫入
+- 只用標準函式庫的 sqlite3，多個行程同時寫入時由 SQLite 的鎖排隊
+
+用法：
+    with ImportLedger('匯入紀錄.sqlite3') as ledger:
+        screen = ledger.screen(formatter, skip=True)
+        ...輸出報表...
+        ledger.commit()
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from order_formatter import OrderFormatter
+
+DEFAULT_LEDGER_PATH = os.path.join(os.path.expanduser('~'), '.order_formatter', 'imported.sqlite3')
+
+# 重複訂單的處理方式
+DUPLICATE_MODES = {
+    'skip': '略過已匯入的訂單',
+    'flag': '保留並標示已匯入',
+}
+
+# 單次 IN (...) 查詢的識別碼數量（低於 SQLite 預設的參數上限）
+_LOOKUP_CHUNK = 500
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS imported (
+    id TEXT PRIMARY KEY,
+    batch TEXT NOT NULL,
+    imported_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    main_person TEXT NOT NULL,
+    items TEXT NOT NULL
+) WITHOUT ROWID
+'''
+
+
+class ImportScreen:
+    """一批訂單的重複匯入檢查結果"""
+
+    def __init__(self, skip: bool, duplicates: List[Dict], new: int):
+        self.skip = skip
+        self.duplicates = duplicates
+        self.new = new
+
+    def summary(self) -> str:
+        """一行文字摘要，例如：新訂單 51 筆 • 已匯入過 40 筆（已略過）"""
+        if not self.duplicates:
+            return f"新訂單 {self.new} 筆，沒有重複匯入"
+        action = '已略過' if self.skip else '已標示'
+        return f"新訂單 {self.new} 筆 • 已匯入過 {len(self.duplicates)} 筆（{action}）"
+
+
+class ImportLedger:
+    """已匯入訂單識別碼的紀錄檔"""
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._pending = {}  # 識別碼 -> 尚未寫入的資料列
+
+    def __enter__(self) -> 'ImportLedger':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def count(self) -> int:
+        """紀錄檔中的訂單數"""
+        return self._db.execute('SELECT COUNT(*) FROM imported').fetchone()[0]
+
+    def version(self) -> str:
+        """紀錄內容的版本（筆數與最後匯入時間），紀錄有變動時跟著改變，可用來讓快取失效"""
+        count, latest = self._db.execute('SELECT COUNT(*), MAX(imported_at) FROM imported').fetchone()
+        return f"{count}:{latest or ''}"
+
+    def lookup(self, order_ids: Iterable[str]) -> Dict[str, str]:
+        """查詢哪些識別碼已匯入過，回傳 {識別碼: 先前匯入的說明}（包含本次暫存的）"""
+        seen = {}
+        missing = []
+        for order_id in order_ids:
+            row = self._pending.get(order_id)
+            if row is not None:
+                seen[order_id] = self._describe(row[1], row[2], row[3])
+            else:
+                missing.append(order_id)
+
+        for start in range(0, len(missing), _LOOKUP_CHUNK):
+            chunk = missing[start:start + _LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for order_id, batch, imported_at, source in self._db.execute(
+                    f'SELECT id, batch, imported_at, source FROM imported WHERE id IN ({placeholders})', chunk):
+                seen[order_id] = self._describe(batch, imported_at, source)
+        return seen
+
+    @staticmethod
+    def _describe(batch: str, imported_at: str, source: str) -> str:
+        where = f"，來源 {source}" if source else ''
+        return f"批次 {batch}，{imported_at} 匯入{where}"
+
+    def screen(self, formatter: OrderFormatter, skip: bool = True, source: str = '') -> ImportScreen:
+        """
+        檢查 formatter 中已匯入過的訂單：skip 為 True 時移除，否則保留並加上診斷訊息
+        剩下的新訂單先暫存（之後的 screen 也會視為已匯入），呼叫 commit() 才寫入紀錄檔
+        """
+        seen = self.lookup(order['id'] for order in formatter.orders)
+        duplicates = formatter.mark_imported(seen, skip) if seen else []
+        new = self.stage(formatter, source, seen)
+        return ImportScreen(skip, duplicates, new)
+
+    def stage(self, formatter: OrderFormatter, source: str = '', known: Dict[str, str] = None) -> int:
+        """把 formatter 中尚未匯入過的訂單暫存起來，回傳筆數（known 為已查過的 lookup 結果）"""
+        imported_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+        staged = 0
+        if known is None:
+            known = self.lookup(order['id'] for order in formatter.orders)
+        for order in formatter.orders:
+            if order['id'] in known:
+                continue
+            self._pending[order['id']] = (order['id'], order['batch'], imported_at, source,
+                                          order['main_info'].key, order['raw_items'])
+            staged += 1
+        return staged
+
+    def commit(self) -> int:
+        """把暫存的識別碼寫入紀錄檔，回傳寫入筆數"""
+        if not self._pending:
+            return 0
+        with self._db:
+            self._db.executemany('INSERT OR IGNORE INTO imported VALUES (?, ?, ?, ?, ?, ?)',
+                                 self._pending.values())
+        count = len(self._pending)
+        self._pending = {}
+        return count
+
+    def rollback(self):
+        """放棄尚未寫入的暫存（例如報表輸出失敗）"""
+        self._pending = {}
+
+    def record(self, formatter: OrderFormatter, source: str = '') -> int:
+        """把 formatter 中的訂單直接記為已匯入（暫存後立即寫入），回傳新增筆數"""
+        self.stage(formatter, source)
+        return self.commit()
+
+    def forget_batch(self, batch: str) -> int:
+        """刪除某個批次標籤的所有紀錄（重新匯入整批時使用），回傳刪除筆數"""
+        with self._db:
+            return self._db.execute('DELETE FROM imported WHERE batch = ?', (batch,)).rowcount
+
+    def batches(self) -> List[tuple]:
+        """各批次的筆數與最後匯入時間 [(批次, 筆數, 最後匯入時間)]，新的在前"""
+        return self._db.execute('SELECT batch, COUNT(*), MAX(imported_at) FROM imported '
+                                'GROUP BY batch ORDER BY MAX(imported_at) DESC').fetchall()
+
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 品項工作單
+工作室依品項分站製作（例如所有三鬼頭在同一站），每個品項輸出一份工作單，
+列出該品項每一支的編號、主要人物、對象與願望，另附一份索引
+
+支援格式：tsv（Tab 分隔文字）、xlsx（Excel，需要 openpyxl）、html（可直接列印）
+品項多、明細多時以多個行程平行產生各品項的工作單
+"""
+
+import html
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from order_formatter import OrderFormatter, write_xlsx
+
+# 格式代碼 -> (說明, 副檔名)
+SHEET_FORMATS = {
+    'tsv': ('Tab 分隔文字', 'txt'),
+    'xlsx': ('Excel 活頁簿', 'xlsx'),
+    'html': ('列印用網頁', 'html'),
+}
+
+SHEET_HEADERS = ['編號', '訂單', '主要人物', '對象', '願望']
+
+# 明細少於此數量時直接在目前行程產生（啟動行程池的成本比產生工作單還高）
+PARALLEL_MIN_UNITS = 20000
+
+_UNSAFE_FILENAME_PATTERN = re.compile(r'[\\/:*?"<>|\s]+')
+
+_HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  body {{ font-family: "Noto Sans TC", "PingFang TC", "Microsoft JhengHei", sans-serif; margin: 1.5cm; }}
+  h1 {{ font-size: 20pt; margin: 0 0 4pt; }}
+  p.meta {{ color: #555; margin: 0 0 12pt; }}
+  table {{ border-collapse: collapse; width: 100%; font-size: 11pt; }}
+  th, td {{ border: 1px solid #999; padding: 4pt 6pt; text-align: left; vertical-align: top; }}
+  th {{ background: #eee; }}
+  td.check {{ width: 1.2cm; }}
+  thead {{ display: table-header-group; }}
+  tr {{ page-break-inside: avoid; }}
+  @page {{ size: A4; margin: 1.2cm; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p class="meta">{meta}</p>
+<table>
+<thead><tr>{headers}</tr></thead>
+<tbody>
+{rows}
+</tbody>
+</table>
+</body>
+</html>
+"""
+
+
+def safe_filename(name: str) -> str:
+    """把品項名稱轉成可用的檔名"""
+    return _UNSAFE_FILENAME_PATTERN.sub('_', name).strip('._') or '未命名'
+
+
+def group_by_item(expanded_orders: List[Dict]) -> Dict[str, List[Tuple]]:
+    """一次掃描展開明細，依品項分組 {品項: [(編號, 訂單, 主要人物, 對象, 願望), ...]}"""
+    groups = {}
+    for row in expanded_orders:
+        rows = groups.get(row['item'])
+        if rows is None:
+            rows = groups[row['item']] = []
+        rows.append((row['index'], row['order_index'], row['main_person'], row['target_person'], row['wish']))
+    return groups
+
+
+def render_sheet(item_name: str, rows: List[Tuple], fmt: str, generated: str = '') -> bytes:
+    """產生單一品項的工作單內容"""
+    if fmt == 'tsv':
+        lines = ['\t'.join(SHEET_HEADERS)]
+        lines.extend(f"{index}\t{order}\t{main}\t{target}\t{wish}" for index, order, main, target, wish in rows)
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    if fmt == 'xlsx':
+        buffer = io.BytesIO()
+        write_xlsx(buffer, [(item_name, SHEET_HEADERS, rows)])
+        return buffer.getvalue()
+
+    if fmt == 'html':
+        headers = ''.join(f'<th>{h}</th>' for h in SHEET_HEADERS + ['完成'])
+        body = '\n'.join(
+            '<tr>' + ''.join(f'<td>{html.escape(str(value))}</td>' for value in row) + '<td class="check"></td></tr>'
+            for row in rows
+        )
+        meta = f"共 {len(rows)} 支" + (f" • {generated}" if generated else "")
+        return _HTML_TEMPLATE.format(title=html.escape(f"🏷️ {item_name} 工作單"), meta=meta,
+                                     headers=headers, rows=body).encode('utf-8')
+
+    raise ValueError(f"不支援的工作單格式：{fmt}（可用：{', '.join(SHEET_FORMATS)}）")
+
+
+def _render_job(item_name: str, rows: List[Tuple], fmt: str, generated: str) -> Tuple[str, bytes]:
+    return item_name, render_sheet(item_name, rows, fmt, generated)
+
+
+def render_index(sheets: List[Tuple[str, str, int]], fmt: str, formatter: OrderFormatter, generated: str) -> bytes:
+    """產生索引：各品項的工作單檔名、支數與單價"""
+    if fmt == 'html':
+        rows = '\n'.join(
+            f'<tr><td><a href="{html.escape(filename)}">{html.escape(item_name)}</a></td>'
+            f'<td>{count}</td><td>${formatter.PRICE_LIST.get(item_name, 0)}</td></tr>'
+            for item_name, filename, count in sheets
+        )
+        total = sum(count for _, _, count in sheets)
+        return _HTML_TEMPLATE.format(
+            title="📑 品項工作單索引", meta=f"共 {len(sheets)} 種品項、{total} 支 • {generated}",
+            headers='<th>品項</th><th>支數</th><th>單價</th>', rows=rows
+        ).encode('utf-8')
+
+    lines = ['品項\t支數\t單價\t檔案']
+    lines.extend(f"{item_name}\t{count}\t${formatter.PRICE_LIST.get(item_name, 0)}\t{filename}"
+                 for item_name, filename, count in sheets)
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_item_sheets(formatter: OrderFormatter, fmt: str = 'tsv', workers: Optional[int] = None):
+    """
+    依品項名稱順序產生 (檔名, 內容)，最後一個為索引
+    workers：平行產生的行程數（預設 CPU 核心數；1 表示不開行程池）
+    """
+    if fmt not in SHEET_FORMATS:
+        raise ValueError(f"不支援的工作單格式：{fmt}（可用：{', '.join(SHEET_FORMATS)}）")
+
+    extension = SHEET_FORMATS[fmt][1]
+    generated = f"批次 {formatter.batch} • 產生時間 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    groups = group_by_item(formatter.expanded_orders)
+    items = sorted(groups)
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(items) > 1 and len(formatter.expanded_orders) >= PARALLEL_MIN_UNITS:
+        with ProcessPoolExecutor(max_workers=min(workers, len(items))) as executor:
+            rendered = executor.map(_render_job, items, [groups[i] for i in items],
+                                    [fmt] * len(items), [generated] * len(items))
+            sheets = list(rendered)
+    else:
+        sheets = [_render_job(item, groups[item], fmt, generated) for item in items]
+
+    index = []
+    used = {'索引'}  # 保留給索引檔
+    for item_name, content in sheets:
+        filename = safe_filename(item_name)
+        # 不同品項轉成相同檔名時加上序號
+        candidate, suffix = filename, 2
+        while candidate in used:
+            candidate, suffix = f"{filename}_{suffix}", suffix + 1
+        used.add(candidate)
+        filename = f"{candidate}.{extension}"
+        index.append((item_name, filename, len(groups[item_name])))
+        yield filename, content
+
+    index_name = '索引.html' if fmt == 'html' else '索引.txt'
+    yield index_name, render_index(index, fmt, formatter, generated)
+
+
+def write_item_sheets(formatter: OrderFormatter, output_dir: str, fmt: str = 'tsv',
+                      workers: Optional[int] = None) -> List[str]:
+    """每個品項輸出一份工作單到 output_dir，回傳寫入的檔案路徑（最後一個為索引）"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for filename, content in iter_item_sheets(formatter, fmt, workers):
+        path = os.path.join(output_dir, filename)
+        with open(path, 'wb') as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+def build_item_sheets_zip(formatter: OrderFormatter, fmt: str = 'tsv', workers: Optional[int] = None) -> bytes:
+    """把所有品項工作單與索引打包成 zip（給網頁版下載）"""
+    buffer = io.BytesIO()
+    # 工作單都是重複性高的文字，最快的壓縮等級就已經夠小
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for filename, content in iter_item_sheets(formatter, fmt, workers):
+            archive.writestr(filename, content)
+    return buffer.getvalue()
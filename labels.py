@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 標籤貼紙
+每一支展開明細印一張標籤（編號、品項、姓名生日、縮短的願望），排進標準標籤紙格線，
+逐頁串流輸出成可直接列印的網頁，五萬張標籤也不會把所有頁面放在記憶體
+
+標籤範本只編譯一次（與報表共用 RowTemplate），之後每一支只做一次字串格式化
+"""
+
+import html
+import io
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from order_formatter import OrderFormatter, RowTemplate, normalize_wish
+
+
+class LabelSheet(NamedTuple):
+    """標籤紙規格（單位 mm）"""
+    description: str
+    columns: int
+    rows: int
+    label_width: float
+    label_height: float
+    page_width: float = 210.0
+    page_height: float = 297.0
+
+    @property
+    def per_page(self) -> int:
+        return self.columns * self.rows
+
+
+# 常見 A4 標籤紙
+LABEL_SHEETS = {
+    'a4-2x7': LabelSheet('A4 2×7（99.1×38.1mm）', 2, 7, 99.1, 38.1),
+    'a4-3x8': LabelSheet('A4 3×8（70×37mm）', 3, 8, 70.0, 37.0),
+    'a4-4x10': LabelSheet('A4 4×10（52.5×29.7mm）', 4, 10, 52.5, 29.7),
+}
+
+DEFAULT_SHEET = 'a4-3x8'
+
+# 標籤上願望的最大字數（超過以「…」結尾）
+WISH_LIMIT = 24
+
+DEFAULT_TEMPLATE = (
+    '<div class="head"><b>#{index}</b> <b>{item}</b></div>'
+    '<div>{main}</div>'
+    '<div class="wish">{wish}</div>'
+)
+
+_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  @page {{ size: {page_width}mm {page_height}mm; margin: 0; }}
+  body {{ margin: 0; font-family: "Noto Sans TC", "PingFang TC", "Microsoft JhengHei", sans-serif; }}
+  .sheet {{ width: {page_width}mm; height: {page_height}mm; box-sizing: border-box;
+            padding: {margin_y}mm {margin_x}mm; display: grid;
+            grid-template-columns: repeat({columns}, {label_width}mm);
+            grid-auto-rows: {label_height}mm; page-break-after: always; overflow: hidden; }}
+  .label {{ box-sizing: border-box; padding: 2mm 3mm; overflow: hidden; font-size: 9pt; line-height: 1.3; }}
+  .label .head {{ font-size: 11pt; }}
+  .label .wish {{ color: #333; }}
+  @media screen {{ .sheet {{ outline: 1px dashed #ccc; margin-bottom: 8mm; }} .label {{ outline: 1px dotted #ddd; }} }}
+</style>
+</head>
+<body>
+"""
+
+_PAGE_TAIL = """</body>
+</html>
+"""
+
+
+def shorten_wish(wish: str, limit: int = WISH_LIMIT) -> str:
+    """去掉「願望：」前綴、合併空白（同 normalize_wish）並截短到 limit 個字"""
+    wish = normalize_wish(wish)
+    if limit and len(wish) > limit:
+        return wish[:limit - 1] + '…'
+    return wish
+
+
+class LabelTemplate:
+    """
+    編譯過的標籤範本（以 RowTemplate 編譯）
+    範本是一段 HTML，可用的欄位：{index} {order} {item} {price} {main} {target} {wish}
+    欄位內容會做 HTML 跳脫；範本本身的文字原樣輸出
+    """
+
+    FIELDS = ('index', 'order', 'item', 'price', 'main', 'target', 'wish')
+
+    def __init__(self, source: str = DEFAULT_TEMPLATE, wish_limit: int = WISH_LIMIT):
+        self._row = RowTemplate('<div class="label">' + source + '</div>', self.FIELDS, '標籤範本')
+        self.source = source
+        self.fields = self._row.fields
+        self.wish_limit = wish_limit
+
+    def render(self, rows: List[Dict]) -> Iterator[str]:
+        """依序產生每一支明細的標籤 HTML"""
+        render = self._row.render
+        escape = html.escape
+        limit = self.wish_limit
+        items = {}
+        values = {}
+        last_order = None
+
+        for row in rows:
+            # 同一筆訂單的明細連續排列，人物與願望每筆訂單只處理一次
+            if row['order_index'] != last_order:
+                last_order = row['order_index']
+                wish, target = row['wish'], row['target_person']
+                if not wish and target.startswith(('願望', '愿望')):
+                    wish, target = target, '—'
+                values['order'] = last_order
+                values['main'] = escape(row['main_person'])
+                values['target'] = escape(target)
+                values['wish'] = escape(shorten_wish(wish, limit))
+
+            item = row['item']
+            escaped = items.get(item)
+            if escaped is None:
+                escaped = items[item] = escape(item)
+            values['index'] = row['index']
+            values['item'] = escaped
+            values['price'] = row['price']
+            yield render(values)
+
+
+def iter_label_pages(rows: List[Dict], sheet: LabelSheet, template: LabelTemplate) -> Iterator[str]:
+    """每次產生一整頁標籤紙的 HTML，只保留目前這一頁"""
+    per_page = sheet.per_page
+    page = []
+    for label in template.render(rows):
+        page.append(label)
+        if len(page) == per_page:
+            yield '<div class="sheet">' + ''.join(page) + '</div>\n'
+            page = []
+    if page:
+        yield '<div class="sheet">' + ''.join(page) + '</div>\n'
+
+
+def write_labels(formatter: OrderFormatter, target, sheet: str = DEFAULT_SHEET,
+                 template: Optional[LabelTemplate] = None, title: str = '標籤',
+                 rows: Optional[List[Dict]] = None) -> int:
+    """
+    把所有展開明細的標籤逐頁寫到 target（檔案路徑或文字串流），回傳頁數
+    rows 可指定只印部分明細（例如排程中某一天），預設為全部展開明細
+    """
+    if sheet not in LABEL_SHEETS:
+        raise ValueError(f"不支援的標籤紙：{sheet}（可用：{', '.join(LABEL_SHEETS)}）")
+    spec = LABEL_SHEETS[sheet]
+    template = template or LabelTemplate()
+
+    if isinstance(target, str):
+        with open(target, 'w', encoding='utf-8') as f:
+            return write_labels(formatter, f, sheet, template, title, rows)
+
+    target.write(_PAGE_HEAD.format(
+        title=html.escape(title),
+        page_width=spec.page_width, page_height=spec.page_height,
+        margin_x=round((spec.page_width - spec.columns * spec.label_width) / 2, 2),
+        margin_y=round((spec.page_height - spec.rows * spec.label_height) / 2, 2),
+        columns=spec.columns, label_width=spec.label_width, label_height=spec.label_height,
+    ))
+    pages = 0
+    rows = formatter.expanded_orders if rows is None else rows
+    for page in iter_label_pages(rows, spec, template):
+        target.write(page)
+        pages += 1
+    target.write(_PAGE_TAIL)
+    return pages
+
+
+def render_labels(formatter: OrderFormatter, sheet: str = DEFAULT_SHEET,
+                  template: Optional[LabelTemplate] = None, title: str = '標籤',
+                  rows: Optional[List[Dict]] = None) -> bytes:
+    """產生完整標籤網頁（UTF-8 位元組，給網頁版下載）；逐頁編碼，不另外保留整份字串"""
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    try:
+        write_labels(formatter, text, sheet, template, title, rows)
+        text.flush()
+        return buffer.getvalue()
+    finally:
+        # 不要連同 buffer 一起關閉
+        text.detach()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 本機 HTTP 批次處理服務
+讓收單機器人、試算表腳本直接送出訂單文字，不必透過網頁版或桌面版操作
+
+啟動：python order_api.py --port 8765 --workers 4
+呼叫範例：
+    curl -X POST --data-binary @範例資料.txt "http://127.0.0.1:8765/report"
+    curl -X POST -F orders=@範例資料.txt -F reference=@範例參考數據.txt \
+         "http://127.0.0.1:8765/xlsx" -o 報表.xlsx
+    curl -X POST -H "Content-Type: application/json" \
+         -d '{"orders": "鬼王x2\t王小明 1990/5/20", "reference": "鬼王 2 支"}' \
+         "http://127.0.0.1:8765/statistics"
+
+端點（皆為 POST，回應內容依端點而定）：
+    /report      完整報表（Markdown）
+    /details     純明細（Tab 分隔）
+    /statistics  品項統計表（Tab 分隔）
+    /json        結構化資料（JSON）
+    /xlsx        Excel 活頁簿
+    /html        離線網頁報表
+GET /health 回傳服務狀態（執行中、排隊中的批次數）
+"""
+
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from order_formatter import OrderFormatter, normalize_order_text
+from version import APP_VERSION
+
+# 端點 -> OrderFormatter.export 的格式代碼
+ENDPOINT_FORMATS = {
+    '/report': 'md',
+    '/details': 'tsv',
+    '/statistics': 'stats',
+    '/json': 'json',
+    '/xlsx': 'xlsx',
+    '/html': 'html',
+}
+
+DEFAULT_MAX_BODY = 32 * 1024 * 1024  # 單一請求最大 32MB
+
+
+def process_batch(order_text: str, reference_data: Optional[str], fmt: str,
+                  batch: Optional[str] = None) -> Tuple[bytes, str]:
+    """
+    在工作行程中處理一個批次，回傳（內容, MIME）
+    多行格式會自動轉成 Tab 分隔格式再載入
+    """
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(order_text), batch=batch)
+    if not formatter.orders:
+        raise ValueError("無法解析訂單資料！請檢查資料格式。")
+
+    content = formatter.export(fmt, reference_data)
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return content, OrderFormatter.EXPORT_FORMATS[fmt][2]
+
+
+class ServiceBusy(Exception):
+    """排隊已滿，拒絕新的批次"""
+
+
+class BatchService:
+    """
+    有上限的批次處理池
+    - workers：同時處理的批次數（行程數）
+    - max_queue：除執行中以外，最多可排隊等待的批次數，超過即回應 503
+    - timeout：單一批次等待結果的秒數上限，超過即回應 504
+    """
+
+    def __init__(self, workers: int = None, max_queue: int = 32, timeout: float = 60.0):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, order_text: str, reference_data: Optional[str], fmt: str,
+               batch: Optional[str] = None) -> Tuple[bytes, str]:
+        """送出一個批次並等待結果（排隊已滿時丟出 ServiceBusy，逾時丟出 TimeoutError）"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceBusy()
+
+        with self._lock:
+            self.active += 1
+        try:
+            future = self.executor.submit(process_batch, order_text, reference_data, fmt, batch)
+        except Exception:
+            self._release()
+            with self._lock:
+                self.failed += 1
+            raise
+        # 名額在批次真正結束（或排隊中被取消）時才釋放：逾時的批次仍佔用工作行程，不能讓新的批次超收
+        future.add_done_callback(self._release)
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # 還在排隊時取消；已在執行的批次無法中斷，會執行到結束
+            with self._lock:
+                self.failed += 1
+            raise TimeoutError(f"批次處理超過 {self.timeout:g} 秒")
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _release(self, future=None):
+        """批次結束：釋放排隊名額"""
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def status(self) -> Dict:
+        """服務狀態"""
+        with self._lock:
+            return {
+                'version': APP_VERSION,
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'timeout': self.timeout,
+                'running': min(self.active, self.workers),
+                'queued': max(0, self.active - self.workers),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _decode(payload: bytes) -> str:
+    """上傳檔案可能帶 BOM，統一以 UTF-8 解碼"""
+    return payload.decode('utf-8-sig')
+
+
+def parse_request_body(content_type: str, body: bytes, query: Dict[str, list]) -> Dict[str, Optional[str]]:
+    """
+    解析請求內容，回傳 {'orders', 'reference', 'batch'}
+    支援 application/json、multipart/form-data（檔案或欄位）與純文字
+    純文字時，參考數據與批次標籤由網址參數 reference / batch 提供
+    """
+    fields = {
+        'orders': None,
+        'reference': query.get('reference', [None])[0],
+        'batch': query.get('batch', [None])[0],
+    }
+    content_type = content_type or 'text/plain'
+
+    if content_type.startswith('application/json'):
+        data = json.loads(_decode(body) or '{}')
+        if not isinstance(data, dict):
+            raise ValueError("JSON 內容必須是物件，例如 {\"orders\": \"...\"}")
+        for key in fields:
+            if data.get(key) is not None:
+                fields[key] = str(data[key])
+
+    elif content_type.startswith('multipart/form-data'):
+        # 用標準函式庫的 email 解析器拆 multipart，不需額外套件
+        header = f"Content-Type: {content_type}\r\nMIME-Version: 1.0\r\n\r\n".encode('utf-8')
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name in fields:
+                fields[name] = _decode(part.get_payload(decode=True) or b'')
+
+    else:
+        fields['orders'] = _decode(body)
+
+    return fields
+
+
+class BatchRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 請求處理（每個連線一個執行緒，實際運算交給 BatchService）"""
+
+    server_version = f"OrderFormatterAPI/{APP_VERSION}"
+
+    def _send(self, status: int, content: bytes, content_type: str, headers: Dict[str, str] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, status: int, data: Dict):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                   'application/json; charset=utf-8')
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {'error': message})
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._send_json(200, self.server.service.status())
+        else:
+            self._send_error(404, f"找不到路徑，可用端點：{', '.join(ENDPOINT_FORMATS)}、/health")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        fmt = ENDPOINT_FORMATS.get(url.path)
+        if fmt is None:
+            self._send_error(404, f"找不到路徑，可用端點：{', '.join(ENDPOINT_FORMATS)}")
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self._send_error(400, "Content-Length 必須是整數")
+            return
+        if length <= 0:
+            self._send_error(400, "請在請求內容中提供訂單資料")
+            return
+        if length > self.server.max_body:
+            self._send_error(413, f"請求內容超過上限 {self.server.max_body} bytes")
+            return
+
+        try:
+            fields = parse_request_body(self.headers.get('Content-Type'), self.rfile.read(length),
+                                        parse_qs(url.query))
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_error(400, f"無法解析請求內容：{e}")
+            return
+
+        if not fields['orders'] or not fields['orders'].strip():
+            self._send_error(400, "缺少訂單資料（orders）")
+            return
+
+        try:
+            content, content_type = self.server.service.submit(
+                fields['orders'], fields['reference'] or None, fmt, fields['batch'] or None
+            )
+        except ServiceBusy:
+            self._send_error(503, "伺服器忙碌中，排隊已滿，請稍後再試")
+            return
+        except TimeoutError as e:
+            self._send_error(504, str(e))
+            return
+        except ValueError as e:
+            self._send_error(422, str(e))
+            return
+        except ImportError as e:
+            self._send_error(501, str(e))
+            return
+        except Exception as e:
+            self._send_error(500, f"處理失敗：{e}")
+            return
+
+        extension = OrderFormatter.EXPORT_FORMATS[fmt][1]
+        self._send(200, content, content_type, {
+            'Content-Disposition': f'attachment; filename="report.{extension}"'
+        })
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class BatchHTTPServer(ThreadingHTTPServer):
+    """帶有批次處理池的 HTTP 伺服器"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: BatchService, max_body: int = DEFAULT_MAX_BODY, quiet: bool = False):
+        super().__init__(address, BatchRequestHandler)
+        self.service = service
+        self.max_body = max_body
+        self.quiet = quiet
+
+
+def main(argv=None):
+    """主程式"""
+    parser = argparse.ArgumentParser(description="訂單資料整理工具 - 本機 HTTP 批次處理服務")
+    parser.add_argument('--host', default='127.0.0.1', help="監聽位址（預設只接受本機連線）")
+    parser.add_argument('--port', type=int, default=8765, help="監聽埠號（預設 8765）")
+    parser.add_argument('--workers', type=int, default=None, help="同時處理的批次數（預設 CPU 核心數 - 1）")
+    parser.add_argument('--queue', type=int, default=32, help="最多可排隊等待的批次數（預設 32）")
+    parser.add_argument('--timeout', type=float, default=60.0, help="單一批次處理秒數上限（預設 60）")
+    parser.add_argument('--max-body', type=int, default=DEFAULT_MAX_BODY, help="單一請求大小上限（bytes）")
+    parser.add_argument('--quiet', action='store_true', help="不輸出每個請求的紀錄")
+    args = parser.parse_args(argv)
+
+    service = BatchService(workers=args.workers, max_queue=args.queue, timeout=args.timeout)
+    server = BatchHTTPServer((args.host, args.port), service, max_body=args.max_body, quiet=args.quiet)
+
+    print(f"📋 訂單批次處理服務 {APP_VERSION}")
+    print(f"🌐 http://{args.host}:{args.port}  （工作行程 {service.workers} 個，排隊上限 {args.queue}）")
+    print("按 Ctrl+C 結束")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服務已停止")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,696 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 命令列批次模式
+不需任何互動提示，可直接放進排程或每晚的自動化流程
+
+使用範例：
+    python order_cli.py process 訂單/*.txt -r 範例參考數據.txt -f md,tsv,xlsx -o 輸出
+    cat 範例資料.txt | python order_cli.py process - -f json --stdout
+    python order_cli.py process 收單A.txt 收單B.txt 收單C.txt --merge 今日合併 -f md,xlsx
+    python order_cli.py process 今日匯出.txt --ledger 匯入紀錄.sqlite3 --on-duplicate skip
+    python order_cli.py process 今日匯出.txt --archive 報表封存
+    python order_cli.py archive find --archive 報表封存 --customer 王小明 --since 2026-01-01 --orders
+    python order_cli.py watch 收單資料夾 -o 彙總輸出
+    python order_cli.py diff 早上匯出.txt 修正後.txt -o 差異.md
+    python order_cli.py allocate 訂單.txt --stock 庫存.txt --priority customer -o 分配.md
+    python order_cli.py schedule 訂單.txt --capacity 每日產能.txt --start 2026-11-01 -o 排程.md --labels a4-3x8
+
+結束代碼：
+    0  全部處理完成，沒有異常訂單也沒有參考數據差異
+    1  有異常訂單或參考數據差異（可用 --no-fail-on-anomalies / --no-fail-on-mismatch 關閉）；
+       diff 子命令為兩個批次有差異；allocate 子命令為有明細需要等待補貨；archive list/find 為沒有符合的封存
+    2  參數錯誤、檔案讀取失敗或無法解析訂單
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import order_watcher
+from allocation import DEFAULT_PRIORITY, PRIORITIES, allocate, parse_stock
+from batch_diff import diff_batches, load_batch
+from import_ledger import DUPLICATE_MODES, ImportLedger
+from item_sheets import SHEET_FORMATS, write_item_sheets
+from labels import LABEL_SHEETS, LabelTemplate, write_labels
+from order_formatter import OrderFormatter, merge_formatters, normalize_order_text
+from report_archive import ARCHIVE_CODECS, DEFAULT_ARCHIVE_DIR, DEFAULT_CODEC, ReportArchive
+from scheduling import DEFAULT_GROUPING, GROUPINGS, parse_capacity, schedule_json, schedule_units
+from version import APP_VERSION
+
+EXIT_OK = 0
+EXIT_FINDINGS = 1
+EXIT_ERROR = 2
+
+# 各格式輸出檔名的後綴
+OUTPUT_SUFFIXES = {
+    'md': '_報表.md',
+    'tsv': '_明細.txt',
+    'stats': '_統計.txt',
+    'json': '.json',
+    'xlsx': '.xlsx',
+    'html': '_報表.html',
+}
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """展開萬用字元，保留輸入順序並去除重複；'-' 代表標準輸入"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = [pattern] if pattern == '-' else (sorted(glob.glob(pattern)) or [pattern])
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def read_text(path: str) -> str:
+    """讀取文字檔（相容 Excel 另存的 UTF-8 BOM）"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        return f.read()
+
+
+def load_one(name: str, order_text: str, batch: Optional[str], measure_memory: bool = False) -> OrderFormatter:
+    """解析單一輸入（可在工作行程中執行）"""
+    formatter = OrderFormatter()
+    with (formatter.trace_memory('load') if measure_memory else nullcontext()):
+        formatter.load_data(normalize_order_text(order_text), batch=batch)
+    if not formatter.orders:
+        raise ValueError("無法解析訂單資料")
+    return formatter
+
+
+def render_outputs(formatter: OrderFormatter, name: str, reference_data: Optional[str], formats: List[str],
+                   output_dir: Optional[str], to_stdout: bool, measure_memory: bool, result: Dict,
+                   item_sheets: Optional[str] = None, sheet_workers: Optional[int] = None,
+                   labels: Optional[Tuple[str, Optional[str]]] = None):
+    """
+    比對參考數據、輸出各格式並寫檔，摘要記錄在 result
+    可另外輸出品項工作單（item_sheets）與標籤（labels = (標籤紙, 範本原文或 None)）
+    """
+    mismatches = []
+    if reference_data:
+        mismatches = [row for row in formatter.reference_differences(reference_data) if row[3] != 0]
+
+    rendered = {}
+    with (formatter.trace_memory('render') if measure_memory else nullcontext()):
+        for fmt in formats:
+            rendered[fmt] = formatter.export(fmt, reference_data)
+    if measure_memory:
+        result['memory'] = formatter.memory_report(rendered)
+
+    if to_stdout:
+        result['stdout'] = rendered
+    else:
+        stem = 'stdin' if name == '-' else os.path.splitext(os.path.basename(name))[0]
+        target_dir = output_dir or (os.path.dirname(os.path.abspath(name)) if name != '-' else os.getcwd())
+        for fmt, content in rendered.items():
+            path = os.path.join(target_dir, stem + OUTPUT_SUFFIXES[fmt])
+            if isinstance(content, bytes):
+                with open(path, 'wb') as f:
+                    f.write(content)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+            result['outputs'].append(path)
+
+        if item_sheets:
+            sheet_dir = os.path.join(target_dir, stem + '_品項工作單')
+            paths = write_item_sheets(formatter, sheet_dir, item_sheets, workers=sheet_workers)
+            result['outputs'].append(f"{sheet_dir}{os.sep}（{len(paths) - 1} 個品項 + 索引）")
+
+        if labels:
+            sheet, template_source = labels
+            template = LabelTemplate(template_source) if template_source else LabelTemplate()
+            path = os.path.join(target_dir, stem + '_標籤.html')
+            pages = write_labels(formatter, path, sheet, template, title=f"{stem} 標籤")
+            result['outputs'].append(f"{path}（{pages} 頁）")
+
+    result.update({
+        'orders': len(formatter.orders),
+        'units': len(formatter.expanded_orders),
+        'amount': sum(formatter.item_amounts.values()),
+        'anomalies': len(formatter.anomalies),
+        'diagnostics': len(formatter.diagnostics),
+        'mismatches': len(mismatches),
+        'metrics': formatter.metrics.to_dict(),
+    })
+
+
+def process_one(name: str, order_text: str, reference_data: Optional[str], formats: List[str],
+                output_dir: Optional[str], batch: Optional[str], to_stdout: bool,
+                measure_memory: bool = False, item_sheets: Optional[str] = None,
+                labels: Optional[Tuple[str, Optional[str]]] = None, sheet_workers: Optional[int] = None,
+                ledger: Optional[ImportLedger] = None, skip_duplicates: bool = True,
+                archive: Optional[Tuple[ReportArchive, str]] = None) -> Dict:
+    """
+    處理單一輸入（在工作行程中執行），回傳處理結果摘要
+    有 ledger 時（只在主行程）先檢查重複匯入，報表輸出成功後才把新訂單寫入匯入紀錄
+    有 archive = (封存, 壓縮方式) 時（只在主行程）輸出成功後把這批封存起來
+    """
+    started = time.perf_counter()
+    result = {'name': name, 'outputs': [], 'error': None}
+
+    try:
+        formatter = load_one(name, order_text, batch, measure_memory)
+        if ledger:
+            result['import'] = ledger.screen(formatter, skip_duplicates, source=name).summary()
+        result['parse_seconds'] = time.perf_counter() - started
+        render_outputs(formatter, name, reference_data, formats, output_dir, to_stdout, measure_memory, result,
+                       item_sheets, sheet_workers, labels)
+        if archive:
+            result['archive'] = archive[0].add(formatter, name=os.path.basename(name), reference_data=reference_data,
+                                               codec=archive[1]).number
+        if ledger:
+            ledger.commit()
+    except Exception as e:
+        result['error'] = str(e)
+        if ledger:
+            ledger.rollback()
+
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def merge_inputs(jobs: List[tuple], workers: int, args, reference_data: Optional[str],
+                 formats: List[str], labels: Optional[Tuple[str, Optional[str]]] = None,
+                 ledger: Optional[ImportLedger] = None,
+                 archive: Optional[Tuple[ReportArchive, str]] = None) -> List[Dict]:
+    """
+    --merge：各輸入分別解析（可平行）後合併成一個批次再輸出，不必串接原始文字重新解析
+    有 ledger 時依輸入順序逐一檢查重複匯入（後面的檔案與前面重疊的訂單也會略過），合併結果輸出成功才寫入
+    回傳 [各輸入解析失敗的結果..., 合併後的結果]
+    """
+    started = time.perf_counter()
+    results = []
+    loaded = []
+
+    def collect(path, future_or_call):
+        try:
+            loaded.append((path, future_or_call()))
+        except Exception as e:
+            results.append({'name': path, 'outputs': [], 'error': str(e), 'seconds': 0.0})
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(job[0], executor.submit(load_one, job[0], job[1], args.batch, args.memory)) for job in jobs]
+            for path, future in futures:
+                collect(path, future.result)
+    else:
+        for job in jobs:
+            collect(job[0], lambda job=job: load_one(job[0], job[1], args.batch, args.memory))
+
+    result = {'name': args.merge, 'outputs': [], 'error': None}
+    try:
+        if not loaded:
+            raise ValueError("沒有可合併的批次")
+        if ledger:
+            screens = [ledger.screen(formatter, args.on_duplicate == 'skip', source=path) for path, formatter in loaded]
+            duplicates = sum(len(screen.duplicates) for screen in screens)
+            result['import'] = (f"新訂單 {sum(screen.new for screen in screens)} 筆 • 已匯入過 {duplicates} 筆"
+                                if duplicates else screens[-1].summary())
+        merged = merge_formatters(*(formatter for _, formatter in loaded))
+        result['parse_seconds'] = time.perf_counter() - started
+        render_outputs(merged, args.merge, reference_data, formats, args.output_dir, args.stdout,
+                       args.memory, result, args.item_sheets, args.jobs, labels)
+        if archive:
+            result['archive'] = archive[0].add(merged, name=args.merge, reference_data=reference_data,
+                                               codec=archive[1]).number
+        if ledger:
+            ledger.commit()
+    except Exception as e:
+        result['error'] = str(e)
+        if ledger:
+            ledger.rollback()
+    result['seconds'] = time.perf_counter() - started
+    results.append(result)
+    return results
+
+
+def report_result(result: Dict, quiet: bool):
+    """在標準錯誤輸出單一檔案的處理結果與耗時"""
+    if result['error']:
+        print(f"❌ {result['name']}：{result['error']}（{result['seconds']:.2f}s）", file=sys.stderr)
+        return
+    if quiet:
+        return
+
+    flags = []
+    if result['anomalies']:
+        flags.append(f"⚠️ 異常 {result['anomalies']} 筆")
+    if result['mismatches']:
+        flags.append(f"⚠️ 差異 {result['mismatches']} 項")
+    if result['diagnostics']:
+        flags.append(f"🩺 診斷 {result['diagnostics']} 則")
+    if result.get('import'):
+        flags.append(f"📥 {result['import']}")
+    if result.get('archive'):
+        flags.append(f"🗄️ 封存 #{result['archive']}")
+    print(
+        f"✅ {result['name']}：{result['orders']} 筆訂單 / {result['units']} 支 / ${result['amount']}"
+        f"（解析 {result['parse_seconds']:.3f}s，合計 {result['seconds']:.3f}s）"
+        + (" " + " ".join(flags) if flags else ""),
+        file=sys.stderr
+    )
+    for path in result['outputs']:
+        print(f"   → {path}", file=sys.stderr)
+    if 'memory' in result:
+        print(f"   🧠 {format_memory(result['memory'])}", file=sys.stderr)
+
+
+def format_memory(memory: Dict) -> str:
+    """記憶體明細的一行摘要"""
+    mb = 1024 * 1024
+    parts = [f"合計約 {memory['total_bytes'] / mb:.1f} MB"]
+    parts += [f"{name} {size / mb:.1f}" for name, size in memory['structures'].items() if size >= mb // 10]
+    parts += [f"{name} {size / mb:.1f}" for name, size in memory['reports'].items()]
+    for name, traced in memory['traced'].items():
+        parts.append(f"{name} 峰值 {traced['peak'] / mb:.1f}")
+    return '，'.join(parts) + "（MB）"
+
+
+def write_metrics_log(path: str, result: Dict):
+    """把單一檔案的各階段指標附加到 JSON Lines 紀錄檔"""
+    entry = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'name': result['name'],
+        'seconds': result['seconds'],
+    }
+    entry.update(result['metrics'])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def label_options(args) -> Optional[Tuple[str, Optional[str]]]:
+    """--labels / --label-template 轉成 (標籤紙, 範本原文)，範本先編譯一次確認格式正確"""
+    if not args.labels:
+        return None
+    template_source = read_text(args.label_template) if args.label_template else None
+    if template_source:
+        LabelTemplate(template_source)
+    return args.labels, template_source
+
+
+def run_process(args) -> int:
+    """process 子命令：批次處理訂單檔"""
+    formats = [fmt.strip() for fmt in args.format.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in OrderFormatter.EXPORT_FORMATS]
+    if unknown or not formats:
+        print(f"❌ 不支援的輸出格式：{', '.join(unknown)}（可用：{', '.join(OrderFormatter.EXPORT_FORMATS)}）",
+              file=sys.stderr)
+        return EXIT_ERROR
+
+    inputs = args.inputs or (['-'] if not sys.stdin.isatty() else [])
+    inputs = expand_inputs(inputs)
+    if not inputs:
+        print("❌ 請指定輸入檔案（或用 - 從標準輸入讀取）", file=sys.stderr)
+        return EXIT_ERROR
+
+    if args.stdout and (args.item_sheets or args.labels):
+        print("❌ --item-sheets、--labels 需要輸出到資料夾，不能搭配 --stdout", file=sys.stderr)
+        return EXIT_ERROR
+
+    try:
+        labels = label_options(args)
+    except (OSError, ValueError) as e:
+        print(f"❌ 標籤範本有誤：{e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    if args.stdout and ((len(inputs) != 1 and not args.merge) or len(formats) != 1 or formats[0] == 'xlsx'):
+        print("❌ --stdout 只能搭配單一輸入與單一文字格式", file=sys.stderr)
+        return EXIT_ERROR
+
+    reference_data = None
+    if args.reference:
+        try:
+            reference_data = read_text(args.reference).strip() or None
+        except OSError as e:
+            print(f"❌ 無法讀取參考數據：{e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # 先讀好所有輸入（標準輸入只能在主行程讀取）
+    jobs = []
+    exit_code = EXIT_OK
+    for path in inputs:
+        try:
+            text = sys.stdin.read() if path == '-' else read_text(path)
+        except OSError as e:
+            print(f"❌ {path}：無法讀取（{e.strerror}）", file=sys.stderr)
+            exit_code = EXIT_ERROR
+            continue
+        jobs.append((path, text, reference_data, formats, args.output_dir, args.batch, args.stdout,
+                     args.memory, args.item_sheets, labels))
+
+    ledger = None
+    if args.ledger:
+        try:
+            ledger = ImportLedger(args.ledger)
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ 無法開啟匯入紀錄：{e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    archive = (ReportArchive(args.archive), args.archive_codec) if args.archive else None
+
+    started = time.perf_counter()
+    workers = max(1, min(args.jobs or os.cpu_count() or 1, len(jobs)))
+    if args.merge:
+        results = merge_inputs(jobs, workers, args, reference_data, formats, labels, ledger, archive)
+    elif ledger or archive:
+        # 匯入紀錄要依輸入順序逐一檢查與寫入，前面檔案匯入的訂單在後面的檔案中視為重複；封存檔也只能依序附加
+        results = [process_one(*job, sheet_workers=args.jobs, ledger=ledger,
+                               skip_duplicates=args.on_duplicate == 'skip', archive=archive) for job in jobs]
+    elif workers > 1:
+        # 多個檔案時分散到多核心平行處理，結果依輸入順序回報
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 外層已經用滿核心，品項工作單在各行程內循序產生
+            futures = [executor.submit(process_one, *job, sheet_workers=1) for job in jobs]
+            results = [future.result() for future in futures]
+    else:
+        # 只有一個檔案時，品項工作單可以用行程池平行產生
+        results = [process_one(*job, sheet_workers=args.jobs) for job in jobs]
+    if ledger:
+        ledger.close()
+
+    total_anomalies = total_mismatches = 0
+    for result in results:
+        report_result(result, args.quiet)
+        if result['error']:
+            exit_code = EXIT_ERROR
+            continue
+        total_anomalies += result['anomalies']
+        total_mismatches += result['mismatches']
+        if args.metrics_log:
+            write_metrics_log(args.metrics_log, result)
+        if args.stdout:
+            content = next(iter(result['stdout'].values()))
+            sys.stdout.write(content)
+            if not content.endswith('\n'):
+                sys.stdout.write('\n')
+
+    if not args.quiet:
+        print(f"⏱️ 共 {len(results)} 個檔案，{workers} 個行程，耗時 {time.perf_counter() - started:.2f}s",
+              file=sys.stderr)
+
+    if exit_code == EXIT_OK:
+        if (args.fail_on_anomalies and total_anomalies) or (args.fail_on_mismatch and total_mismatches):
+            exit_code = EXIT_FINDINGS
+    return exit_code
+
+
+def run_diff(args) -> int:
+    """diff 子命令：比對兩個批次（修正前後的匯出），列出新增、刪除、修改的訂單與品項淨變化"""
+    formatters = []
+    for path in (args.old, args.new):
+        try:
+            formatters.append(load_batch(path))
+        except (OSError, ValueError, ImportError, UnicodeDecodeError, KeyError) as e:
+            print(f"❌ {path}：無法載入（{e}）", file=sys.stderr)
+            return EXIT_ERROR
+
+    diff = diff_batches(*formatters)
+    if args.format == 'json':
+        content = json.dumps(diff.to_dict(), ensure_ascii=False, indent=2)
+    else:
+        content = diff.render_markdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(content + '\n')
+        if not args.quiet:
+            print(f"🔀 {diff.summary()}")
+            print(f"   → {args.output}")
+    else:
+        sys.stdout.write(content + '\n')
+
+    return EXIT_FINDINGS if diff.has_changes else EXIT_OK
+
+
+def run_allocate(args) -> int:
+    """allocate 子命令：依庫存與優先順序分配明細，列出可出貨、待補貨的明細與剩餘庫存"""
+    try:
+        formatter = load_batch(args.input)
+        stock = parse_stock(read_text(args.stock))
+    except (OSError, ValueError, ImportError, UnicodeDecodeError, KeyError) as e:
+        print(f"❌ 無法載入（{e}）", file=sys.stderr)
+        return EXIT_ERROR
+    if not stock:
+        print(f"❌ {args.stock}：沒有可辨識的庫存（格式同參考數據，例如 三色蠟燭 12 支）", file=sys.stderr)
+        return EXIT_ERROR
+
+    allocation = allocate(formatter, stock, args.priority)
+    if args.format == 'json':
+        content = json.dumps(allocation.to_dict(), ensure_ascii=False, indent=2)
+    else:
+        content = allocation.render_markdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(content + '\n')
+        if not args.quiet:
+            print(f"📦 {allocation.summary()}")
+            print(f"   → {args.output}")
+    else:
+        sys.stdout.write(content + '\n')
+
+    return EXIT_FINDINGS if allocation.has_backorders else EXIT_OK
+
+
+def run_schedule(args) -> int:
+    """schedule 子命令：依各品項每日產能把明細排進各天，可另外輸出每天一份標籤"""
+    try:
+        formatter = load_batch(args.input)
+        capacities = parse_capacity(read_text(args.capacity))
+        start = date.fromisoformat(args.start) if args.start else None
+    except (OSError, ValueError, ImportError, UnicodeDecodeError, KeyError) as e:
+        print(f"❌ 無法載入（{e}）", file=sys.stderr)
+        return EXIT_ERROR
+    if not capacities:
+        print(f"❌ {args.capacity}：沒有可辨識的產能（格式同參考數據，例如 帕猜佛蠟燭 60 支）", file=sys.stderr)
+        return EXIT_ERROR
+    if args.labels and not args.output:
+        print("❌ --labels 需要搭配 -o 指定輸出檔案", file=sys.stderr)
+        return EXIT_ERROR
+
+    try:
+        schedule = schedule_units(formatter, capacities, args.group, start)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    if args.format == 'json':
+        content = schedule_json(schedule)
+    elif args.format == 'tsv':
+        content = schedule.render_plain()
+    else:
+        content = schedule.render_markdown()
+
+    if not args.output:
+        sys.stdout.write(content + '\n')
+        return EXIT_OK
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(content + '\n')
+    outputs = [args.output]
+    if args.labels:
+        template = LabelTemplate(read_text(args.label_template)) if args.label_template else LabelTemplate()
+        stem = os.path.splitext(args.output)[0]
+        for day in schedule.days:
+            path = f"{stem}_{day.date}_標籤.html"
+            pages = write_labels(formatter, path, args.labels, template, title=f"{day.label} 標籤", rows=day.rows)
+            outputs.append(f"{path}（{pages} 頁）")
+    if not args.quiet:
+        print(f"📅 {schedule.summary()}")
+        for path in outputs:
+            print(f"   → {path}")
+    return EXIT_OK
+
+
+def run_archive(args) -> int:
+    """archive 子命令：瀏覽、查詢歷史封存，匯入舊的報表檔或重建索引"""
+    archive = ReportArchive(args.archive)
+
+    if args.action == 'import':
+        paths = expand_inputs(args.files)
+        exit_code = EXIT_OK
+        for path in paths:
+            try:
+                entry = archive.add_report_file(path, args.codec)
+            except (OSError, ValueError, UnicodeDecodeError) as e:
+                print(f"❌ {path}：無法匯入（{e}）", file=sys.stderr)
+                exit_code = EXIT_ERROR
+                continue
+            if not args.quiet:
+                print(f"🗄️ #{entry.number} {entry.name}：{entry.orders} 筆訂單 / {entry.units} 支"
+                      f"（{entry.created}）", file=sys.stderr)
+        return exit_code
+
+    if args.action == 'rebuild':
+        count = archive.rebuild_index()
+        print(f"🗄️ 已重建索引：{count} 筆封存", file=sys.stderr)
+        return EXIT_OK
+
+    if args.action == 'show':
+        try:
+            entry = archive.get(args.number)
+        except KeyError as e:
+            print(f"❌ {e.args[0]}", file=sys.stderr)
+            return EXIT_ERROR
+        content = archive.report(entry)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(content)
+        else:
+            sys.stdout.write(content + '\n')
+        return EXIT_OK
+
+    # list / find
+    filters = {}
+    if args.action == 'find':
+        filters = {'customer': args.customer, 'item': args.item, 'since': args.since, 'until': args.until}
+    if args.action == 'find' and args.orders:
+        count = 0
+        for entry, order in archive.find_orders(**filters):
+            print(f"#{entry.number}\t{entry.date}\t{entry.name}\t{order['raw_items']}\t{order['main_person']}\t"
+                  f"{order['target_person']}\t{order['wish']}")
+            count += 1
+        return EXIT_OK if count else EXIT_FINDINGS
+
+    entries = archive.find(**filters) if filters else list(reversed(archive.entries))
+    for entry in entries:
+        print(f"#{entry.number}\t{entry.created}\t{entry.name}\t{entry.orders} 筆\t{entry.units} 支\t${entry.amount}")
+    if not args.quiet:
+        stats = archive.stats()
+        print(f"🗄️ 共 {stats['entries']} 筆封存，列出 {len(entries)} 筆（封存檔 {stats['data_bytes'] / 1024 / 1024:.1f} MB）",
+              file=sys.stderr)
+    return EXIT_OK if entries else EXIT_FINDINGS
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(
+        prog='order_cli.py',
+        description=f"訂單資料整理工具 {APP_VERSION} - 命令列批次模式"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    process = subparsers.add_parser('process', help="處理訂單檔並輸出報表")
+    process.add_argument('inputs', nargs='*', help="訂單檔案或萬用字元（例如 訂單/*.txt），- 代表標準輸入")
+    process.add_argument('-r', '--reference', help="參考數據檔案")
+    process.add_argument('-f', '--format', default='md',
+                         help=f"輸出格式，可用逗號組合（{','.join(OrderFormatter.EXPORT_FORMATS)}，預設 md）")
+    process.add_argument('-o', '--output-dir', help="輸出資料夾（預設與輸入檔相同）")
+    process.add_argument('-j', '--jobs', type=int, default=None, help="平行處理的行程數（預設 CPU 核心數）")
+    process.add_argument('--batch', help="批次標籤（預設為今天日期）")
+    process.add_argument('--stdout', action='store_true', help="把結果輸出到標準輸出（單一輸入、單一文字格式）")
+    process.add_argument('--item-sheets', choices=list(SHEET_FORMATS), metavar='FORMAT',
+                         help=f"另外輸出每個品項一份工作單與索引（{','.join(SHEET_FORMATS)}）")
+    process.add_argument('--labels', choices=list(LABEL_SHEETS), metavar='SHEET',
+                         help=f"另外輸出每一支一張的標籤網頁（標籤紙：{','.join(LABEL_SHEETS)}）")
+    process.add_argument('--label-template',
+                         help="標籤範本 HTML 檔，可用欄位 {index} {order} {item} {price} {main} {target} {wish}")
+    process.add_argument('--merge', metavar='NAME',
+                         help="把所有輸入分別解析後合併成一份報表，NAME 為輸出檔名（例如 今日合併）")
+    process.add_argument('--ledger', metavar='PATH',
+                         help="匯入紀錄檔（SQLite），已匯入過的訂單依 --on-duplicate 處理，輸出成功後記錄新訂單")
+    process.add_argument('--on-duplicate', choices=list(DUPLICATE_MODES), default='skip',
+                         help="已匯入過的訂單：" + '、'.join(f"{code}={label}" for code, label in DUPLICATE_MODES.items()))
+    process.add_argument('--archive', metavar='DIR',
+                         help="輸出成功後把每一批的報表與訂單壓縮封存到這個資料夾（可用 archive 子命令查詢）")
+    process.add_argument('--archive-codec', choices=list(ARCHIVE_CODECS), default=DEFAULT_CODEC,
+                         help="封存的壓縮方式：" + '、'.join(f"{code}={spec[0]}" for code, spec in ARCHIVE_CODECS.items()))
+    process.add_argument('-q', '--quiet', action='store_true', help="只輸出錯誤")
+    process.add_argument('--metrics-log', help="把各階段耗時與計數附加到 JSON Lines 紀錄檔")
+    process.add_argument('--memory', action='store_true',
+                         help="量測並顯示各資料結構與輸出內容的記憶體用量（以 tracemalloc 追蹤，會變慢）")
+    process.add_argument('--no-fail-on-anomalies', dest='fail_on_anomalies', action='store_false',
+                         help="有異常訂單時仍以 0 結束")
+    process.add_argument('--no-fail-on-mismatch', dest='fail_on_mismatch', action='store_false',
+                         help="與參考數據有差異時仍以 0 結束")
+    process.set_defaults(handler=run_process)
+
+    watch = subparsers.add_parser('watch', help="監看資料夾，自動匯入新的訂單檔並更新彙總")
+    order_watcher.add_arguments(watch)
+    watch.set_defaults(handler=order_watcher.run)
+
+    diff = subparsers.add_parser('diff', help="比對兩個批次，列出新增、刪除、修改的訂單與品項淨變化")
+    diff.add_argument('old', help="先前的批次（訂單文字、process -f json 的輸出、.csv 或 .xlsx）")
+    diff.add_argument('new', help="新的批次（格式同上）")
+    diff.add_argument('-f', '--format', choices=['md', 'json'], default='md', help="輸出格式（預設 md）")
+    diff.add_argument('-o', '--output', help="輸出檔案（預設輸出到標準輸出）")
+    diff.add_argument('-q', '--quiet', action='store_true', help="輸出到檔案時不顯示摘要")
+    diff.set_defaults(handler=run_diff)
+
+    allocation = subparsers.add_parser('allocate', help="依庫存分配明細，列出可出貨、待補貨的明細與剩餘庫存")
+    allocation.add_argument('input', help="訂單批次（訂單文字、process -f json 的輸出、.csv 或 .xlsx）")
+    allocation.add_argument('-s', '--stock', required=True,
+                            help="庫存檔，格式同參考數據（例如 三色蠟燭 12 支），沒列出的品項視為不限量")
+    allocation.add_argument('-p', '--priority', choices=list(PRIORITIES), default=DEFAULT_PRIORITY,
+                            help="分配優先順序：" + '、'.join(f"{code}={label}" for code, label in PRIORITIES.items()))
+    allocation.add_argument('-f', '--format', choices=['md', 'json'], default='md', help="輸出格式（預設 md）")
+    allocation.add_argument('-o', '--output', help="輸出檔案（預設輸出到標準輸出）")
+    allocation.add_argument('-q', '--quiet', action='store_true', help="輸出到檔案時不顯示摘要")
+    allocation.set_defaults(handler=run_allocate)
+
+    schedule = subparsers.add_parser('schedule', help="依各品項每日產能把明細排進各天（同一客人盡量排同一天）")
+    schedule.add_argument('input', help="訂單批次（訂單文字、process -f json 的輸出、.csv 或 .xlsx）")
+    schedule.add_argument('-c', '--capacity', required=True,
+                          help="每日產能檔，格式同參考數據（例如 帕猜佛蠟燭 60 支），沒列出的品項不限量")
+    schedule.add_argument('-g', '--group', choices=list(GROUPINGS), default=DEFAULT_GROUPING,
+                          help="分組方式：" + '、'.join(f"{code}={label}" for code, label in GROUPINGS.items()))
+    schedule.add_argument('--start', help="第一天的日期 YYYY-MM-DD（預設今天）")
+    schedule.add_argument('-f', '--format', choices=['md', 'tsv', 'json'], default='md', help="輸出格式（預設 md）")
+    schedule.add_argument('-o', '--output', help="輸出檔案（預設輸出到標準輸出）")
+    schedule.add_argument('--labels', choices=list(LABEL_SHEETS), metavar='SHEET',
+                          help=f"另外輸出每天一份標籤網頁，檔名接在 -o 之後（標籤紙：{','.join(LABEL_SHEETS)}）")
+    schedule.add_argument('--label-template', help="標籤範本 HTML 檔（欄位同 process --label-template）")
+    schedule.add_argument('-q', '--quiet', action='store_true', help="輸出到檔案時不顯示摘要")
+    schedule.set_defaults(handler=run_schedule)
+
+    archive_options = argparse.ArgumentParser(add_help=False)
+    archive_options.add_argument('--archive', default=DEFAULT_ARCHIVE_DIR,
+                                 help=f"封存資料夾（預設 {DEFAULT_ARCHIVE_DIR}）")
+    archive_options.add_argument('-q', '--quiet', action='store_true', help="不顯示摘要")
+    archive = subparsers.add_parser('archive', help="瀏覽、查詢歷史報表封存")
+    archive_actions = archive.add_subparsers(dest='action', required=True)
+    archive_actions.add_parser('list', parents=[archive_options], help="列出所有封存（新的在前）")
+    find = archive_actions.add_parser('find', parents=[archive_options], help="依客人、品項、日期查詢封存")
+    find.add_argument('--customer', help="主要人物（姓名、英文或生日的一部分）")
+    find.add_argument('--item', help="品項名稱（一部分即可）")
+    find.add_argument('--since', help="起始日期 YYYY-MM-DD（含）")
+    find.add_argument('--until', help="結束日期 YYYY-MM-DD（含）")
+    find.add_argument('--orders', action='store_true', help="列出符合的訂單（只解壓縮符合索引的封存）")
+    show = archive_actions.add_parser('show', parents=[archive_options], help="輸出某一筆封存的完整報表")
+    show.add_argument('number', type=int, help="封存編號")
+    show.add_argument('-o', '--output', help="輸出檔案（預設輸出到標準輸出）")
+    archive_import = archive_actions.add_parser('import', parents=[archive_options],
+                                                help="匯入舊的報表檔（訂單報表_YYYYMMDD_HHMMSS.md）")
+    archive_import.add_argument('files', nargs='+', help="報表檔或萬用字元（例如 報表/*.md）")
+    archive_import.add_argument('--codec', choices=list(ARCHIVE_CODECS), default=DEFAULT_CODEC, help="壓縮方式")
+    archive_actions.add_parser('rebuild', parents=[archive_options], help="依封存檔重建索引（索引遺失或損壞時）")
+    archive.set_defaults(handler=run_archive)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    """主程式"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,14 +5,1164 @@
 功能：自動展開品項、統計、比對、生成A4雙欄列印表格
 """
 
+import hashlib
+import io
+import json
+import operator
 import re
+import sys
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left
 from datetime import datetime
 from collections import defaultdict
-from typing import List, Dict, Tuple
+from functools import lru_cache, wraps
+from string import Formatter
+from typing import List, Dict, Tuple, NamedTuple, Optional, Union, Iterable, Sequence
+
+# NumPy 為選用套件：有安裝時統計改用向量化計算，沒有則使用純 Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 生日格式：1996.01.17、19880610、1988/11/07、1985/7/29、1990,07,06、1986/ 01 /26、1985年11月9日
+_BIRTHDAY_PATTERN = re.compile(
+    r'(?<!\d)(\d{4})\s*[/.\-,，、年]?\s*(\d{1,2})\s*[/.\-,，、月]?\s*(\d{1,2})\s*日?\s*$'
+)
+# 括號內的附註或英文名，例如（農曆）、(Bianca Tsang)；全形半形括號可混用
+_PAREN_PATTERN = re.compile(r'[（(][^（()）]*[)）]')
+_TRAILING_NOTE_PATTERN = re.compile(r'(?:\s*[（(][^（()）]*[)）])+\s*$')
+_CJK_CHAR_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+_ROMAN_WORD_PATTERN = re.compile(r'[A-Za-z]+')
+
+
+class PersonInfo(NamedTuple):
+    """人物資料（姓名、英文拼音、生日）"""
+    name: str       # 中文姓名，例如：許甄尹
+    roman: str      # 英文拼音（大寫、空格分隔），例如：HSU CHEN YING
+    birthday: str   # 正規化生日 YYYY.MM.DD，無法辨識時為空字串
+    label: str      # 生日之前的原始姓名部分
+
+    @property
+    def key(self) -> str:
+        """同一客人不同寫法共用的識別鍵，例如：許甄尹/1988.06.10"""
+        base = self.name or self.roman or self.label
+        if self.birthday and base:
+            return f"{base}/{self.birthday}"
+        return base or self.birthday
+
+    def to_field(self) -> str:
+        """轉成 Tab 欄位使用的「姓名/生日」格式"""
+        if self.birthday and self.label:
+            return f"{self.label}/{self.birthday}"
+        return self.label or self.birthday
+
+
+@lru_cache(maxsize=8192)
+def parse_person(person_text: str) -> PersonInfo:
+    """
+    解析人物資料，拆出中文姓名、英文拼音與生日
+    例如："許甄尹/Janny/ HSU CHEN YING 19880610"
+      -> PersonInfo('許甄尹', 'JANNY HSU CHEN YING', '1988.06.10', '許甄尹/Janny/ HSU CHEN YING')
+    同一批資料中重複出現的客人會直接命中快取，不會重跑正規表示式
+    """
+    text = person_text.strip()
+    birthday = ''
+    label = text
+
+    # 生日後面可能還有附註，例如「1988/11/07（農曆）」
+    match = _BIRTHDAY_PATTERN.search(_TRAILING_NOTE_PATTERN.sub('', text))
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+        # 月份、日期不合理時（例如 1981/120/07）視為沒有生日
+        if 1 <= month <= 12 and 1 <= day <= 31:
+            birthday = f"{year:04d}.{month:02d}.{day:02d}"
+            label = text[:match.start()].rstrip(' /+、,，')
+
+    # 中文姓名不含括號內的文字（英文名仍會併入英文拼音）
+    name = ''.join(_CJK_CHAR_PATTERN.findall(_PAREN_PATTERN.sub(' ', label)))
+    roman = ' '.join(_ROMAN_WORD_PATTERN.findall(label)).upper()
+
+    return PersonInfo(name, roman, birthday, label)
+
+
+def normalize_wish(wish: str) -> str:
+    """去掉「願望：」前綴並合併空白，只差在格式的願望視為相同"""
+    wish = wish.strip()
+    for prefix in ('願望：', '願望:', '愿望：', '愿望:'):
+        if wish.startswith(prefix):
+            wish = wish[len(prefix):]
+            break
+    return ' '.join(wish.split())
+
+
+# 訂單識別碼：正規化內容的雜湊（16 個十六進位字元），同樣內容第 n 次出現時加上 -n
+ORDER_ID_BYTES = 8
+
+
+# 單行長度上限：超過的行不解析，改記錄為診斷訊息（避免整段聊天紀錄貼成一行時卡住）
+MAX_LINE_LENGTH = 4000
+# 單次載入的解析時間上限（秒），超過時停止解析並記錄診斷訊息
+PARSE_TIME_BUDGET = 30.0
+# 單一品項數量超過此值時記錄為可疑數量（通常是把生日或總數打進數量欄）
+SUSPICIOUS_QUANTITY = 50
+
+# 診斷類型 -> 顯示名稱
+DIAGNOSTIC_LABELS = {
+    'line_too_long': '行過長',
+    'time_budget': '超過解析時間',
+    'missing_field': '缺少欄位',
+    'orphan_wish': '單獨的願望行',
+    'merged_lines': '合併後續行',
+    'unknown_item': '未知品項',
+    'missing_birthday': '缺少生日',
+    'suspicious_quantity': '可疑數量',
+    'already_imported': '已匯入過',
+    'reimport_skipped': '重複匯入略過',
+}
+# 這些類型的內容沒有列入統計，其他類型只是提醒
+SKIPPED_DIAGNOSTICS = frozenset({'line_too_long', 'time_budget', 'missing_field', 'orphan_wish', 'reimport_skipped'})
+
+
+class Diagnostic(NamedTuple):
+    """解析時發現、但不影響其他訂單的問題（行號從 1 起算，0 表示不是從文字載入）"""
+    line: int       # 發生問題的行號（範圍的第一行）
+    kind: str       # 問題類型，見 DIAGNOSTIC_LABELS
+    message: str    # 給使用者看的說明
+    end_line: int = 0                   # 範圍的最後一行（0 表示只有一行）
+    order_index: Optional[int] = None   # 相關的訂單編號（訂單被移除或修改時一併清除）
+
+    @property
+    def last_line(self) -> int:
+        return max(self.line, self.end_line)
+
+    @property
+    def span(self) -> str:
+        """行號範圍文字，例如 "12" 或 "12-14"；沒有行號時為 "—" """
+        if not self.line:
+            return '—'
+        return str(self.line) if self.last_line == self.line else f"{self.line}-{self.last_line}"
+
+    @property
+    def skipped(self) -> bool:
+        """內容是否沒有列入統計"""
+        return self.kind in SKIPPED_DIAGNOSTICS
+
+
+# 以下解析輔助函式都只做一次線性掃描，取代原本會在長行上大量回溯的 (.+?) 正規表示式
+_QUANTITY_MARKERS = 'xX×*'
+_DIGIT_PATTERN = re.compile(r'\d')
+
+
+def _skip_spaces(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _skip_spaces_back(text: str, pos: int) -> int:
+    while pos > 0 and text[pos - 1].isspace():
+        pos -= 1
+    return pos
+
+
+def _digits_end(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos].isdecimal():
+        pos += 1
+    return pos
+
+
+def _digits_start(text: str, pos: int) -> int:
+    while pos > 0 and text[pos - 1].isdecimal():
+        pos -= 1
+    return pos
+
+
+def _marked_quantity(text: str) -> Optional[Tuple[str, int]]:
+    r"""
+    找出第一個「名稱[xX×*]數量」，回傳（名稱, 數量）
+    等同 re.search(r'(.+?)\s*[xX×*]\s*(\d+)', text)
+    """
+    for marker in range(1, len(text)):
+        if text[marker] in _QUANTITY_MARKERS:
+            start = _skip_spaces(text, marker + 1)
+            end = _digits_end(text, start)
+            if end > start:
+                return text[:marker].strip(), int(text[start:end])
+    return None
+
+
+def _spaced_quantity(text: str) -> Optional[Tuple[str, int]]:
+    r"""
+    結尾為「空白 + 1~3 位數字」，回傳（名稱, 數量）
+    等同 re.search(r'(.+?)\s+(\d{1,3})$', text)
+    """
+    end = len(text)
+    start = _digits_start(text, end)
+    if not 1 <= end - start <= 3:
+        return None
+    name_end = _skip_spaces_back(text, start)
+    # 數字前至少要有一個空白，再往前至少要有一個字（可以也是空白）
+    if name_end == start or start < 2:
+        return None
+    return text[:name_end].strip(), int(text[start:end])
+
+
+def _is_item_line(line: str) -> bool:
+    r"""
+    是否為品項行（品項名 + 可選空格 + x/X/×/* + 可選空格 + 數字）
+    等同 re.match(r'^[^\d]+\s*[xX×*]\s*\d+', line)
+    """
+    digit = _DIGIT_PATTERN.search(line)
+    if digit is None:
+        return False
+    marker = _skip_spaces_back(line, digit.start()) - 1
+    return marker >= 1 and line[marker] in _QUANTITY_MARKERS
+
+
+def looks_multi_line(order_data: str) -> bool:
+    """簡單判斷：幾乎每行都沒有 Tab（不到 30%）時，視為多行格式"""
+    lines = [line for line in order_data.split('\n') if line.strip()]
+    if not lines:
+        return False
+    tab_count = sum(1 for line in lines if '\t' in line)
+    return tab_count <= len(lines) * 0.3
+
+
+def convert_multi_line_format(order_data: str) -> List[str]:
+    """
+    轉換多行格式為 Tab 分隔格式，回傳每筆訂單一行的字串串列
+    多行格式：品項x數量 / 姓名 生日 / 對象 生日（選填）/ 願望：內容
+    """
+    lines = order_data.split('\n')
+
+    # 解析多行格式
+    orders = []
+    current_order = []
+
+    for line in lines:
+        line = line.strip()
+
+        if len(line) > MAX_LINE_LENGTH:
+            # 過長的行原樣保留成獨立一行，交給 load_data 記錄為診斷訊息
+            if current_order:
+                orders.append(current_order)
+                current_order = []
+            orders.append(line)
+            continue
+
+        if not line:
+            # 遇到空行表示一筆訂單結束
+            if current_order:
+                orders.append(current_order)
+                current_order = []
+            continue
+
+        # 檢查是否為新訂單的品項行（品項名 + 可選空格 + x/X/×/* + 可選空格 + 數字）
+        # 必須是行的主要內容，不是生日或其他格式
+        is_item_line = _is_item_line(line)
+
+        # 如果當前行是品項行，且已經有資料在 current_order 中
+        # 表示這是新訂單的開始，需要先保存前一筆訂單
+        if is_item_line and current_order:
+            # 檢查 current_order 是否已經是完整訂單（至少有願望行）
+            has_wish = any('願望' in item or '愿望' in item or '祈' in item or '蠟燭' in item for item in current_order)
+            if has_wish:
+                orders.append(current_order)
+                current_order = []
+
+        # 非空行加入當前訂單
+        current_order.append(line)
+
+    # 處理最後一筆訂單
+    if current_order:
+        orders.append(current_order)
+
+    # 轉換格式
+    converted_orders = []
+
+    for order_lines in orders:
+        if isinstance(order_lines, str):
+            converted_orders.append(order_lines)
+            continue
+        if len(order_lines) < 2:
+            continue
+
+        # 第1行：品項
+        item = order_lines[0]
+
+        main_person = "—"
+        target_person = "—"
+        wish = ""
+        wish_index = -1
+
+        # 查找願望行的位置（支援「願望」「祈」「蠟燭」等開頭）
+        for idx, line in enumerate(order_lines[1:], start=1):
+            if '願望' in line or '祈' in line or '蠟燭' in line:
+                wish_index = idx
+                # 處理願望的第一行
+                wish_first = line.replace('願望：', '').replace('願望:', '')
+                wish_first = wish_first.replace('蠟燭：', '').replace('蠟燭:', '').strip()
+
+                # 收集願望後續的多行內容（直到遇到下一筆訂單的品項行或結束）
+                wish_lines = [wish_first]
+                for extra_line in order_lines[idx + 1:]:
+                    if _is_item_line(extra_line):
+                        break
+                    wish_lines.append(extra_line)
+
+                wish = ' '.join(wish_lines)
+                break
+
+        # 在願望之前的行中找人物資料（重複客人直接命中 parse_person 快取）
+        person_lines = order_lines[1:wish_index] if wish_index > 0 else order_lines[1:]
+        if len(person_lines) >= 1:
+            main_person = parse_person(person_lines[0]).to_field()
+        if len(person_lines) >= 2:
+            target_person = parse_person(person_lines[1]).to_field()
+
+        # 組合成 Tab 分隔格式
+        converted_orders.append(f"{item}\t{main_person}\t{target_person}\t{wish}")
+
+    return converted_orders
+
+
+# 多行格式中標示願望行的字（與 convert_multi_line_format 相同）
+_WISH_MARKERS = ('願望', '愿望', '祈', '蠟燭')
+
+
+def complete_orders_end(order_data: str) -> int:
+    """
+    order_data 中最後一筆完整訂單結束的位置，給檔案還在寫入時只處理寫完的部分，其餘留到下次
+    - Tab 分隔格式：到最後一個換行為止（沒有換行的最後一行可能還沒寫完）
+    - 多行格式：到最後一個空行，或已有願望行的訂單後出現下一筆品項行之前
+      （願望可以有多行，最後一筆要等到後面出現空行或下一筆訂單才算完整）
+    """
+    end = order_data.rfind('\n') + 1
+    if not end or not looks_multi_line(order_data[:end]):
+        return end
+
+    boundary = 0
+    position = 0
+    has_wish = False
+    for line in order_data[:end - 1].split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            boundary = position + len(line) + 1
+            has_wish = False
+        elif _is_item_line(stripped):
+            if has_wish:
+                boundary = position
+            has_wish = False
+        elif any(marker in stripped for marker in _WISH_MARKERS):
+            has_wish = True
+        position += len(line) + 1
+    return boundary
+
+
+def normalize_order_text(order_data: str) -> str:
+    """看起來是多行格式時先轉成 Tab 分隔格式，否則原樣回傳（給非互動的批次處理使用）"""
+    if looks_multi_line(order_data):
+        converted = convert_multi_line_format(order_data)
+        if converted:
+            return '\n'.join(converted)
+    return order_data
+
+
+def _intersect_sorted(a: List[int], b: List[int]) -> List[int]:
+    """求兩個已排序編號串列的交集（長度差距大時用二分搜尋跳躍）"""
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return []
+
+    if len(b) > len(a) * 8:
+        result = []
+        lo = 0
+        for value in a:
+            lo = bisect_left(b, value, lo)
+            if lo == len(b):
+                break
+            if b[lo] == value:
+                result.append(value)
+        return result
+
+    # 長度相近時，用較短串列建集合再依序掃描較長串列（結果仍維持排序）
+    members = set(a)
+    return [value for value in b if value in members]
+
+
+def _union_sorted(a: List[int], b: List[int]) -> List[int]:
+    """求兩個已排序編號串列的聯集"""
+    if not a:
+        return list(b)
+    if not b:
+        return list(a)
+    return sorted(set(a).union(b))
+
+
+def _person_tokens(person_text: str) -> List[str]:
+    """人物欄位的索引詞：原字串、識別鍵、中文姓名、英文拼音"""
+    info = parse_person(person_text)
+    tokens = {person_text.strip(), info.key, info.name, info.roman}
+    tokens.discard('')
+    return list(tokens)
+
+
+def _person_query_token(person_text: str) -> str:
+    """把查詢用的人物字串轉成索引詞（有生日用識別鍵，否則用姓名）"""
+    info = parse_person(person_text)
+    if info.birthday:
+        return info.key
+    return info.name or info.roman or person_text.strip()
+
+
+def _text_tokens(text: str) -> set:
+    """文字索引詞：中文取相鄰兩字（bigram），英數取小寫單字"""
+    tokens = set()
+    for run in _CJK_RUN_PATTERN.findall(text):
+        for i in range(len(run) - 1):
+            tokens.add(run[i:i + 2])
+    for word in _WORD_PATTERN.findall(text):
+        tokens.add(word.lower())
+    return tokens
+
+
+_CJK_RUN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+
+
+class ExpandedIndex:
+    """
+    展開明細的倒排索引
+    - 品項：以明細列為單位
+    - 主要人物、對象、願望：以訂單（連續的明細列）為單位，查詢時再換算成明細列
+    所有索引串列都是遞增排序，組合條件時用排序串列交集
+    """
+
+    def __init__(self, expanded_orders: List[Dict]):
+        self.rows = expanded_orders
+        self.item_rows = defaultdict(list)
+        self.main_groups = defaultdict(list)
+        self.target_groups = defaultdict(list)
+        self.wish_groups = defaultdict(list)
+        self.group_starts = []   # 每組第一列的位置
+        self.group_wishes = []   # 每組的願望小寫原文（用來確認 bigram 命中）
+
+        token_cache = {}
+        wish_cache = {}
+        last_order = None
+
+        for position, row in enumerate(expanded_orders):
+            self.item_rows[row['item']].append(position)
+
+            if row.get('order_index') == last_order and self.group_starts:
+                continue
+            last_order = row.get('order_index')
+
+            group = len(self.group_starts)
+            self.group_starts.append(position)
+            self.group_wishes.append(row['wish'].lower())
+
+            for field, postings in (('main_person', self.main_groups),
+                                    ('target_person', self.target_groups)):
+                value = row[field]
+                tokens = token_cache.get(value)
+                if tokens is None:
+                    tokens = token_cache[value] = _person_tokens(value)
+                for token in tokens:
+                    postings[token].append(group)
+
+            wish = row['wish']
+            tokens = wish_cache.get(wish)
+            if tokens is None:
+                tokens = wish_cache[wish] = _text_tokens(wish)
+            for token in tokens:
+                self.wish_groups[token].append(group)
+
+    def _group_rows(self, groups: List[int]) -> List[int]:
+        """把訂單組編號換算成明細列位置（維持排序）"""
+        rows = []
+        total = len(self.rows)
+        for group in groups:
+            start = self.group_starts[group]
+            end = self.group_starts[group + 1] if group + 1 < len(self.group_starts) else total
+            rows.extend(range(start, end))
+        return rows
+
+    def _wish_groups(self, wish: str) -> List[int]:
+        """以願望關鍵字查詢訂單組"""
+        needle = wish.strip().lower()
+        tokens = _text_tokens(needle)
+        if tokens:
+            candidates = None
+            for token in sorted(tokens, key=lambda t: len(self.wish_groups.get(t, ()))):
+                postings = self.wish_groups.get(token, [])
+                candidates = postings if candidates is None else _intersect_sorted(candidates, postings)
+                if not candidates:
+                    return []
+        else:
+            # 單一中文字等無法切 bigram 的關鍵字：直接掃描各組願望
+            candidates = range(len(self.group_wishes))
+
+        # bigram 命中不代表連續出現，再確認一次原文
+        wishes = self.group_wishes
+        return [g for g in candidates if needle in wishes[g]]
+
+    def search(self, item: str = None, person: str = None, main: str = None,
+               target: str = None, wish: str = None) -> List[int]:
+        """組合條件查詢，回傳符合的明細列位置（遞增排序）"""
+        groups = None
+
+        def narrow(current, postings):
+            return postings if current is None else _intersect_sorted(current, postings)
+
+        if person:
+            token = _person_query_token(person)
+            groups = _union_sorted(self.main_groups.get(token, []),
+                                   self.target_groups.get(token, []))
+        if main:
+            groups = narrow(groups, self.main_groups.get(_person_query_token(main), []))
+        if target:
+            groups = narrow(groups, self.target_groups.get(_person_query_token(target), []))
+        if wish:
+            groups = narrow(groups, self._wish_groups(wish))
+
+        rows = None
+        if groups is not None:
+            rows = self._group_rows(groups)
+        if item:
+            rows = narrow(rows, self.item_rows.get(item.strip(), []))
+
+        if rows is None:
+            return list(range(len(self.rows)))
+        return rows
+
+
+def write_xlsx(target, sheets: List[Tuple[str, List[str], List[list]]]):
+    """
+    輸出 xlsx 檔案（需要 openpyxl，使用 write_only 模式逐列寫入）
+    - target：檔案路徑或可寫入的二進位檔案物件
+    - sheets：[(工作表名稱, 標題列, 資料列), ...]
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError("輸出 xlsx 需要安裝 openpyxl：pip install openpyxl")
+
+    workbook = Workbook(write_only=True)
+    for title, headers, rows in sheets:
+        sheet = workbook.create_sheet(title=title[:31])
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(list(row))
+    workbook.save(target)
+
+
+class AggregationCube:
+    """
+    多維度彙總（品項 × 主要人物 × 對象 × 批次）
+    展開訂單時一次累加，之後的分組、切片都只讀彙總格，不再掃描明細
+    每一格：[數量, 金額, {訂單編號: 品項行數}]；訂單數為不重複的訂單編號數，
+    一筆訂單有多個品項時在合併多格的分組中也只算一次
+    """
+
+    DIMENSIONS = ('item', 'main', 'target', 'batch')
+    DIMENSION_LABELS = {'item': '品項', 'main': '主要人物', 'target': '對象', 'batch': '批次'}
+    MEASURE_LABELS = ('數量', '金額', '訂單數')
+
+    def __init__(self):
+        self.cells = {}
+        self._rollups = {}
+
+    def add(self, item: str, main: str, target: str, batch: str, quantity: int, amount: int, order: int):
+        """累加訂單 order 的一行品項"""
+        key = (item, main, target, batch)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = [0, 0, {}]
+        cell[0] += quantity
+        cell[1] += amount
+        orders = cell[2]
+        orders[order] = orders.get(order, 0) + 1
+        self._rollups.clear()
+
+    def remove(self, item: str, main: str, target: str, batch: str, quantity: int, amount: int, order: int):
+        """扣回 add 累加過的一行品項，格子中已沒有任何訂單時移除該格"""
+        key = (item, main, target, batch)
+        cell = self.cells.get(key)
+        if cell is None:
+            return
+        cell[0] -= quantity
+        cell[1] -= amount
+        orders = cell[2]
+        lines = orders.get(order, 0) - 1
+        if lines > 0:
+            orders[order] = lines
+        else:
+            orders.pop(order, None)
+        if not orders:
+            del self.cells[key]
+        self._rollups.clear()
+
+    def _positions(self, dims) -> Tuple[int, ...]:
+        positions = []
+        for dim in dims:
+            if dim not in self.DIMENSIONS:
+                raise ValueError(f"未知的維度：{dim}（可用：{', '.join(self.DIMENSIONS)}）")
+            positions.append(self.DIMENSIONS.index(dim))
+        return tuple(positions)
+
+    def rollup(self, *dims: str) -> Dict[Tuple, List[int]]:
+        """依指定維度彙總，例如 rollup('item', 'main') -> {(品項, 人物): [數量, 金額, 訂單數]}"""
+        positions = self._positions(dims)
+        cached = self._rollups.get(positions)
+        if cached is not None:
+            return cached
+
+        result = {}
+        members = {}  # 分組 -> 不重複的訂單編號
+        for key, (quantity, amount, orders) in self.cells.items():
+            group = tuple(key[p] for p in positions)
+            measures = result.get(group)
+            if measures is None:
+                result[group] = [quantity, amount, 0]
+                members[group] = set(orders)
+            else:
+                measures[0] += quantity
+                measures[1] += amount
+                members[group].update(orders)
+        for group, measures in result.items():
+            measures[2] = len(members[group])
+
+        self._rollups[positions] = result
+        return result
+
+    def slice(self, **filters: str) -> 'AggregationCube':
+        """固定部分維度的值，回傳子彙總，例如 slice(item='拆散')"""
+        positions = self._positions(filters.keys())
+        values = tuple(filters.values())
+
+        sliced = AggregationCube()
+        for key, (quantity, amount, orders) in self.cells.items():
+            if tuple(key[p] for p in positions) == values:
+                sliced.cells[key] = [quantity, amount, dict(orders)]
+        return sliced
+
+    def merge(self, other: 'AggregationCube', offset: int = 0):
+        """把另一個彙總的所有格子加進來，對方的訂單編號加上 offset（與合併後的訂單編號一致）"""
+        for key, (quantity, amount, orders) in other.cells.items():
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = [0, 0, {}]
+            cell[0] += quantity
+            cell[1] += amount
+            merged = cell[2]
+            for order, lines in orders.items():
+                merged[order + offset] = merged.get(order + offset, 0) + lines
+        self._rollups.clear()
+
+    def group_by_table(self, *dims: str) -> Tuple[List[str], List[list]]:
+        """分組表格（標題列、資料列），資料列依維度值排序"""
+        headers = [self.DIMENSION_LABELS[d] for d in dims] + list(self.MEASURE_LABELS)
+        rows = [list(group) + measures for group, measures in sorted(self.rollup(*dims).items())]
+        return headers, rows
+
+    def render_markdown(self, *dims: str) -> str:
+        """分組表格（Markdown 格式）"""
+        headers, rows = self.group_by_table(*dims)
+        result = []
+        result.append("| " + " | ".join(headers) + " |")
+        result.append("|" + "|".join("------" for _ in headers) + "|")
+
+        for row in rows:
+            *labels, quantity, amount, orders = row
+            result.append("| " + " | ".join(labels) + f" | {quantity} | ${amount} | {orders} |")
+
+        # 總計另外彙總：跨分組的同一筆訂單只算一次
+        total_quantity, total_amount, total_orders = self.rollup().get((), [0, 0, 0])
+
+        padding = " | -" * (len(dims) - 1)
+        result.append(f"| **總計**{padding} | **{total_quantity}** | **${total_amount}** | **{total_orders}** |")
+        return '\n'.join(result)
+
+    def render_plain(self, *dims: str) -> str:
+        """分組表格（Tab 分隔，方便貼到 Excel）"""
+        headers, rows = self.group_by_table(*dims)
+        result = ['\t'.join(headers)]
+        for row in rows:
+            *labels, quantity, amount, orders = row
+            result.append('\t'.join(labels) + f"\t{quantity}\t${amount}\t{orders}")
+        return '\n'.join(result)
+
+    def write_xlsx(self, target, *dims: str):
+        """分組表格輸出成 xlsx"""
+        headers, rows = self.group_by_table(*dims)
+        title = '×'.join(self.DIMENSION_LABELS[d] for d in dims)
+        write_xlsx(target, [(title, headers, rows)])
+
+
+def _reference_marked(part: str) -> Optional[Tuple[str, int]]:
+    r"""「三鬼頭x121」，等同 re.search(r'^(.+?)\s*[xX×*]\s*(\d+)$', part)"""
+    end = len(part)
+    start = _digits_start(part, end)
+    if start == end:
+        return None
+    marker = _skip_spaces_back(part, start) - 1
+    if marker < 1 or part[marker] not in _QUANTITY_MARKERS:
+        return None
+    return part[:marker].strip(), int(part[start:end])
+
+
+def _reference_count_first(part: str) -> Optional[Tuple[str, int]]:
+    r"""「87支鬼王」，等同 re.search(r'^(\d+)\s*支\s*(.+)$', part)"""
+    end = _digits_end(part, 0)
+    if end == 0:
+        return None
+    unit = _skip_spaces(part, end)
+    if unit >= len(part) or part[unit] != '支':
+        return None
+    if unit + 1 >= len(part):
+        return None
+    return part[unit + 1:].strip(), int(part[:end])
+
+
+def _reference_count_last(part: str) -> Optional[Tuple[str, int]]:
+    r"""「鬼王 87 支」，等同 re.search(r'^(.+?)\s*(\d+)\s*支?$', part)"""
+    end = len(part)
+    if end and part[end - 1] == '支':
+        end -= 1
+    end = _skip_spaces_back(part, end)
+    start = max(_digits_start(part, end), 1)  # 名稱至少要有一個字
+    if start >= end:
+        return None
+    return part[:start].strip(), int(part[start:end])
+
+
+def parse_reference_data(reference_data: str) -> Dict[str, int]:
+    """
+    解析參考數據，回傳 {品項: 數量}
+    支援：三鬼頭x121、87支鬼王、鬼王 87 支，可用換行或逗號（、）分隔
+    """
+    reference = {}
+
+    # 支援換行或逗號分隔
+    parts = re.split(r'[\n、,，]', reference_data)
+
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+
+        # 太長的片段不可能是參考數據，直接略過
+        if len(part) > MAX_LINE_LENGTH:
+            continue
+
+        # 嘗試匹配「品項+x+數量」格式（例如：三鬼頭x121 或 三鬼頭 x 121）
+        parsed = _reference_marked(part)
+        if parsed is None:
+            # 嘗試匹配「數量+支+品項」格式（例如：87支鬼王）
+            parsed = _reference_count_first(part)
+        if parsed is None:
+            # 嘗試匹配「品項+數量+支」格式（例如：鬼王 87 支）
+            parsed = _reference_count_last(part)
+        if parsed is not None:
+            item_name, quantity = parsed
+            reference[item_name] = quantity
+
+    return reference
+
+
+def _numpy_view(values: array):
+    """把 array.array 直接包成 NumPy 陣列（不複製資料）"""
+    return np.frombuffer(values, dtype=values.typecode)
+
+
+class ItemColumns:
+    """
+    解析後品項的欄式儲存：品項編碼、數量、訂單編號各一個陣列
+    品項名稱在解析時就轉成整數編碼，統計時可直接用 np.bincount 彙總
+    沒有安裝 NumPy（或指定 use_numpy=False）時改用純 Python 迴圈，結果相同
+    """
+
+    def __init__(self, use_numpy: Optional[bool] = None):
+        self.names = []          # 編碼 -> 品項名稱
+        self.code_of = {}        # 品項名稱 -> 編碼
+        self.codes = array('l')
+        self.quantities = array('q')
+        self.order_ids = array('l')
+        self.line_counts = []    # 編碼 -> 仍有效的品項筆數（清除後歸零的品項不列入統計）
+        self.use_numpy = (np is not None) if use_numpy is None else (use_numpy and np is not None)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def encode(self, item_name: str) -> int:
+        """取得品項編碼（新品項自動配發）"""
+        code = self.code_of.get(item_name)
+        if code is None:
+            code = self.code_of[item_name] = len(self.names)
+            self.names.append(item_name)
+            self.line_counts.append(0)
+        return code
+
+    def append(self, item_name: str, quantity: int, order_id: int) -> int:
+        """新增一筆解析後品項，回傳在欄中的位置"""
+        code = self.encode(item_name)
+        self.codes.append(code)
+        self.quantities.append(quantity)
+        self.order_ids.append(order_id)
+        self.line_counts[code] += 1
+        return len(self.codes) - 1
+
+    def extend_from(self, other: 'ItemColumns', start: int, end: int, order_id: int) -> Tuple[int, int]:
+        """
+        複製另一個欄式儲存 [start, end) 的品項（依品項名稱重新編碼、改用新的訂單編號）
+        回傳在本欄中的新範圍
+        """
+        first = len(self.codes)
+        for position in range(start, end):
+            code = self.encode(other.names[other.codes[position]])
+            self.codes.append(code)
+            self.line_counts[code] += 1
+        self.quantities.extend(other.quantities[start:end])
+        self.order_ids.extend([order_id] * (end - start))
+        return first, len(self.codes)
+
+    def clear_span(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """
+        把 [start, end) 位置的品項歸零（訂單編號設為 0，不再列入任何統計）
+        回傳被清除的 [(編碼, 數量), ...]，供呼叫端扣回統計
+        """
+        cleared = []
+        for position in range(start, end):
+            code = self.codes[position]
+            cleared.append((code, self.quantities[position]))
+            self.quantities[position] = 0
+            self.order_ids[position] = 0
+            self.line_counts[code] -= 1
+        return cleared
+
+    def is_live(self, code: int) -> bool:
+        """品項是否仍有有效的品項筆數"""
+        return self.line_counts[code] > 0
+
+    def price_vector(self, price_list: Dict[str, int]) -> List[int]:
+        """各編碼對應的單價（不在價目表中為 0）"""
+        return [price_list.get(name, 0) for name in self.names]
+
+    def item_totals(self, price_list: Dict[str, int]) -> Tuple[List[int], List[int]]:
+        """各品項總數量與總金額（以編碼為索引）"""
+        prices = self.price_vector(price_list)
+        size = len(self.names)
+
+        if self.use_numpy and size:
+            codes = _numpy_view(self.codes)
+            quantities = _numpy_view(self.quantities)
+            totals = np.bincount(codes, weights=quantities, minlength=size).astype(np.int64)
+            amounts = totals * np.asarray(prices, dtype=np.int64)
+            return totals.tolist(), amounts.tolist()
+
+        totals = [0] * size
+        for code, quantity in zip(self.codes, self.quantities):
+            totals[code] += quantity
+        amounts = [total * price for total, price in zip(totals, prices)]
+        return totals, amounts
+
+    def order_totals(self, price_list: Dict[str, int]) -> Dict[int, Tuple[int, int]]:
+        """各訂單的總數量與總金額 {訂單編號: (數量, 金額)}"""
+        if not self.codes:
+            return {}
+        prices = self.price_vector(price_list)
+
+        if self.use_numpy:
+            codes = _numpy_view(self.codes)
+            quantities = _numpy_view(self.quantities)
+            order_ids = _numpy_view(self.order_ids)
+            line_amounts = quantities * np.asarray(prices, dtype=np.int64)[codes]
+
+            # 訂單編號是從 1 起的流水號，可直接當 bincount 的索引（0 為已清除的品項）
+            present = np.flatnonzero(np.bincount(order_ids))
+            present = present[present > 0]
+            qty_totals = np.bincount(order_ids, weights=quantities).astype(np.int64)[present]
+            amount_totals = np.bincount(order_ids, weights=line_amounts).astype(np.int64)[present]
+            return dict(zip(present.tolist(), zip(qty_totals.tolist(), amount_totals.tolist())))
+
+        totals = {}
+        for code, quantity, order_id in zip(self.codes, self.quantities, self.order_ids):
+            if not order_id:
+                continue
+            qty, amount = totals.get(order_id, (0, 0))
+            totals[order_id] = (qty + quantity, amount + quantity * prices[code])
+        return totals
+
+    def reference_diff(self, totals: List[int], reference: Dict[str, int]) -> List[Tuple[str, int, int, int]]:
+        """
+        與參考數據比對，回傳依品項名稱排序的 [(品項, 系統統計, 參考數據, 差異), ...]
+        totals 為 item_totals() 算出的各編碼總數量
+        """
+        live = [code for code in range(len(self.names)) if self.line_counts[code]]
+        names = [self.names[code] for code in live]
+        system = [totals[code] for code in live]
+        for item_name in reference:
+            code = self.code_of.get(item_name)
+            if code is None or not self.line_counts[code]:
+                names.append(item_name)
+                system.append(0)
+
+        ref = [reference.get(name, 0) for name in names]
+        if self.use_numpy and names:
+            diffs = (np.asarray(system, dtype=np.int64) - np.asarray(ref, dtype=np.int64)).tolist()
+        else:
+            diffs = [a - b for a, b in zip(system, ref)]
+
+        return sorted(zip(names, system, ref, diffs))
+
+
+class FenwickTree:
+    """
+    樹狀陣列（Binary Indexed Tree）：單點增減與前綴和都是 O(log n)
+    用來記錄每個訂單位置的展開支數，任一訂單的明細編號都能直接算出，不必整批重新編號
+    """
+
+    def __init__(self):
+        self.tree = [0]  # 1-based，tree[0] 不使用
+        self.values = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, value: int):
+        """在尾端加入一個位置"""
+        self.values.append(value)
+        i = len(self.values)
+        low = i - (i & -i)
+        # tree[i] 涵蓋 (low, i] 的總和
+        self.tree.append(value + self.prefix(i - 1) - self.prefix(low))
+
+    def extend(self, values: List[int]):
+        """在尾端一次加入多個位置（線性時間，只有跨越原有範圍的節點需要查前綴和）"""
+        old_count = len(self.values)
+        old_total = self.total()
+        self.values.extend(values)
+
+        running = [0]  # running[k] = 新加入前 k 個值的總和
+        for value in values:
+            running.append(running[-1] + value)
+
+        for i in range(old_count + 1, len(self.values) + 1):
+            low = i - (i & -i)
+            if low >= old_count:
+                self.tree.append(running[i - old_count] - running[low - old_count])
+            else:
+                self.tree.append(old_total - self.prefix(low) + running[i - old_count])
+
+    def add(self, position: int, delta: int):
+        """第 position 個位置（從 0 起）增減 delta"""
+        self.values[position] += delta
+        i = position + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, count: int) -> int:
+        """前 count 個位置的總和"""
+        total = 0
+        i = count
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self) -> int:
+        return self.prefix(len(self.values))
+
+
+class StageMetrics:
+    """
+    各處理階段的計時與計數（使用單調時鐘，常駐開啟也幾乎沒有負擔）
+    - stages：階段名稱 -> {'calls', 'seconds', 'bytes'}；巢狀呼叫的時間會同時算進外層階段
+    - counters：讀取行數、訂單數、展開支數、人物解析快取命中等累計數字
+    """
+
+    # 狀態列摘要顯示的階段與名稱
+    SUMMARY_LABELS = (
+        ('load_data', '載入'),
+        ('expand_orders', '展開'),
+        ('compare_with_reference', '比對'),
+        ('render_report', '報表'),
+    )
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = defaultdict(int)
+
+    def _stage(self, name: str) -> Dict:
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {'calls': 0, 'seconds': 0.0, 'bytes': 0}
+        return entry
+
+    def record(self, name: str, seconds: float, rendered=None):
+        """記錄一次階段執行；rendered 為該階段輸出的字串或 bytes"""
+        entry = self._stage(name)
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        if isinstance(rendered, str):
+            entry['bytes'] += len(rendered.encode('utf-8'))
+        elif isinstance(rendered, bytes):
+            entry['bytes'] += len(rendered)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def to_dict(self) -> Dict:
+        """結構化的指標資料（可直接 JSON 序列化）"""
+        cache = parse_person.cache_info()
+        return {
+            'stages': {name: dict(entry) for name, entry in self.stages.items()},
+            'counters': dict(self.counters),
+            'person_cache': {'hits': cache.hits, 'misses': cache.misses,
+                             'size': cache.currsize, 'max_size': cache.maxsize},
+        }
+
+    def summary(self) -> str:
+        """一行文字摘要（給狀態列顯示），例如：載入 0.012s • 報表 0.031s"""
+        parts = [f"{label} {self.stages[name]['seconds']:.3f}s"
+                 for name, label in self.SUMMARY_LABELS if name in self.stages]
+        return ' • '.join(parts)
+
+    def write_log(self, path: str, **context):
+        """以 JSON Lines 格式附加到紀錄檔（一次處理一行，方便追蹤趨勢）"""
+        entry = {'time': datetime.now().isoformat(timespec='seconds')}
+        entry.update(context)
+        entry.update(self.to_dict())
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def _timed_stage(name: str, rendered: bool = False):
+    """把方法的執行時間記到 self.metrics；rendered=True 時一併記錄輸出大小"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            self.metrics.record(name, time.perf_counter() - started, result if rendered else None)
+            return result
+        return wrapper
+    return decorator
+
+
+def estimate_size(obj, seen: set = None) -> int:
+    """
+    估計物件（含內部容器與字串）佔用的位元組數，同一物件只算一次
+    傳入共用的 seen 時，已在其他結構算過的物件不再重複計算
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, '__dict__') and not isinstance(current, type):
+            stack.append(vars(current))
+    return total
+
+
+class MemoryTrace:
+    """
+    用 tracemalloc 量測一段程式新配置的記憶體（結束時仍保留的量與過程中的峰值）
+    例如：with MemoryTrace() as trace: formatter.load_data(text)
+    """
+
+    def __init__(self):
+        self.allocated = 0
+        self.peak = 0
+        self._started = False
+        self._base = 0
+
+    def __enter__(self) -> 'MemoryTrace':
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._base = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        current, peak = tracemalloc.get_traced_memory()
+        self.allocated = current - self._base
+        self.peak = max(0, peak - self._base)
+        if self._started:
+            tracemalloc.stop()
+        return False
+
+
+class RowTemplate:
+    """
+    編譯過的單列範本：把 {欄位} 範本轉成一個 % 格式字串與取值函式，
+    逐列套用時不再解析範本，例如 RowTemplate("{index}\t{item}").render_lines(rows)
+    欄位可以是 dict 的鍵（{item}）或 tuple 的位置（{0}）
+    allowed 指定可用的欄位名稱時，其他欄位丟出 ValueError（使用者自訂的範本，例如標籤）
+    """
+
+    def __init__(self, source: str, allowed: Optional[Sequence[str]] = None, name: str = '範本'):
+        parts = []
+        fields = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            parts.append(literal.replace('%', '%%'))
+            if field is None:
+                continue
+            if allowed is not None and field not in allowed:
+                raise ValueError(f"{name}有未知的欄位：{{{field}}}（可用：{', '.join(allowed)}）")
+            if spec or conversion:
+                raise ValueError(f"{name}欄位不支援格式設定：{{{field}}}")
+            parts.append('%s')
+            # {0}、{1} 取序列的位置，其他名稱取 dict 的鍵
+            fields.append(int(field) if field.isdigit() else field)
+
+        self.source = source
+        self.fields = tuple(fields)
+        self._format = ''.join(parts)
+        if len(fields) == 1:
+            getter = operator.itemgetter(fields[0])
+            self._values = lambda row: (getter(row),)
+        elif fields:
+            self._values = operator.itemgetter(*fields)
+        else:
+            self._values = lambda row: ()
+
+    def render(self, row) -> str:
+        return self._format % self._values(row)
+
+    def render_lines(self, rows: Iterable, separator: str = '\n') -> str:
+        """套用到每一列並以 separator 串接"""
+        fmt = self._format
+        values = self._values
+        return separator.join([fmt % values(row) for row in rows])
 
 
 class OrderFormatter:
     # 價目表
+    # 單行長度上限、單次載入的解析時間上限（秒）與可疑數量門檻，超過時記錄到 diagnostics
+    max_line_length = MAX_LINE_LENGTH
+    parse_time_budget = PARSE_TIME_BUDGET
+    suspicious_quantity = SUSPICIOUS_QUANTITY
+
     PRICE_LIST = {
         '大鬼鎖心': 220,
         '雙色直立燕通': 300,
@@ -50,12 +1200,49 @@ class OrderFormatter:
         '死纏爛打燭': 320
     }
 
-    def __init__(self):
-        self.orders = []
-        self.expanded_orders = []
+    # 報表各區段的列範本（編譯一次，逐列只做一次 % 格式化）
+    DETAIL_BLOCK = RowTemplate("{index}\n{item}\n{main_person}\n{target_person}\n{wish}\n")
+    DETAIL_LINE = RowTemplate("{index}\t{item}\t{main_person}\t{target_person}\t{wish}")
+    STATISTICS_ROW = RowTemplate("| {0} | {1} | ${2} | ${3} |")
+    PLAIN_STATISTICS_ROW = RowTemplate("{0}\t{1}\t${2}\t${3}")
+    COMPARISON_ROW = RowTemplate("| {0} | {1} | {2} | {3} | {4} |")
+    ANOMALY_ROW = RowTemplate("| {0} | {1} | {2} | {3} | 重複品項：{4} | {5} |")
+    DIAGNOSTIC_ROW = RowTemplate("| {0} | {1} | {2} |")
+    SUMMARY = RowTemplate(
+        "\n# 📈 報表摘要\n\n"
+        "- **生成時間**：{time}\n"
+        "- **總訂單數**：{orders} 筆\n"
+        "- **總品項數**（展開後）：{units} 支\n"
+        "- **品項種類數**：{item_types} 種\n"
+        "- **總金額**：${total_amount}\n"
+        "- **異常訂單數**：{anomalies} 筆"
+    )
+
+    def __init__(self, use_numpy: Optional[bool] = None):
+        self._slots = []        # 訂單位置 -> 訂單（移除後為 None，位置不重複使用）
+        self._slot_rows = []    # 訂單位置 -> 該訂單的展開明細
+        self._slot_spans = []   # 訂單位置 -> 在欄式儲存中的範圍 (start, end)
+        self._slot_of = {}      # 訂單編號 -> 訂單位置
+        self._units = FenwickTree()  # 各訂單位置的展開支數（明細編號 = 前綴和 + 1）
+        self._orders = []       # orders 快取（移除訂單後延遲重建）
+        self._expanded = []     # expanded_orders 快取（支數變動後延遲重新編號）
+        self._next_order_index = 1
         self.item_stats = defaultdict(int)
         self.item_amounts = defaultdict(int)  # 新增：各品項總金額
         self.anomalies = []
+        self._diagnostics = {}  # 訂單編號（不屬於任何訂單時為 None）-> [(排序鍵, 診斷訊息)]
+        self._diagnostic_count = 0  # 已加入的診斷訊息數（行號相同時維持加入順序）
+        self._diagnostic_list = []  # diagnostics 快取（有變動後第一次讀取時才重建）
+        self.batch = datetime.now().strftime('%Y-%m-%d')  # 批次標籤（預設為載入日期）
+        self.cube = AggregationCube()  # 品項 × 人物 × 對象 × 批次 的多維彙總
+        self.columns = ItemColumns(use_numpy)  # 品項編碼、數量、訂單編號的欄式儲存
+        self._index = None  # 展開明細的倒排索引（第一次查詢時建立）
+        self.metrics = StageMetrics()  # 各階段耗時與計數
+        self.memory_traces = {}  # trace_memory() 量測到的記憶體配置
+        self.data_version = 0  # 訂單資料每次變動加一
+        self._sections = {}  # 報表區段名稱 -> (資料版本與參考數據摘要, 渲染結果)
+        self._ids = {}  # 訂單識別碼 -> 訂單編號
+        self._id_counts = {}  # 內容雜湊 -> 已用到第幾次出現
 
     def parse_order(self, parts: List[str], index: int) -> Dict:
         """解析單筆訂單資料"""
@@ -68,9 +1255,14 @@ class OrderFormatter:
             'raw_items': parts[0] if len(parts) > 0 else '',
             'main_person': parts[1] if len(parts) > 1 else '',
             'target_person': parts[2] if len(parts) > 2 else '—',
-            'wish': parts[3] if len(parts) > 3 else ''
+            'wish': parts[3] if len(parts) > 3 else '',
+            'batch': self.batch
         }
 
+        # 正規化人物資料，讓同一客人的不同寫法可以對應起來
+        order['main_info'] = parse_person(order['main_person'])
+        order['target_info'] = parse_person(order['target_person'])
+
         return order
 
     def extract_items(self, items_str: str) -> List[Tuple[str, int]]:
@@ -93,19 +1285,16 @@ class OrderFormatter:
                 continue
 
             # 方法1：優先匹配帶符號的格式 "品項名稱[xX×*]N"
-            match = re.search(r'(.+?)\s*[xX×*]\s*(\d+)', part)
-            if match:
-                item_name = match.group(1).strip()
-                quantity = int(match.group(2))
-                items.append((item_name, quantity))
+            parsed = _marked_quantity(part)
+            if parsed:
+                items.append(parsed)
                 continue
 
             # 方法2：匹配純空格分隔格式 "品項名稱 N"
             # 限制：數字必須是1-3位（避免把日期等當成數量）
-            match = re.search(r'(.+?)\s+(\d{1,3})$', part)
-            if match:
-                item_name = match.group(1).strip()
-                quantity = int(match.group(2))
+            parsed = _spaced_quantity(part)
+            if parsed:
+                item_name, quantity = parsed
                 # 額外檢查：品項名稱不能為空，數量要合理（1-999）
                 if item_name and 1 <= quantity <= 999:
                     items.append((item_name, quantity))
@@ -116,6 +1305,58 @@ class OrderFormatter:
 
         return items
 
+    def order_signature(self, order: Dict, items: List[Tuple[str, int]] = None) -> Tuple[str, str, str, str]:
+        """
+        正規化後的訂單內容 (品項, 主要人物, 對象, 願望)
+        品項依名稱排序並合併數量（鬼王x1+鬼王x1 與 鬼王x2 相同），人物使用 PersonInfo.key
+        """
+        if items is None:
+            items = self.extract_items(order['raw_items'])
+        if len(items) == 1:
+            items_key = f"{items[0][0]}x{items[0][1]}"
+        else:
+            quantities = defaultdict(int)
+            for item_name, quantity in items:
+                quantities[item_name] += quantity
+            items_key = '+'.join(f"{name}x{quantities[name]}" for name in sorted(quantities))
+        return (items_key, order['main_info'].key, order['target_info'].key, normalize_wish(order['wish']))
+
+    def _assign_id(self, order: Dict, items: List[Tuple[str, int]]):
+        """
+        依內容指定訂單識別碼：同樣的訂單不論哪天、從哪份匯出載入都得到相同的識別碼
+        批次中同樣內容出現多次時依序為 <雜湊>、<雜湊>-2、<雜湊>-3……；修改後內容不變則沿用原本的識別碼
+        """
+        base = hashlib.blake2b('\x1f'.join(self.order_signature(order, items)).encode('utf-8'),
+                               digest_size=ORDER_ID_BYTES).hexdigest()
+        self._claim_id(order, base)
+
+    def _claim_id(self, order: Dict, base: str = None):
+        """登記訂單識別碼；原本的識別碼已被其他訂單使用時（例如合併批次）改用下一個出現次數"""
+        previous = order.get('id')
+        base = base or previous.split('-')[0]
+        if previous is None and base not in self._ids:
+            # 最常見的情形：第一次載入、內容沒有重複
+            self._id_counts.setdefault(base, 1)
+            order_id = base
+        elif previous and previous.split('-')[0] == base and previous not in self._ids:
+            order_id = previous
+            occurrence = int(previous.split('-')[1]) if '-' in previous else 1
+            self._id_counts[base] = max(self._id_counts.get(base, 0), occurrence)
+        else:
+            # 雜湊本身沒被使用時直接用（例如改回原本的內容），否則從目前用到的次數往後找
+            occurrence = 1 if base not in self._ids else self._id_counts.get(base, 0) + 1
+            order_id = base if occurrence == 1 else f"{base}-{occurrence}"
+            while order_id in self._ids:
+                occurrence += 1
+                order_id = f"{base}-{occurrence}"
+            self._id_counts[base] = occurrence
+        self._ids[order_id] = order['index']
+        order['id'] = order_id
+
+    def find_order_id(self, order_id: str) -> Optional[int]:
+        """依訂單識別碼找訂單編號（不存在時回傳 None）"""
+        return self._ids.get(order_id)
+
     def check_duplicate_items(self, items: List[Tuple[str, int]]) -> List[str]:
         """檢查同一訂單中是否有重複品項"""
         item_counts = defaultdict(int)
@@ -125,60 +1366,506 @@ class OrderFormatter:
         duplicates = [name for name, count in item_counts.items() if count > 1]
         return duplicates
 
+    @_timed_stage('expand_orders')
     def expand_orders(self):
-        """將訂單按品項數量展開成明細"""
-        expanded_index = 1
+        """將尚未展開的訂單按品項數量展開成明細"""
+        # 新載入的訂單都在最後面，明細編號接續目前的總支數
+        expanded_index = self._units.total() + 1
+        items_parsed = 0
+        units_before = expanded_index
+
+        for slot, order in enumerate(self._slots):
+            if order is None or self._slot_rows[slot] is not None:
+                continue
 
-        for order in self.orders:
-            items = self.extract_items(order['raw_items'])
+            items, rows = self._expand_slot(slot, expanded_index)
+            items_parsed += len(items)
+            expanded_index += len(rows)
+            if self._expanded is not None:
+                self._expanded.extend(rows)
 
-            # 檢查異常（重複品項）
-            duplicates = self.check_duplicate_items(items)
-            if duplicates:
-                item_total = {}
-                for item_name, qty in items:
-                    if item_name in item_total:
-                        item_total[item_name] += qty
-                    else:
-                        item_total[item_name] = qty
+        self.metrics.count('items_parsed', items_parsed)
+        self.metrics.count('units_expanded', expanded_index - units_before)
+        self.metrics.count('anomalies', len(self.anomalies))
+
+
+        # 統計品項總數與金額
+        self._refresh_item_stats()
+
+        # 明細已變動，舊索引作廢
+        self._touch()
+
+    def _touch(self):
+        """訂單資料有變動：作廢倒排索引並遞增資料版本（已渲染的報表區段隨之失效）"""
+        self._index = None
+        self.data_version += 1
+
+    def _find_anomaly(self, order: Dict, items: List[Tuple[str, int]]) -> Optional[Dict]:
+        """檢查異常（重複品項），沒有異常時回傳 None"""
+        duplicates = self.check_duplicate_items(items)
+        if not duplicates:
+            return None
+
+        item_total = {}
+        for item_name, qty in items:
+            if item_name in item_total:
+                item_total[item_name] += qty
+            else:
+                item_total[item_name] = qty
+
+        return {
+            'original_index': order['index'],
+            'items': order['raw_items'],
+            'main_person': order['main_person'],
+            'target_person': order['target_person'],
+            'duplicates': duplicates,
+            'item_totals': item_total
+        }
 
-                self.anomalies.append({
-                    'original_index': order['index'],
-                    'items': order['raw_items'],
+    def _expand_slot(self, slot: int, first_index: int) -> Tuple[List[Tuple[str, int]], List[Dict]]:
+        """
+        展開單一訂單位置：寫入欄式儲存、多維彙總、異常清單與樹狀陣列
+        回傳（品項, 展開明細），明細編號從 first_index 起算
+        """
+        order = self._slots[slot]
+        items = self.extract_items(order['raw_items'])
+        self._assign_id(order, items)
+
+        anomaly = self._find_anomaly(order, items)
+        if anomaly:
+            self._insert_anomaly(anomaly)
+
+        if not order['main_info'].birthday:
+            self._order_diagnostic(order, 'missing_birthday', f"主要人物沒有可辨識的生日：{order['main_person'][:30]}")
+
+        start = len(self.columns)
+        rows = []
+        for item_name, quantity in items:
+            # 記錄到欄式儲存（統計在全部展開後一次向量化計算）
+            self.columns.append(item_name, quantity, order['index'])
+
+            # 計算金額（從價目表中查詢）
+            price = self.PRICE_LIST.get(item_name)
+            if price is None:
+                price = 0
+                self._order_diagnostic(order, 'unknown_item', f"品項「{item_name[:30]}」不在價目表，金額以 $0 計算")
+            if quantity == 0 or quantity > self.suspicious_quantity:
+                self._order_diagnostic(order, 'suspicious_quantity', f"品項「{item_name[:30]}」數量 {quantity}，請確認")
+
+            # 同步累加多維彙總
+            self.cube.add(item_name, order['main_info'].key, order['target_info'].key,
+                          order['batch'], quantity, price * quantity, order['index'])
+
+            # 為每個數量創建一筆明細
+            for _ in range(quantity):
+                rows.append({
+                    'index': first_index + len(rows),
+                    'order_index': order['index'],
+                    'item': item_name,
+                    'price': price,
                     'main_person': order['main_person'],
                     'target_person': order['target_person'],
-                    'duplicates': duplicates,
-                    'item_totals': item_total
+                    'wish': order['wish']
                 })
 
-            # 展開每個品項
-            for item_name, quantity in items:
-                # 統計品項總數
-                self.item_stats[item_name] += quantity
+        self._slot_rows[slot] = rows
+        self._slot_spans[slot] = (start, len(self.columns))
+        self._units.add(slot, len(rows))
+        return items, rows
+
+    @property
+    def diagnostics(self) -> List[Diagnostic]:
+        """
+        解析時的診斷訊息（略過的行、未知品項、缺少生日等），依行號排序（沒有行號的排最後）
+        依訂單分組保存，修改或移除單筆訂單時不必掃描全部；有變動後第一次讀取時才合併排序
+        """
+        if self._diagnostic_list is None:
+            entries = [entry for bucket in self._diagnostics.values() for entry in bucket]
+            entries.sort(key=operator.itemgetter(0))
+            self._diagnostic_list = [diagnostic for _, diagnostic in entries]
+        return self._diagnostic_list
+
+    def _add_diagnostic(self, diagnostic: Diagnostic):
+        """加入一則診斷訊息（依所屬訂單分組）"""
+        key = (not diagnostic.line, diagnostic.line, self._diagnostic_count)
+        self._diagnostic_count += 1
+        bucket = self._diagnostics.get(diagnostic.order_index)
+        if bucket is None:
+            bucket = self._diagnostics[diagnostic.order_index] = []
+        bucket.append((key, diagnostic))
+        self._diagnostic_list = None
+
+    def _order_diagnostic(self, order: Dict, kind: str, message: str, attach: bool = True):
+        """
+        記錄與某筆訂單相關的診斷訊息（附上訂單在原文中的行號範圍）
+        attach 為 False 時不綁定訂單編號（訂單已移除，訊息要保留）
+        """
+        first, last = order.get('lines', (0, 0))
+        where = f"第 {first} 行" if first == last else f"第 {first}-{last} 行"
+        prefix = f"{where}（訂單 #{order['index']}）" if first else f"訂單 #{order['index']}"
+        self._add_diagnostic(Diagnostic(first, kind, f"{prefix}：{message}", last,
+                                        order['index'] if attach else None))
 
-                # 計算金額（從價目表中查詢）
-                price = self.PRICE_LIST.get(item_name, 0)
-                self.item_amounts[item_name] += price * quantity
-
-                # 為每個數量創建一筆明細
-                for _ in range(quantity):
-                    expanded = {
-                        'index': expanded_index,
-                        'item': item_name,
-                        'price': price,
-                        'main_person': order['main_person'],
-                        'target_person': order['target_person'],
-                        'wish': order['wish']
-                    }
-                    self.expanded_orders.append(expanded)
+    def _retract_slot(self, slot: int, prune: bool = True):
+        """
+        把單一訂單位置的貢獻從統計、多維彙總、欄式儲存與異常清單中扣回
+        prune 為 False 時由呼叫端一次清掉多筆訂單的異常與診斷訊息
+        """
+        order = self._slots[slot]
+        start, end = self._slot_spans[slot]
+
+        for code, quantity in self.columns.clear_span(start, end):
+            item_name = self.columns.names[code]
+            price = self.PRICE_LIST.get(item_name, 0)
+            self.cube.remove(item_name, order['main_info'].key, order['target_info'].key,
+                             order['batch'], quantity, price * quantity, order['index'])
+            if self.columns.is_live(code):
+                self.item_stats[item_name] -= quantity
+                self.item_amounts[item_name] -= price * quantity
+            else:
+                # 這個品項已沒有任何訂單，從統計中移除
+                self.item_stats.pop(item_name, None)
+                self.item_amounts.pop(item_name, None)
+
+        if prune:
+            self._prune_orders({order['index']})
+
+        self._ids.pop(order.get('id'), None)
+        self._units.add(slot, -len(self._slot_rows[slot]))
+        self._slot_rows[slot] = None
+        self._slot_spans[slot] = (0, 0)
+
+    def _prune_orders(self, order_indices: set):
+        """清掉這些訂單的異常與診斷訊息"""
+        if len(order_indices) == 1:
+            # 單筆修改：異常清單依訂單編號排序，二分搜尋即可
+            order_index = next(iter(order_indices))
+            position = self._anomaly_position(order_index)
+            end = position
+            while end < len(self.anomalies) and self.anomalies[end]['original_index'] == order_index:
+                end += 1
+            del self.anomalies[position:end]
+        elif any(a['original_index'] in order_indices for a in self.anomalies):
+            self.anomalies = [a for a in self.anomalies if a['original_index'] not in order_indices]
+        for order_index in order_indices:
+            if self._diagnostics.pop(order_index, None) is not None:
+                self._diagnostic_list = None
+
+    def _apply_item_delta(self, items: List[Tuple[str, int]]):
+        """把新展開訂單的品項直接加進統計（不重算全部）"""
+        for item_name, quantity in items:
+            self.item_stats[item_name] += quantity
+            self.item_amounts[item_name] += self.PRICE_LIST.get(item_name, 0) * quantity
+
+    def _insert_anomaly(self, anomaly: Dict):
+        """依訂單編號順序插入異常訂單"""
+        position = self._anomaly_position(anomaly['original_index'] + 1)
+        self.anomalies.insert(position, anomaly)
+
+    def _anomaly_position(self, order_index: int) -> int:
+        """異常清單中第一筆訂單編號 >= order_index 的位置"""
+        low, high = 0, len(self.anomalies)
+        while low < high:
+            middle = (low + high) // 2
+            if self.anomalies[middle]['original_index'] < order_index:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _add_slot(self, order: Dict) -> int:
+        """在尾端加入一個訂單位置（尚未展開）"""
+        slot = len(self._slots)
+        self._slots.append(order)
+        self._slot_rows.append(None)
+        self._slot_spans.append((0, 0))
+        self._units.append(0)
+        self._slot_of[order['index']] = slot
+        self._next_order_index = max(self._next_order_index, order['index'] + 1)
+        if self._orders is not None:
+            self._orders.append(order)
+        return slot
+
+    def _slot(self, order_index: int) -> int:
+        slot = self._slot_of.get(order_index)
+        if slot is None:
+            raise KeyError(f"找不到訂單編號 {order_index}")
+        return slot
+
+    @property
+    def orders(self) -> List[Dict]:
+        """目前所有訂單（依加入順序）；移除訂單後第一次讀取時才重建"""
+        if self._orders is None:
+            self._orders = [order for order in self._slots if order is not None]
+        return self._orders
+
+    @property
+    def expanded_orders(self) -> List[Dict]:
+        """展開明細；訂單支數變動後第一次讀取時才重新編號"""
+        if self._expanded is None:
+            rows = []
+            for slot_rows in self._slot_rows:
+                if slot_rows:
+                    rows.extend(slot_rows)
+            for number, row in enumerate(rows, start=1):
+                row['index'] = number
+            self._expanded = rows
+        return self._expanded
+
+    def get_order(self, order_index: int) -> Dict:
+        """依訂單編號取得訂單（找不到時丟出 KeyError）"""
+        return self._slots[self._slot(order_index)]
+
+    def expanded_range(self, order_index: int) -> Tuple[int, int]:
+        """
+        訂單目前對應的明細編號範圍（首, 尾），不需重建整份明細
+        例如第 3 筆訂單展開 2 支、前面共 5 支時回傳 (6, 7)；沒有明細時尾 < 首
+        """
+        slot = self._slot(order_index)
+        first = self._units.prefix(slot) + 1
+        return first, first + self._units.values[slot] - 1
+
+    def add_order(self, raw_items: str, main_person: str, target_person: str = '—', wish: str = '') -> Dict:
+        """
+        新增一筆訂單（編號接續目前最大編號），只計算這筆訂單的增量
+        例如：formatter.add_order('鬼王x2', '王小明 1990/5/20', wish='願望：事業順利')
+        """
+        order = self.parse_order([raw_items, main_person, target_person or '—', wish], self._next_order_index)
+        slot = self._add_slot(order)
+
+        items, rows = self._expand_slot(slot, self._units.total() + 1)
+        self._apply_item_delta(items)
+        if self._expanded is not None:
+            self._expanded.extend(rows)
+        self._touch()
+        return order
+
+    def remove_order(self, order_index: int) -> Dict:
+        """移除一筆訂單並扣回統計，回傳被移除的訂單；後面的明細編號在下次讀取時自動往前遞補"""
+        return self.remove_orders([order_index])[0]
+
+    def remove_orders(self, order_indices: Iterable[int]) -> List[Dict]:
+        """一次移除多筆訂單（異常與診斷訊息只掃描一次），回傳被移除的訂單"""
+        slots = [self._slot(order_index) for order_index in order_indices]  # 先確認編號都存在
+        removed = []
+        for slot in slots:
+            order = self._slots[slot]
+            removed.append(order)
+            self._retract_slot(slot, prune=False)
+            self._slots[slot] = None
+            del self._slot_of[order['index']]
+        if removed:
+            self._prune_orders({order['index'] for order in removed})
+            self._orders = None
+            self._expanded = None
+            self._touch()
+        return removed
+
+    def mark_imported(self, seen: Dict[str, str], skip: bool = True) -> List[Dict]:
+        """
+        標出先前已匯入過的訂單，seen 為 {訂單識別碼: 先前匯入的說明}，回傳這些訂單
+        skip 為 True 時移除並記錄「重複匯入略過」，否則保留並記錄「已匯入過」提醒
+        """
+        duplicates = [order for order in self.orders if order.get('id') in seen]
+        if not duplicates:
+            return []
+        if skip:
+            self.remove_orders([order['index'] for order in duplicates])
+        for order in duplicates:
+            message = f"與先前匯入的訂單相同（{seen[order['id']]}）"
+            if skip:
+                self._order_diagnostic(order, 'reimport_skipped', message + "，已略過", attach=False)
+            else:
+                self._order_diagnostic(order, 'already_imported', message)
+        self._touch()
+        return duplicates
+
+    def update_order(self, order_index: int, raw_items: str = None, main_person: str = None,
+                     target_person: str = None, wish: str = None) -> Dict:
+        """
+        修改一筆訂單的欄位（未指定的欄位維持原值），只重算這筆訂單
+        例如：formatter.update_order(12, raw_items='鬼王x3')
+        """
+        slot = self._slot(order_index)
+        order = self._slots[slot]
+        old_rows = self._slot_rows[slot]
+
+        parts = [
+            order['raw_items'] if raw_items is None else raw_items,
+            order['main_person'] if main_person is None else main_person,
+            order['target_person'] if target_person is None else (target_person or '—'),
+            order['wish'] if wish is None else wish,
+        ]
+        self._retract_slot(slot)
+
+        # 沿用原本的訂單物件與批次標籤，orders 快取不需重建
+        updated = self.parse_order(parts, order_index)
+        updated['batch'] = order['batch']
+        order.update(updated)
+
+        first_index = self._units.prefix(slot) + 1
+        items, rows = self._expand_slot(slot, first_index)
+        self._apply_item_delta(items)
+
+        if self._expanded is not None:
+            if len(rows) == len(old_rows):
+                # 支數不變：直接替換這一段，後面的編號不受影響
+                self._expanded[first_index - 1:first_index - 1 + len(rows)] = rows
+            else:
+                self._expanded = None
+        self._touch()
+        return order
+
+    @_timed_stage('merge')
+    def merge(self, *others: 'OrderFormatter') -> 'OrderFormatter':
+        """
+        把其他已解析的批次依序併入（不重新解析），回傳 self
+        - 訂單編號依序接在後面，展開明細重新編號
+        - 品項統計、多維彙總相加，異常訂單與診斷訊息串接
+        合併具結合律：merge(merge(a, b), c) 與 merge(a, merge(b, c)) 結果相同
+        """
+        for other in others:
+            if other is self:
+                # 併入自己時先複製一份，否則一邊走訪一邊加入訂單永遠不會結束
+                other = merge_formatters(self)
+            offset = self._next_order_index - 1
+            expanded_index = self._units.total() + 1
+            unit_counts = []
+
+            for slot, order in enumerate(other._slots):
+                if order is None or other._slot_rows[slot] is None:
+                    continue
+
+                order = dict(order)
+                order['index'] += offset
+                self._claim_id(order)
+                self._slot_of[order['index']] = len(self._slots)
+                self._slots.append(order)
+                if self._orders is not None:
+                    self._orders.append(order)
+
+                # 欄式儲存依品項名稱重新編碼
+                self._slot_spans.append(self.columns.extend_from(other.columns, *other._slot_spans[slot],
+                                                                 order['index']))
+
+                rows = []
+                for row in other._slot_rows[slot]:
+                    row = row.copy()
+                    row['index'] = expanded_index
+                    row['order_index'] = order['index']
+                    rows.append(row)
                     expanded_index += 1
+                self._slot_rows.append(rows)
+                unit_counts.append(len(rows))
+                if self._expanded is not None:
+                    self._expanded.extend(rows)
+
+            self._units.extend(unit_counts)
 
-    def load_data(self, data_text: str):
-        """載入訂單資料（支援多行格式和容錯處理）"""
-        lines = data_text.strip().split('\n')
+            for item_name, quantity in other.item_stats.items():
+                self.item_stats[item_name] += quantity
+            for item_name, amount in other.item_amounts.items():
+                self.item_amounts[item_name] += amount
+            self.cube.merge(other.cube, offset)
+
+            for anomaly in other.anomalies:
+                self._insert_anomaly(dict(anomaly, original_index=anomaly['original_index'] + offset))
+            for diagnostic in other.diagnostics:
+                if diagnostic.order_index is not None:
+                    diagnostic = diagnostic._replace(order_index=diagnostic.order_index + offset)
+                self._add_diagnostic(diagnostic)
+
+            self._next_order_index = offset + other._next_order_index
+
+        self._touch()
+        return self
+
+    def _refresh_item_stats(self):
+        """由欄式儲存重新計算 item_stats、item_amounts"""
+        totals, amounts = self.columns.item_totals(self.PRICE_LIST)
+        self.item_stats.clear()
+        self.item_amounts.clear()
+        for code, (item_name, total, amount) in enumerate(zip(self.columns.names, totals, amounts)):
+            if self.columns.is_live(code):
+                self.item_stats[item_name] = total
+                self.item_amounts[item_name] = amount
+
+    # memory_report 依序計算的結構（共用的字串只算在最先出現的結構）
+    MEMORY_STRUCTURES = ('orders', 'expanded_orders', 'item_stats', 'item_amounts', 'anomalies',
+                         'cube', 'columns', '_index', '_ids', 'metrics')
+
+    def trace_memory(self, name: str) -> MemoryTrace:
+        """
+        以 tracemalloc 量測一段處理，結果記在 memory_traces[name]
+        例如：with formatter.trace_memory('load'): formatter.load_data(text)
+        """
+        trace = MemoryTrace()
+        self.memory_traces[name] = trace
+        return trace
+
+    def memory_report(self, reports: Dict[str, str] = None) -> Dict:
+        """
+        估計各資料結構與報表字串佔用的位元組數（近似值，用於估算伺服器容量）
+        回傳 {'structures': {...}, 'reports': {...}, 'total_bytes': N, 'traced': {...}}
+        """
+        seen = set()
+        structures = {}
+        for name in self.MEMORY_STRUCTURES:
+            value = getattr(self, name)
+            if value is not None:
+                structures[name.lstrip('_')] = estimate_size(value, seen)
+
+        report_sizes = {name: estimate_size(text, seen) for name, text in (reports or {}).items()}
+        # 區段快取放在報表之後：與報表共用的字串算在報表
+        structures['sections'] = estimate_size(self._sections, seen)
+
+        return {
+            'structures': structures,
+            'reports': report_sizes,
+            'total_bytes': sum(structures.values()) + sum(report_sizes.values()),
+            'traced': {name: {'allocated': trace.allocated, 'peak': trace.peak}
+                       for name, trace in self.memory_traces.items()},
+        }
+
+    def order_totals(self) -> Dict[int, Tuple[int, int]]:
+        """各訂單的總支數與總金額 {訂單編號: (支數, 金額)}"""
+        return self.columns.order_totals(self.PRICE_LIST)
+
+    def build_index(self) -> ExpandedIndex:
+        """建立（或取得已建立的）展開明細倒排索引"""
+        if self._index is None:
+            self._index = ExpandedIndex(self.expanded_orders)
+        return self._index
+
+    def query(self, item: str = None, person: str = None, main: str = None,
+              target: str = None, wish: str = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        篩選展開明細，多個條件之間為「且」
+        - item：品項名稱，例如 "拆散"
+        - person：主要人物或對象任一符合，例如 "方譯緯"
+        - main / target：只比對主要人物 / 對象
+        - wish：願望關鍵字
+        例如：formatter.query(item='拆散', person='方譯緯')
+        """
+        positions = self.build_index().search(item=item, person=person, main=main,
+                                              target=target, wish=wish)
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.expanded_orders[p] for p in positions]
+
+    @_timed_stage('load_data')
+    def load_data(self, data_text: str, batch: str = None):
+        """載入訂單資料（支援多行格式和容錯處理），batch 為批次標籤（選填）"""
+        if batch:
+            self.batch = batch
+
+        # 只去掉結尾空白：開頭的空行也要保留，行號才會與原文一致
+        lines = data_text.rstrip().split('\n')
+        cache_before = parse_person.cache_info()
+        deadline = time.perf_counter() + self.parse_time_budget
 
         i = 0
-        order_index = 1
+        order_index = first_order_index = self._next_order_index
 
         while i < len(lines):
             line = lines[i].strip()
@@ -188,7 +1875,25 @@ class OrderFormatter:
                 i += 1
                 continue
 
+            # 過長的行不解析（可能是整段聊天紀錄），記錄後繼續處理下一行
+            if len(line) > self.max_line_length:
+                self._add_diagnostic(Diagnostic(
+                    i + 1, 'line_too_long',
+                    f"第 {i + 1} 行長度 {len(line)} 字，超過上限 {self.max_line_length} 字，已略過：{line[:30]}…"
+                ))
+                i += 1
+                continue
+
+            # 解析時間超過上限時停止，已解析的訂單照常輸出
+            if time.perf_counter() > deadline:
+                self._add_diagnostic(Diagnostic(
+                    i + 1, 'time_budget',
+                    f"解析超過 {self.parse_time_budget:g} 秒，第 {i + 1} 行之後（共 {len(lines) - i} 行）未處理"
+                ))
+                break
+
             # 首先嘗試用 Tab 分隔
+            first_line = i + 1
             parts = [p.strip() for p in line.split('\t') if p.strip()]
 
             # 情況1：如果 Tab 分隔後只有 1 個欄位，可能是空格分隔或多行訂單的開始
@@ -197,6 +1902,9 @@ class OrderFormatter:
 
                 # 跳過單獨的願望行（可能是上個訂單的遺漏部分）
                 if first_part.startswith('願望') or first_part.startswith('愿望'):
+                    self._add_diagnostic(Diagnostic(
+                        first_line, 'orphan_wish', f"第 {first_line} 行是沒有對應訂單的願望，已略過：{first_part[:30]}"
+                    ))
                     i += 1
                     continue
 
@@ -217,6 +1925,8 @@ class OrderFormatter:
                     if not next_line:
                         j += 1
                         continue
+                    if len(next_line) > self.max_line_length:
+                        break
 
                     # 如果下一行以願望開頭，添加後結束
                     if next_line.startswith('願望') or next_line.startswith('愿望'):
@@ -239,9 +1949,10 @@ class OrderFormatter:
             elif len(parts) < 4:
                 # 嘗試從後續行補充資料
                 j = i + 1
+                guessed = False  # 合併了願望以外的行（可能其實是下一筆訂單）
                 while len(parts) < 4 and j < len(lines):
                     next_line = lines[j].strip()
-                    if not next_line:
+                    if not next_line or len(next_line) > self.max_line_length:
                         break
 
                     # 檢查是否是新訂單的開始（包含品項格式）
@@ -249,196 +1960,268 @@ class OrderFormatter:
                         # 這是新訂單，不要合併
                         break
 
+                    guessed = guessed or not next_line.startswith(('願望', '愿望'))
                     parts.append(next_line)
                     i = j
                     j += 1
 
-            # 解析訂單
+                if guessed:
+                    merged = f"第 {i + 1} 行" if i == first_line else f"第 {first_line + 1}-{i + 1} 行"
+                    self._add_diagnostic(Diagnostic(
+                        first_line, 'merged_lines',
+                        f"第 {first_line} 行欄位不足，已與{merged}合併成一筆訂單，請確認", i + 1, order_index
+                    ))
+
+            # 解析訂單（行號範圍記在訂單上，展開時的診斷訊息會附上）
             order = self.parse_order(parts, order_index)
             if order:
-                self.orders.append(order)
+                order['lines'] = (first_line, i + 1)
+                self._add_slot(order)
                 order_index += 1
+            else:
+                self._add_diagnostic(Diagnostic(
+                    first_line, 'missing_field',
+                    f"第 {first_line} 行只有一個欄位（缺少姓名/生日），已略過：{parts[0][:30]}", i + 1
+                ))
 
             i += 1
 
-        # 自動展開訂單
+        cache_after = parse_person.cache_info()
+        self.metrics.count('lines_read', len(lines))
+        self.metrics.count('orders_parsed', order_index - first_order_index)
+        self.metrics.count('person_cache_hits', cache_after.hits - cache_before.hits)
+        self.metrics.count('person_cache_misses', cache_after.misses - cache_before.misses)
+
+        # 自動展開訂單（品項層級的檢查在展開時進行，不另外掃描）
         self.expand_orders()
+        self.metrics.count('diagnostics', len(self.diagnostics))
+
+    @_timed_stage('load_data')
+    def load_rows(self, rows: Iterable[Sequence[str]], batch: str = None, first_line: int = 1):
+        """
+        逐列載入已分好欄位的訂單（試算表、CSV），每列為 [品項, 主要人物, 對象, 願望]
+        rows 可以是產生器，不需要先組成整段文字；first_line 為第一列在來源檔中的列號（診斷訊息用）
+        """
+        if batch:
+            self.batch = batch
+
+        cache_before = parse_person.cache_info()
+        deadline = time.perf_counter() + self.parse_time_budget
+        order_index = first_order_index = self._next_order_index
+        rows_read = 0
+
+        for line, row in enumerate(rows, start=first_line):
+            rows_read += 1
+            parts = [(cell or '').strip() for cell in row[:4]]
+            if not any(parts):
+                continue
+
+            if time.perf_counter() > deadline:
+                self._add_diagnostic(Diagnostic(
+                    line, 'time_budget', f"解析超過 {self.parse_time_budget:g} 秒，第 {line} 列之後未處理"
+                ))
+                break
+
+            longest = max(len(part) for part in parts)
+            if longest > self.max_line_length:
+                self._add_diagnostic(Diagnostic(
+                    line, 'line_too_long',
+                    f"第 {line} 列有欄位長度 {longest} 字，超過上限 {self.max_line_length} 字，已略過"
+                ))
+                continue
+
+            if not parts[0] or len(parts) < 2 or not parts[1]:
+                self._add_diagnostic(Diagnostic(
+                    line, 'missing_field', f"第 {line} 列缺少品項或主要人物，已略過：{' / '.join(p for p in parts if p)[:30]}"
+                ))
+                continue
+
+            while len(parts) < 4:
+                parts.append('')
+            parts[2] = parts[2] or '—'
+            order = self.parse_order(parts, order_index)
+            order['lines'] = (line, line)
+            self._add_slot(order)
+            order_index += 1
+
+        cache_after = parse_person.cache_info()
+        self.metrics.count('lines_read', rows_read)
+        self.metrics.count('orders_parsed', order_index - first_order_index)
+        self.metrics.count('person_cache_hits', cache_after.hits - cache_before.hits)
+        self.metrics.count('person_cache_misses', cache_after.misses - cache_before.misses)
+
+        self.expand_orders()
+        self.metrics.count('diagnostics', len(self.diagnostics))
+
+    def _section(self, name: str, render, reference: str = None) -> str:
+        """
+        取得報表區段：資料版本（與 reference 的摘要）沒變時直接沿用上次的渲染結果
+        例如只改參考數據時，只有差異比對區段會重新渲染，明細不會
+        """
+        key = (self.data_version,)
+        if reference is not None:
+            key += (hashlib.blake2b(reference.encode('utf-8'), digest_size=16).digest(),)
+        cached = self._sections.get(name)
+        if cached is not None and cached[0] == key:
+            self.metrics.count('section_cache_hits')
+            return cached[1]
+        text = render()
+        self._sections[name] = (key, text)
+        self.metrics.count('section_cache_misses')
+        return text
+
+    def _statistics_rows(self) -> Tuple[List[Tuple[str, int, int, int]], int, int]:
+        """品項統計列 [(品項, 數量, 單價, 小計), ...]（依品項名稱排序）與總數量、總金額"""
+        rows = [
+            (item_name, quantity, self.PRICE_LIST.get(item_name, 0), self.item_amounts.get(item_name, 0))
+            for item_name, quantity in sorted(self.item_stats.items())
+        ]
+        return rows, sum(row[1] for row in rows), sum(row[3] for row in rows)
 
     def generate_dual_column_table(self) -> str:
         """生成訂單明細表（單欄格式，方便複製）"""
-        result = []
-        result.append("# 📋 訂單明細表\n")
-        result.append("**使用說明**：直接複製以下內容即可\n")
-        result.append("---\n")
-
-        # 單欄格式輸出
-        for order in self.expanded_orders:
-            result.append(f"{order['index']}")
-            result.append(f"{order['item']}")
-            result.append(f"{order['main_person']}")
-            result.append(f"{order['target_person']}")
-            result.append(f"{order['wish']}")
-            result.append("")  # 空行分隔每筆訂單
+        return self._section('details', self._render_dual_column_table)
 
-        return '\n'.join(result)
+    def _render_dual_column_table(self) -> str:
+        header = "# 📋 訂單明細表\n\n**使用說明**：直接複製以下內容即可\n\n---\n"
+        if not self.expanded_orders:
+            return header
+        # 每筆明細五行，之後空一行分隔
+        return header + '\n' + self.DETAIL_BLOCK.render_lines(self.expanded_orders)
 
+    @_timed_stage('render_details', rendered=True)
     def generate_plain_details(self) -> str:
         """生成純明細內容（不含標題，方便直接複製）"""
-        result = []
-
         # 橫向格式輸出，用 Tab 分隔，編號和品項分開
-        for order in self.expanded_orders:
-            line = f"{order['index']}\t{order['item']}\t{order['main_person']}\t{order['target_person']}\t{order['wish']}"
-            result.append(line)
-
-        return '\n'.join(result)
+        return self._section('plain_details', lambda: self.DETAIL_LINE.render_lines(self.expanded_orders))
 
     def generate_statistics(self) -> str:
         """生成品項統計表"""
-        result = []
-        result.append("\n# 📊 品項統計總表\n")
-        result.append("| 品項名稱 | 數量 | 單價 | 小計金額 |")
-        result.append("|----------|------|------|----------|")
-
-        # 按品項名稱排序
-        sorted_items = sorted(self.item_stats.items(), key=lambda x: x[0])
-
-        total_quantity = 0
-        total_amount = 0
-        for item_name, quantity in sorted_items:
-            price = self.PRICE_LIST.get(item_name, 0)
-            amount = self.item_amounts.get(item_name, 0)
-            result.append(f"| {item_name} | {quantity} | ${price} | ${amount} |")
-            total_quantity += quantity
-            total_amount += amount
-
+        return self._section('statistics', self._render_statistics)
+
+    def _render_statistics(self) -> str:
+        rows, total_quantity, total_amount = self._statistics_rows()
+        result = [
+            "\n# 📊 品項統計總表\n",
+            "| 品項名稱 | 數量 | 單價 | 小計金額 |",
+            "|----------|------|------|----------|",
+        ]
+        if rows:
+            result.append(self.STATISTICS_ROW.render_lines(rows))
         result.append(f"| **總計** | **{total_quantity}** | - | **${total_amount}** |")
-
         return '\n'.join(result)
 
+    def generate_group_statistics(self, *dims: str) -> str:
+        """
+        生成分組統計表（Markdown），維度可選 item / main / target / batch
+        例如：generate_group_statistics('item', 'main') -> 品項 × 客人
+        """
+        labels = ' × '.join(AggregationCube.DIMENSION_LABELS[d] for d in dims)
+        return f"\n# 📊 分組統計（{labels}）\n\n" + self.cube.render_markdown(*dims)
+
+    @_timed_stage('render_statistics', rendered=True)
     def generate_plain_statistics(self) -> str:
         """生成純品項統計內容（Tab分隔格式，方便複製到Excel）"""
-        result = []
+        return self._section('plain_statistics', self._render_plain_statistics)
 
-        # 按品項名稱排序
-        sorted_items = sorted(self.item_stats.items(), key=lambda x: x[0])
+    def _render_plain_statistics(self) -> str:
+        rows, total_quantity, total_amount = self._statistics_rows()
+        total = f"總計\t{total_quantity}\t-\t${total_amount}"
+        if not rows:
+            return total
+        return self.PLAIN_STATISTICS_ROW.render_lines(rows) + '\n' + total
 
-        total_quantity = 0
-        total_amount = 0
-        for item_name, quantity in sorted_items:
-            price = self.PRICE_LIST.get(item_name, 0)
-            amount = self.item_amounts.get(item_name, 0)
-            result.append(f"{item_name}\t{quantity}\t${price}\t${amount}")
-            total_quantity += quantity
-            total_amount += amount
-
-        result.append(f"總計\t{total_quantity}\t-\t${total_amount}")
-
-        return '\n'.join(result)
+    def reference_differences(self, reference_data: Union[str, Dict[str, int]]) -> List[Tuple[str, int, int, int]]:
+        """
+        與參考數據逐品項比對，回傳 [(品項, 系統統計, 參考數據, 差異), ...]（依品項名稱排序）
+        差異以向量方式一次算出
+        """
+        if isinstance(reference_data, str):
+            reference_data = parse_reference_data(reference_data)
+        totals = [self.item_stats.get(name, 0) for name in self.columns.names]
+        return self.columns.reference_diff(totals, reference_data)
 
+    @_timed_stage('compare_with_reference', rendered=True)
     def compare_with_reference(self, reference_data: str) -> str:
-        """與參考數據比對"""
-        result = []
-        result.append("\n# 🔍 數量差異比對表\n")
-
-        # 解析參考數據
-        reference = {}
-
-        # 支援換行或逗號分隔
-        parts = re.split(r'[\n、,，]', reference_data)
-
-        for part in parts:
-            part = part.strip()
-            if not part:
-                continue
-
-            # 嘗試匹配「品項+x+數量」格式（例如：三鬼頭x121 或 三鬼頭 x 121）
-            match = re.search(r'^(.+?)\s*[xX×*]\s*(\d+)$', part)
-            if match:
-                item_name = match.group(1).strip()
-                quantity = int(match.group(2))
-                reference[item_name] = quantity
-                continue
-
-            # 嘗試匹配「數量+支+品項」格式（例如：87支鬼王）
-            match = re.search(r'^(\d+)\s*支\s*(.+)$', part)
-            if match:
-                quantity = int(match.group(1))
-                item_name = match.group(2).strip()
-                reference[item_name] = quantity
-                continue
-
-            # 嘗試匹配「品項+數量+支」格式（例如：鬼王 87 支）
-            match = re.search(r'^(.+?)\s*(\d+)\s*支?$', part)
-            if match:
-                item_name = match.group(1).strip()
-                quantity = int(match.group(2))
-                reference[item_name] = quantity
-                continue
-
-        result.append("| 品項名稱 | 系統統計 | 參考數據 | 差異 | 狀態 |")
-        result.append("|----------|----------|----------|------|------|")
-
-        # 比對所有品項
-        all_items = set(self.item_stats.keys()) | set(reference.keys())
+        """與參考數據比對（只依賴統計與參考數據，參考數據改變時只重新渲染這一段）"""
+        return self._section('comparison', lambda: self._render_comparison(reference_data), reference_data)
 
+    def _render_comparison(self, reference_data: str) -> str:
+        rows = []
         has_difference = False
-        for item_name in sorted(all_items):
-            system_qty = self.item_stats.get(item_name, 0)
-            ref_qty = reference.get(item_name, 0)
-            diff = system_qty - ref_qty
-            status = "✅ 相符" if diff == 0 else "⚠️ 不符"
-
+        for item_name, system_qty, ref_qty, diff in self.reference_differences(reference_data):
             if diff != 0:
                 has_difference = True
-
             diff_str = f"+{diff}" if diff > 0 else str(diff)
-            result.append(f"| {item_name} | {system_qty} | {ref_qty} | {diff_str} | {status} |")
-
+            status = "✅ 相符" if diff == 0 else "⚠️ 不符"
+            rows.append((item_name, system_qty, ref_qty, diff_str, status))
+
+        result = [
+            "\n# 🔍 數量差異比對表\n",
+            "| 品項名稱 | 系統統計 | 參考數據 | 差異 | 狀態 |",
+            "|----------|----------|----------|------|------|",
+        ]
+        if rows:
+            result.append(self.COMPARISON_ROW.render_lines(rows))
         if not has_difference:
             result.append("\n**✅ 所有品項數量完全相符！**")
         else:
             result.append("\n**⚠️ 發現數量差異，請檢查！**")
-
         return '\n'.join(result)
 
     def generate_anomaly_report(self) -> str:
         """生成異常訂單報告"""
+        return self._section('anomalies', self._render_anomaly_report)
+
+    def _render_anomaly_report(self) -> str:
         if not self.anomalies:
             return "\n# ✅ 異常訂單檢測\n\n**未發現異常訂單！**\n"
 
-        result = []
-        result.append("\n# ⚠️ 異常訂單明細\n")
-        result.append(f"**共發現 {len(self.anomalies)} 筆異常訂單**\n")
-        result.append("| 編號 | 品項 | 主要人物 | 對象 | 問題說明 | 各品項數量 |")
-        result.append("|------|------|----------|------|----------|------------|")
-
-        for anomaly in self.anomalies:
-            duplicates_str = '、'.join(anomaly['duplicates'])
-            totals_str = '、'.join([f"{name}×{qty}" for name, qty in anomaly['item_totals'].items()])
-            problem = f"重複品項：{duplicates_str}"
-
-            result.append(f"| {anomaly['original_index']} | {anomaly['items']} | {anomaly['main_person']} | {anomaly['target_person']} | {problem} | {totals_str} |")
-
+        rows = [
+            (anomaly['original_index'], anomaly['items'], anomaly['main_person'], anomaly['target_person'],
+             '、'.join(anomaly['duplicates']),
+             '、'.join([f"{name}×{qty}" for name, qty in anomaly['item_totals'].items()]))
+            for anomaly in self.anomalies
+        ]
+        result = [
+            "\n# ⚠️ 異常訂單明細\n",
+            f"**共發現 {len(self.anomalies)} 筆異常訂單**\n",
+            "| 編號 | 品項 | 主要人物 | 對象 | 問題說明 | 各品項數量 |",
+            "|------|------|----------|------|----------|------------|",
+            self.ANOMALY_ROW.render_lines(rows),
+        ]
         return '\n'.join(result)
 
-    def generate_summary(self) -> str:
-        """生成報表摘要"""
-        result = []
-        result.append("\n# 📈 報表摘要\n")
-        result.append(f"- **生成時間**：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        result.append(f"- **總訂單數**：{len(self.orders)} 筆")
-        result.append(f"- **總品項數**（展開後）：{len(self.expanded_orders)} 支")
-        result.append(f"- **品項種類數**：{len(self.item_stats)} 種")
-
-        # 計算總金額
-        total_amount = sum(self.item_amounts.values())
-        result.append(f"- **總金額**：${total_amount}")
-
-        result.append(f"- **異常訂單數**：{len(self.anomalies)} 筆")
-
+    def generate_diagnostics_report(self) -> str:
+        """生成解析診斷報告（略過的行、未知品項、缺少生日等，附原文行號）"""
+        return self._section('diagnostics', self._render_diagnostics_report)
+
+    def _render_diagnostics_report(self) -> str:
+        skipped = sum(1 for d in self.diagnostics if d.skipped)
+        result = [
+            "\n# 🩺 解析診斷\n",
+            f"**共 {len(self.diagnostics)} 則，其中 {skipped} 則的內容未列入統計**\n",
+            "| 行號 | 類型 | 說明 |",
+            "|------|------|------|",
+        ]
+        if self.diagnostics:
+            rows = [(d.span, DIAGNOSTIC_LABELS.get(d.kind, d.kind), d.message.replace('|', '\\|'))
+                    for d in self.diagnostics]
+            result.append(self.DIAGNOSTIC_ROW.render_lines(rows))
         return '\n'.join(result)
 
+    def generate_summary(self) -> str:
+        """生成報表摘要（含生成時間，不快取；只有常數個欄位）"""
+        return self.SUMMARY.render({
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'orders': len(self.orders),
+            'units': len(self.expanded_orders),
+            'item_types': len(self.item_stats),
+            'total_amount': sum(self.item_amounts.values()),
+            'anomalies': len(self.anomalies),
+        })
+
+    @_timed_stage('render_report', rendered=True)
     def generate_full_report(self, reference_data: str = None) -> str:
         """生成完整報表"""
         report_parts = []
@@ -463,11 +2246,143 @@ class OrderFormatter:
         report_parts.append("\n---\n")
         report_parts.append(self.generate_anomaly_report())
 
+        # 6. 解析診斷（有診斷訊息時才顯示）
+        if self.diagnostics:
+            report_parts.append("\n---\n")
+            report_parts.append(self.generate_diagnostics_report())
+
         return '\n'.join(report_parts)
 
+    # 可輸出的格式：格式代碼 -> (說明, 副檔名, MIME)
+    EXPORT_FORMATS = {
+        'md': ('完整報表', 'md', 'text/markdown; charset=utf-8'),
+        'tsv': ('純明細（Tab分隔）', 'txt', 'text/plain; charset=utf-8'),
+        'stats': ('品項統計表（Tab分隔）', 'txt', 'text/plain; charset=utf-8'),
+        'json': ('結構化資料', 'json', 'application/json; charset=utf-8'),
+        'xlsx': ('Excel 活頁簿', 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        'html': ('離線網頁報表', 'html', 'text/html; charset=utf-8'),
+    }
+
+    def to_dict(self, reference_data: str = None) -> Dict:
+        """轉成可 JSON 序列化的結構化資料"""
+        orders = []
+        for order in self.orders:
+            order = dict(order)
+            order['main_info'] = order['main_info']._asdict()
+            order['target_info'] = order['target_info']._asdict()
+            orders.append(order)
+
+        data = {
+            'summary': {
+                'orders': len(self.orders),
+                'units': len(self.expanded_orders),
+                'item_types': len(self.item_stats),
+                'total_amount': sum(self.item_amounts.values()),
+                'anomalies': len(self.anomalies),
+                'diagnostics': len(self.diagnostics),
+                'batch': self.batch,
+            },
+            'orders': orders,
+            'expanded_orders': self.expanded_orders,
+            'item_stats': dict(self.item_stats),
+            'item_amounts': dict(self.item_amounts),
+            'anomalies': self.anomalies,
+            'diagnostics': [diagnostic._asdict() for diagnostic in self.diagnostics],
+        }
+
+        if reference_data:
+            diffs = self.reference_differences(reference_data)
+            data['comparison'] = [
+                {'item': name, 'system': system_qty, 'reference': ref_qty, 'diff': diff}
+                for name, system_qty, ref_qty, diff in diffs
+            ]
+
+        return data
+
+    def export(self, fmt: str, reference_data: str = None) -> Union[str, bytes]:
+        """
+        依格式輸出結果（格式代碼見 EXPORT_FORMATS）
+        xlsx 回傳 bytes，其他格式回傳 str
+        """
+        started = time.perf_counter()
+        content = self._export(fmt, reference_data)
+        self.metrics.record(f'export_{fmt}', time.perf_counter() - started, content)
+        return content
+
+    def _export(self, fmt: str, reference_data: str = None) -> Union[str, bytes]:
+        if fmt == 'md':
+            return self.generate_full_report(reference_data)
+        if fmt == 'tsv':
+            return self.generate_plain_details()
+        if fmt == 'stats':
+            return self.generate_plain_statistics()
+        if fmt == 'json':
+            return json.dumps(self.to_dict(reference_data), ensure_ascii=False)
+        if fmt == 'xlsx':
+            buffer = io.BytesIO()
+            self.write_xlsx(buffer, reference_data)
+            return buffer.getvalue()
+        if fmt == 'html':
+            buffer = io.StringIO()
+            self.write_html(buffer, reference_data)
+            return buffer.getvalue()
+        raise ValueError(f"不支援的輸出格式：{fmt}（可用：{', '.join(self.EXPORT_FORMATS)}）")
+
+    def write_xlsx(self, target, reference_data: str = None):
+        """輸出 xlsx：明細、品項統計、異常訂單（有參考數據時加上差異比對）"""
+        detail_rows = (
+            (row['index'], row['item'], row['main_person'], row['target_person'], row['wish'])
+            for row in self.expanded_orders
+        )
+        stat_rows = [
+            (name, quantity, self.PRICE_LIST.get(name, 0), self.item_amounts.get(name, 0))
+            for name, quantity in sorted(self.item_stats.items())
+        ]
+        anomaly_rows = [
+            (a['original_index'], a['items'], a['main_person'], a['target_person'],
+             '、'.join(a['duplicates']))
+            for a in self.anomalies
+        ]
+
+        sheets = [
+            ('訂單明細', ['編號', '品項', '主要人物', '對象', '願望'], detail_rows),
+            ('品項統計', ['品項名稱', '數量', '單價', '小計金額'], stat_rows),
+            ('異常訂單', ['編號', '品項', '主要人物', '對象', '重複品項'], anomaly_rows),
+        ]
+        if reference_data:
+            diffs = self.reference_differences(reference_data)
+            sheets.append(('差異比對', ['品項名稱', '系統統計', '參考數據', '差異'], diffs))
+
+        write_xlsx(target, sheets)
+
+    def write_html(self, target, reference_data: str = None) -> int:
+        """
+        逐段輸出可離線開啟的 HTML 報表（檔案路徑或文字串流），回傳明細列數
+        明細以 JSON 陣列嵌入一次，由頁面內的虛擬捲動表格排序、篩選（見 html_report.py）
+        """
+        from html_report import write_html_report
+        return write_html_report(self, target, reference_data)
+
+
+def merge_formatters(*formatters: OrderFormatter) -> OrderFormatter:
+    """
+    合併多個已解析的批次，回傳新的 OrderFormatter（不修改傳入的批次）
+    具結合律，可兩兩分組合併，例如多位收單人員各自的分批：
+        merge_formatters(merge_formatters(a, b), merge_formatters(c, d))
+    """
+    if not formatters:
+        return OrderFormatter()
+    merged = OrderFormatter(use_numpy=formatters[0].columns.use_numpy)
+    merged.batch = formatters[0].batch
+    return merged.merge(*formatters)
+
 
 def main():
-    """主程式"""
+    """主程式（帶命令列參數時改用非互動的批次模式，見 order_cli.py）"""
+    if len(sys.argv) > 1:
+        from order_cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
     print("=" * 60)
     print("📋 訂單資料整理與版面設計工具")
     print("=" * 60)
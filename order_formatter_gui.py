@@ -9,10 +9,19 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
 from datetime import datetime
 import os
-import re
-from order_formatter import OrderFormatter
+import queue
+import tempfile
+import threading
+import sqlite3
+from import_ledger import DEFAULT_LEDGER_PATH, ImportLedger
+from order_formatter import DIAGNOSTIC_LABELS, OrderFormatter, convert_multi_line_format, looks_multi_line
+from order_import import FIELD_LABELS, FIELDS, guess_mapping, load_table, read_header
+from report_archive import DEFAULT_ARCHIVE_DIR, ReportArchive
 from version import APP_VERSION
 
+# 剪貼簿內容超過此字數時改存成暫存檔、只複製檔案路徑（Tk 放入大量文字時會卡住視窗）
+CLIPBOARD_MAX_CHARS = 1_000_000
+
 
 class OrderFormatterGUI:
     def __init__(self, root):
@@ -28,7 +37,14 @@ class OrderFormatterGUI:
 
         # 初始化資料
         self.formatter = None
+        self._loaded_source = None  # (訂單文字, 是否略過已匯入, 資料版本)：都沒變時沿用解析結果
+        self._diagnostics_in_text = True  # 診斷訊息的行號是否對應到訂單輸入框
         self.current_report = ""
+        self._payloads = {}  # 剪貼簿內容快取：種類 -> (文字, 暫存檔路徑)，報表變動時清除
+        self._temp_files = set()  # 內容太大時寫出的暫存檔（不再被快取、也不在剪貼簿中時才刪除）
+        self._clipboard_path = None  # 目前剪貼簿中的暫存檔路徑
+        self._payload_generation = 0
+        self._copy_busy = False
 
     def setup_style(self):
         """設定視覺樣式"""
@@ -106,6 +122,7 @@ class OrderFormatterGUI:
             wrap=tk.NONE
         )
         self.order_text.pack(fill=tk.BOTH, expand=True)
+        self.order_text.tag_configure('diagnostic', background='#fff3b0')
 
         # 輸入區按鈕
         order_btn_frame = ttk.Frame(order_label_frame)
@@ -118,6 +135,12 @@ class OrderFormatterGUI:
             style='Primary.TButton'
         ).pack(side=tk.LEFT, padx=2)
 
+        ttk.Button(
+            order_btn_frame,
+            text="📂 開啟試算表",
+            command=self.import_table
+        ).pack(side=tk.LEFT, padx=2)
+
         ttk.Button(
             order_btn_frame,
             text="🔄 轉換多行格式",
@@ -179,6 +202,35 @@ class OrderFormatterGUI:
         )
         self.generate_btn.pack(fill=tk.X)
 
+        # 重複匯入檢查：已記為匯入過的訂單在生成報表時略過
+        import_frame = ttk.Frame(action_frame)
+        import_frame.pack(fill=tk.X, pady=(5, 0))
+        self.skip_imported = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            import_frame,
+            text="略過已匯入過的訂單",
+            variable=self.skip_imported
+        ).pack(side=tk.LEFT)
+        ttk.Button(
+            import_frame,
+            text="📥 記為已匯入",
+            command=self.record_imported
+        ).pack(side=tk.RIGHT, padx=2)
+
+        # 歷史封存：把這批報表壓縮保存，之後可依客人、品項、日期查詢
+        archive_frame = ttk.Frame(action_frame)
+        archive_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(
+            archive_frame,
+            text="📦 封存報表",
+            command=self.archive_report
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(
+            archive_frame,
+            text="🗄️ 歷史封存",
+            command=self.show_archive_window
+        ).pack(side=tk.LEFT, padx=2)
+
         # ----- 右側：結果顯示區 -----
         right_frame = ttk.Frame(main_paned, padding="5")
         main_paned.add(right_frame, weight=2)
@@ -226,18 +278,46 @@ class OrderFormatterGUI:
             style='Success.TButton'
         ).pack(side=tk.LEFT, padx=2)
 
+        ttk.Button(
+            result_btn_frame,
+            text="🔎 篩選查詢",
+            command=self.show_query_window
+        ).pack(side=tk.LEFT, padx=2)
+
         ttk.Button(
             result_btn_frame,
             text="🗑️ 清除結果",
             command=self.clear_result
         ).pack(side=tk.LEFT, padx=2)
 
+        # 解析診斷：雙擊跳到輸入框中對應的行
+        diag_label_frame = ttk.LabelFrame(right_frame, text="🩺 解析診斷（雙擊跳到原文）", padding="5")
+        diag_label_frame.pack(fill=tk.X, pady=(5, 0))
+
+        self.diagnostics_tree = ttk.Treeview(
+            diag_label_frame, columns=('line', 'kind', 'message'), show='headings', height=5
+        )
+        for column, heading, width, stretch in (
+            ('line', '行號', 70, False), ('kind', '類型', 110, False), ('message', '說明', 500, True)
+        ):
+            self.diagnostics_tree.heading(column, text=heading)
+            self.diagnostics_tree.column(column, width=width, stretch=stretch)
+        diag_scroll = ttk.Scrollbar(diag_label_frame, orient=tk.VERTICAL, command=self.diagnostics_tree.yview)
+        self.diagnostics_tree.configure(yscrollcommand=diag_scroll.set)
+        self.diagnostics_tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        diag_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.diagnostics_tree.bind('<Double-1>', self.jump_to_diagnostic)
+        self.diagnostics_tree.bind('<Return>', self.jump_to_diagnostic)
+
         # ===== 狀態列 =====
         self.status_frame = ttk.Frame(self.root)
         self.status_frame.pack(fill=tk.X, side=tk.BOTTOM)
 
         ttk.Separator(self.root, orient='horizontal').pack(fill=tk.X)
 
+        # 背景準備剪貼簿內容時顯示的進度條（平常隱藏）
+        self.progress = ttk.Progressbar(self.status_frame, mode='indeterminate', length=160)
+
         self.status_label = ttk.Label(
             self.status_frame,
             text="就緒",
@@ -421,6 +501,9 @@ class OrderFormatterGUI:
         """清除結果"""
         self.result_text.delete(1.0, tk.END)
         self.current_report = ""
+        self.invalidate_payloads()
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        self.order_text.tag_remove('diagnostic', 1.0, tk.END)
         self.update_status("🗑️ 已清除結果")
 
     def convert_multi_line_format(self):
@@ -432,12 +515,8 @@ class OrderFormatterGUI:
             messagebox.showwarning("提示", "請先輸入資料！")
             return
 
-        # 檢查是否為多行格式
-        lines = order_data.split('\n')
-
-        # 簡單判斷：如果幾乎每行都沒有 Tab，可能是多行格式
-        tab_count = sum(1 for line in lines if '\t' in line)
-        if tab_count > len(lines) * 0.3:  # 如果超過30%的行有Tab，可能已經是正確格式
+        # 簡單判斷：如果超過30%的行有Tab，可能已經是正確格式
+        if not looks_multi_line(order_data):
             response = messagebox.askyesno(
                 "確認",
                 "資料看起來可能已經是正確的格式。\n\n是否仍要轉換？"
@@ -448,116 +527,8 @@ class OrderFormatterGUI:
         try:
             self.update_status("🔄 轉換中...")
 
-            # 解析多行格式
-            orders = []
-            current_order = []
-            consecutive_empty_lines = 0
-
-            for i, line in enumerate(lines):
-                line = line.strip()
-
-                if not line:
-                    # 遇到空行表示一筆訂單結束
-                    if current_order:
-                        # 過濾掉空項
-                        filtered_order = [item for item in current_order if item]
-                        if filtered_order:
-                            orders.append(filtered_order)
-                        current_order = []
-                    continue
-
-                # 檢查是否為新訂單的品項行（包含 x數量 或 *數量 格式）
-                is_item_line = bool(re.search(r'[xX×*]\s*\d+', line))
-
-                # 如果當前行是品項行，且已經有資料在 current_order 中
-                # 表示這是新訂單的開始，需要先保存前一筆訂單
-                if is_item_line and current_order:
-                    # 檢查 current_order 是否已經是完整訂單（至少有願望行）
-                    has_wish = any('願望' in item or '愿望' in item or '祈' in item or '蠟燭' in item for item in current_order)
-                    if has_wish:
-                        # 保存前一筆訂單
-                        filtered_order = [item for item in current_order if item]
-                        if filtered_order:
-                            orders.append(filtered_order)
-                        current_order = []
-
-                # 非空行加入當前訂單
-                current_order.append(line)
-
-            # 處理最後一筆訂單
-            if current_order:
-                filtered_order = [item for item in current_order if item]
-                if filtered_order:
-                    orders.append(filtered_order)
-
-            # 轉換格式
-            converted_orders = []
-
-            for order_lines in orders:
-                if len(order_lines) < 2:
-                    continue
-
-                # 第1行：品項
-                item = order_lines[0]
-
-                # 找到主要人物（姓名 生日）- 通常是第2行或第3行
-                main_person = "—"
-                target_person = "—"
-                wish = ""
-
-                # 從第二行開始查找
-                person_index = 1
-                wish_index = -1
-
-                # 查找願望行的位置（支援「願望」「祈」「蠟燭」等開頭）
-                for idx, line in enumerate(order_lines[1:], start=1):
-                    if '願望' in line or '祈' in line or '蠟燭' in line:
-                        wish_index = idx
-                        # 處理願望的第一行
-                        wish_first = line.replace('願望：', '').replace('願望:', '')
-                        wish_first = wish_first.replace('蠟燭：', '').replace('蠟燭:', '').strip()
-                        
-                        # 收集願望後續的多行內容（直到遇到下一筆訂單的品項行或結束）
-                        wish_lines = [wish_first]
-                        for extra_idx in range(idx + 1, len(order_lines)):
-                            extra_line = order_lines[extra_idx].strip()
-                            # 檢查是否為新訂單的品項行（停止收集）
-                            if re.search(r'^[^\d]+\s*[xX×*]\s*\d+', extra_line):
-                                break
-                            wish_lines.append(extra_line)
-                        
-                        wish = ' '.join(wish_lines)
-                        break
-
-                # 在願望之前的行中找人物資料
-                person_lines = order_lines[1:wish_index] if wish_index > 0 else order_lines[1:]
-
-                # 解析人物資料的輔助函數
-                def parse_person(person_line):
-                    """解析人物資料，返回格式化的字符串"""
-                    # 嘗試匹配 "姓名 生日" 或 "姓名生日" 格式
-                    # 支援多種日期格式：1988/6/30, 1988.6.30, 1988-6-30
-                    match = re.match(r'^(.+?)\s*(\d{4}[/\.\-]?\d{1,2}[/\.\-]?\d{1,2})$', person_line)
-                    if match:
-                        name = match.group(1).strip()
-                        birth = match.group(2).replace('/', '.').replace('-', '.')
-                        return f"{name}/{birth}"
-                    else:
-                        # 如果匹配失敗，返回原字符串
-                        return person_line
-
-                # 解析人物資料
-                if len(person_lines) >= 1:
-                    # 第一個人物（主要人物）
-                    main_person = parse_person(person_lines[0])
-
-                if len(person_lines) >= 2:
-                    # 第二個人物（對象）
-                    target_person = parse_person(person_lines[1])
-
-                # 組合成 Tab 分隔格式
-                converted = f"{item}\t{main_person}\t{target_person}\t{wish}"
-                converted_orders.append(converted)
+            # 解析多行格式並轉換（共用 order_formatter 的核心邏輯）
+            converted_orders = convert_multi_line_format(order_data)
 
             if not converted_orders:
                 messagebox.showwarning(
@@ -591,45 +562,13 @@ class OrderFormatterGUI:
 
     def generate_report(self):
         """生成報表"""
-        # 獲取訂單資料
-        order_data = self.order_text.get(1.0, tk.END).strip()
+        # 獲取訂單資料（只去掉結尾空白，診斷訊息的行號才會對應到輸入框）
+        order_data = self.order_text.get(1.0, tk.END).rstrip()
 
-        if not order_data:
+        if not order_data.strip():
             messagebox.showwarning("提示", "請先輸入訂單資料！")
             return
 
-        # 驗證資料格式（支援 Tab 分隔或多行格式）
-        lines = order_data.split('\n')
-        tab_lines = 0
-        item_lines = 0
-
-        for line in lines:
-            if line.strip():
-                # 檢查是否有 Tab 分隔
-                if '\t' in line:
-                    tab_lines += 1
-                # 檢查是否有品項格式 (例如：鬼王x2)
-                if re.search(r'[xX×*]\d+', line):
-                    item_lines += 1
-
-        # 如果既沒有 Tab 分隔的行，也沒有品項格式的行，才報錯
-        if tab_lines == 0 and item_lines == 0:
-            messagebox.showerror(
-                "資料格式錯誤",
-                "❌ 未偵測到正確的訂單資料格式！\n\n"
-                "支援兩種格式：\n\n"
-                "1️⃣ Tab 分隔格式（推薦）：\n"
-                "   品項<Tab>姓名/生日<Tab>對象/生日<Tab>願望\n"
-                "   範例：鬼王x2+三鬼頭x4<Tab>王小明 1990/5/20<Tab>...\n\n"
-                "2️⃣ 多行格式：\n"
-                "   鬼王x2+三鬼頭x4\n"
-                "   王小明 1990/5/20\n"
-                "   李美麗 1992/8/15\n"
-                "   願望：事業順利\n\n"
-                "提示：點擊「📋 貼上範例資料」查看範例"
-            )
-            return
-
         # 獲取參考數據（選填）
         reference_data = self.ref_text.get(1.0, tk.END).strip()
         if not reference_data:
@@ -640,58 +579,388 @@ class OrderFormatterGUI:
             self.generate_btn.config(state='disabled')
             self.root.update()
 
+            # 訂單資料與上次相同、也沒有手動編輯過時，只重新渲染差異比對等有變動的區段
+            skip_imported = self.skip_imported.get()
+            source = (order_data, skip_imported)
+            if self.formatter is not None and self._loaded_source == source + (self.formatter.data_version,):
+                self.display_report(reference_data)
+                return
+
             # 建立格式化工具並處理資料
             self.formatter = OrderFormatter()
+            self.invalidate_payloads()
             self.formatter.load_data(order_data)
-
-            # 檢查是否成功載入資料
+            imported = self.screen_imported(self.formatter)
+            self._loaded_source = source + (self.formatter.data_version,)
+
+            # 沒有任何訂單時，解析時記下的診斷訊息就是原因（不另外預先掃描）
+            self.show_diagnostics(in_text=True)
+            if len(self.formatter.orders) == 0 and imported:
+                messagebox.showinfo("重複匯入", f"📥 所有訂單都已匯入過，沒有新訂單。\n\n{imported}")
+                self.update_status(f"📥 {imported}")
+                return
             if len(self.formatter.orders) == 0:
-                messagebox.showwarning(
-                    "資料解析失敗",
-                    f"⚠️ 已讀取 {len(lines)} 行資料，但無法解析出有效訂單！\n\n"
-                    "可能原因：\n"
-                    "1. 資料分隔符號不是 Tab\n"
-                    "2. 每行資料欄位不足（至少需要2欄）\n"
-                    "3. 資料格式不符合預期\n\n"
-                    "建議：\n"
-                    "- 點擊「📋 貼上範例資料」查看正確格式\n"
-                    "- 從 Excel 複製時，確保使用 Ctrl+C (Win) 或 Cmd+C (Mac)\n"
-                    "- 檢查資料是否包含必要欄位"
+                reasons = "\n".join(d.message for d in self.formatter.diagnostics[:10])
+                messagebox.showerror(
+                    "資料格式錯誤",
+                    "❌ 無法解析出有效訂單！\n\n"
+                    + (f"{reasons}\n\n" if reasons else "")
+                    + "支援兩種格式：\n\n"
+                    "1️⃣ Tab 分隔格式（推薦）：\n"
+                    "   品項<Tab>姓名/生日<Tab>對象/生日<Tab>願望\n"
+                    "   範例：鬼王x2+三鬼頭x4<Tab>王小明 1990/5/20<Tab>...\n\n"
+                    "2️⃣ 多行格式：\n"
+                    "   鬼王x2+三鬼頭x4\n"
+                    "   王小明 1990/5/20\n"
+                    "   李美麗 1992/8/15\n"
+                    "   願望：事業順利\n\n"
+                    "提示：點擊「📋 貼上範例資料」查看範例"
                 )
                 self.update_status("❌ 資料解析失敗")
-                self.generate_btn.config(state='normal')
                 return
 
-            self.update_status(f"📊 已載入 {len(self.formatter.orders)} 筆訂單，展開為 {len(self.formatter.expanded_orders)} 筆明細")
+            self.display_report(reference_data)
 
-            # 生成報表
-            self.current_report = self.formatter.generate_full_report(reference_data)
+        except Exception as e:
+            messagebox.showerror("錯誤", f"處理失敗：{str(e)}")
+            self.update_status(f"❌ 處理失敗：{str(e)}")
+        finally:
+            self.generate_btn.config(state='normal')
 
-            # 顯示報表
-            self.result_text.delete(1.0, tk.END)
-            self.result_text.insert(1.0, self.current_report)
+    def display_report(self, reference_data=None):
+        """生成並顯示目前 formatter 的完整報表與摘要"""
+        self.update_status(f"📊 已載入 {len(self.formatter.orders)} 筆訂單，展開為 {len(self.formatter.expanded_orders)} 筆明細")
 
-            # 顯示統計摘要
-            summary = f"✅ 報表生成完成！總訂單：{len(self.formatter.orders)} 筆，總品項：{len(self.formatter.expanded_orders)} 支"
-            if self.formatter.anomalies:
-                summary += f"，異常訂單：{len(self.formatter.anomalies)} 筆 ⚠️"
+        # 生成報表
+        self.current_report = self.formatter.generate_full_report(reference_data)
+        self.invalidate_payloads()
 
-            self.update_status(summary)
+        # 顯示報表
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(1.0, self.current_report)
 
-            messagebox.showinfo(
-                "成功",
-                f"報表生成完成！\n\n"
-                f"📊 總訂單數：{len(self.formatter.orders)} 筆\n"
-                f"📦 總品項數：{len(self.formatter.expanded_orders)} 支\n"
-                f"🏷️ 品項種類：{len(self.formatter.item_stats)} 種\n"
-                f"⚠️ 異常訂單：{len(self.formatter.anomalies)} 筆"
+        # 顯示統計摘要
+        summary = f"✅ 報表生成完成！總訂單：{len(self.formatter.orders)} 筆，總品項：{len(self.formatter.expanded_orders)} 支"
+        if self.formatter.anomalies:
+            summary += f"，異常訂單：{len(self.formatter.anomalies)} 筆 ⚠️"
+        if self.formatter.diagnostics:
+            summary += f"，診斷 {len(self.formatter.diagnostics)} 則 🩺"
+        summary += f"（{self.formatter.metrics.summary()}）"
+
+        self.update_status(summary)
+
+        messagebox.showinfo(
+            "成功",
+            f"報表生成完成！\n\n"
+            f"📊 總訂單數：{len(self.formatter.orders)} 筆\n"
+            f"📦 總品項數：{len(self.formatter.expanded_orders)} 支\n"
+            f"🏷️ 品項種類：{len(self.formatter.item_stats)} 種\n"
+            f"⚠️ 異常訂單：{len(self.formatter.anomalies)} 筆"
+        )
+
+    def show_diagnostics(self, in_text: bool):
+        """
+        把目前 formatter 的診斷訊息列在清單中
+        in_text 為 False 時（試算表匯入）行號是檔案中的列號，不能跳到輸入框
+        """
+        self._diagnostics_in_text = in_text
+        self.order_text.tag_remove('diagnostic', 1.0, tk.END)
+        tree = self.diagnostics_tree
+        tree.delete(*tree.get_children())
+        for position, diagnostic in enumerate(self.formatter.diagnostics):
+            tree.insert('', tk.END, iid=str(position), values=(
+                diagnostic.span, DIAGNOSTIC_LABELS.get(diagnostic.kind, diagnostic.kind), diagnostic.message
+            ))
+
+    def jump_to_diagnostic(self, event=None):
+        """選取輸入框中診斷訊息對應的行範圍並捲動過去"""
+        selection = self.diagnostics_tree.selection()
+        if not selection or self.formatter is None:
+            return
+        diagnostic = self.formatter.diagnostics[int(selection[0])]
+        if not self._diagnostics_in_text:
+            self.update_status(f"🩺 試算表第 {diagnostic.span} 列：{diagnostic.message}")
+            return
+        if not diagnostic.line:
+            return
+
+        first, last = f"{diagnostic.line}.0", f"{diagnostic.last_line}.end"
+        self.order_text.tag_remove('diagnostic', 1.0, tk.END)
+        self.order_text.tag_add('diagnostic', first, last)
+        self.order_text.mark_set(tk.INSERT, first)
+        self.order_text.see(last)
+        self.order_text.see(first)
+        self.order_text.focus_set()
+
+    def screen_imported(self, formatter):
+        """
+        勾選「略過已匯入過的訂單」時依匯入紀錄移除重複的訂單，回傳摘要（沒有勾選時回傳 None）
+        只檢查不記錄：按「記為已匯入」才寫入紀錄
+        """
+        if not self.skip_imported.get():
+            return None
+        try:
+            with ImportLedger(DEFAULT_LEDGER_PATH) as ledger:
+                screen = ledger.screen(formatter, skip=True)
+                ledger.rollback()
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showwarning("匯入紀錄", f"無法開啟匯入紀錄，略過重複檢查：{e}")
+            return None
+        return screen.summary()
+
+    def record_imported(self):
+        """把目前報表中的訂單記為已匯入，之後再貼上相同的訂單會被略過"""
+        if self.formatter is None or not self.formatter.orders:
+            messagebox.showwarning("提示", "請先生成報表！")
+            return
+        try:
+            with ImportLedger(DEFAULT_LEDGER_PATH) as ledger:
+                added = ledger.record(self.formatter, source='桌面版')
+                total = ledger.count()
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("錯誤", f"無法寫入匯入紀錄：{e}")
+            return
+        skipped = len(self.formatter.orders) - added
+        self.update_status(f"📥 已記錄 {added} 筆新訂單（{skipped} 筆先前已記錄），紀錄共 {total} 筆")
+        messagebox.showinfo(
+            "記為已匯入",
+            f"📥 已記錄 {added} 筆新訂單"
+            + (f"，{skipped} 筆先前已記錄" if skipped else "")
+            + f"\n\n紀錄檔：{DEFAULT_LEDGER_PATH}"
+        )
+
+    def archive_report(self):
+        """把目前的報表與訂單壓縮封存，之後可在「歷史封存」中查詢"""
+        if self.formatter is None or not self.formatter.orders or not self.current_report:
+            messagebox.showwarning("提示", "請先生成報表！")
+            return
+        try:
+            self.update_status("📦 封存中...")
+            self.root.update()
+            entry = ReportArchive(DEFAULT_ARCHIVE_DIR).add(
+                self.formatter, self.current_report,
+                name=f"桌面版 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
             )
+        except OSError as e:
+            messagebox.showerror("錯誤", f"無法寫入封存：{e}")
+            self.update_status("❌ 封存失敗")
+            return
+        self.update_status(f"📦 已封存為 #{entry.number}：{entry.orders} 筆訂單 / {entry.units} 支")
+        messagebox.showinfo(
+            "封存報表",
+            f"📦 已封存為 #{entry.number}\n\n"
+            f"訂單 {entry.orders} 筆，品項 {entry.units} 支\n封存資料夾：{DEFAULT_ARCHIVE_DIR}"
+        )
 
-        except Exception as e:
-            messagebox.showerror("錯誤", f"處理失敗：{str(e)}")
-            self.update_status(f"❌ 處理失敗：{str(e)}")
-        finally:
-            self.generate_btn.config(state='normal')
+    def show_archive_window(self):
+        """開啟歷史封存視窗：依客人、品項、日期篩選封存，雙擊載入該次的報表"""
+        archive = ReportArchive(DEFAULT_ARCHIVE_DIR)
+
+        archive_window = tk.Toplevel(self.root)
+        archive_window.title("🗄️ 歷史封存")
+        archive_window.geometry("1000x650")
+
+        form_frame = ttk.Frame(archive_window, padding="10")
+        form_frame.pack(fill=tk.X)
+
+        fields = {}
+        for column, (key, label) in enumerate([
+            ('customer', '客人'), ('item', '品項'), ('since', '起始日期'), ('until', '結束日期')
+        ]):
+            ttk.Label(form_frame, text=label).grid(row=0, column=column * 2, sticky=tk.W, padx=(0, 3))
+            entry = ttk.Entry(form_frame, width=14)
+            entry.grid(row=0, column=column * 2 + 1, padx=(0, 10))
+            fields[key] = entry
+
+        result_label = ttk.Label(archive_window, text="", padding=(10, 0))
+        result_label.pack(fill=tk.X)
+
+        panes = ttk.PanedWindow(archive_window, orient=tk.VERTICAL)
+        panes.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        def make_tree(columns):
+            frame = ttk.Frame(panes)
+            tree = ttk.Treeview(frame, columns=[key for key, _, _ in columns], show='headings')
+            for key, heading, width in columns:
+                tree.heading(key, text=heading)
+                tree.column(key, width=width, anchor=tk.W)
+            scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            panes.add(frame, weight=1)
+            return tree
+
+        entry_tree = make_tree([
+            ('number', '編號', 60), ('created', '封存時間', 150), ('name', '名稱', 260),
+            ('orders', '訂單', 70), ('units', '支數', 70), ('amount', '金額', 90)
+        ])
+        order_tree = make_tree([
+            ('number', '封存', 60), ('date', '日期', 100), ('raw_items', '品項', 160),
+            ('main_person', '主要人物', 200), ('target_person', '對象', 200), ('wish', '願望', 260)
+        ])
+
+        row_entries = {}  # Treeview 列 -> 封存索引
+
+        def open_selected(event=None):
+            for tree in (entry_tree, order_tree):
+                selected = tree.focus()
+                if selected in row_entries:
+                    self.load_archived(archive, row_entries[selected])
+                    return
+
+        entry_tree.bind('<Double-1>', open_selected)
+        order_tree.bind('<Double-1>', open_selected)
+
+        def run_search(event=None):
+            criteria = {key: entry.get().strip() or None for key, entry in fields.items()}
+            start = datetime.now()
+            try:
+                entries = archive.find(**criteria)
+                # 有客人或品項條件時才列出訂單：只解壓縮索引符合的封存
+                orders = []
+                if criteria['customer'] or criteria['item']:
+                    for archive_entry, order in archive.find_orders(**criteria):
+                        orders.append((archive_entry, order))
+                        if len(orders) >= 2000:
+                            break
+            except (OSError, ValueError) as e:
+                result_label.config(text=f"❌ 無法讀取封存：{e}")
+                return
+            elapsed_ms = (datetime.now() - start).total_seconds() * 1000
+
+            entry_tree.delete(*entry_tree.get_children())
+            order_tree.delete(*order_tree.get_children())
+            row_entries.clear()
+            for archive_entry in entries:
+                iid = entry_tree.insert('', tk.END, values=(
+                    archive_entry.number, archive_entry.created, archive_entry.name,
+                    archive_entry.orders, archive_entry.units, f"${archive_entry.amount}"
+                ))
+                row_entries[iid] = archive_entry
+            for archive_entry, order in orders:
+                iid = order_tree.insert('', tk.END, values=(
+                    archive_entry.number, archive_entry.date, order['raw_items'],
+                    order['main_person'], order['target_person'], order['wish']
+                ))
+                row_entries[iid] = archive_entry
+
+            found = f"，符合訂單 {len(orders)} 筆" if criteria['customer'] or criteria['item'] else ""
+            result_label.config(
+                text=f"🗄️ 共 {len(archive.entries)} 筆封存，符合 {len(entries)} 筆{found}，耗時 {elapsed_ms:.1f} ms"
+            )
+
+        ttk.Button(
+            form_frame,
+            text="🔎 查詢",
+            command=run_search,
+            style='Primary.TButton'
+        ).grid(row=0, column=8)
+
+        for entry in fields.values():
+            entry.bind('<Return>', run_search)
+
+        ttk.Label(
+            archive_window,
+            text="💡 日期格式 YYYY-MM-DD；雙擊封存或訂單可載入該次的報表",
+            padding=(10, 0, 10, 8)
+        ).pack(fill=tk.X)
+        run_search()
+
+    def load_archived(self, archive, entry):
+        """把封存的報表載入結果區，並用封存的訂單重建 formatter（可再篩選、複製）"""
+        try:
+            self.update_status(f"🗄️ 載入封存 #{entry.number}...")
+            self.root.update()
+            self.formatter = archive.load_formatter(entry)
+            self.current_report = archive.report(entry)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("錯誤", f"無法讀取封存：{e}")
+            return
+        self._loaded_source = None
+        self.invalidate_payloads()
+        self.show_diagnostics(in_text=False)
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(1.0, self.current_report)
+        self.update_status(
+            f"🗄️ 已載入封存 #{entry.number}（{entry.created}）：{entry.orders} 筆訂單 / {entry.units} 支"
+        )
+
+    def import_table(self):
+        """開啟表單匯出的 xlsx／CSV，確認欄位對應後逐列載入並生成報表"""
+        path = filedialog.askopenfilename(
+            title="開啟試算表",
+            filetypes=[("試算表", "*.xlsx *.csv"), ("Excel", "*.xlsx"), ("CSV", "*.csv")]
+        )
+        if not path:
+            return
+
+        try:
+            header = [name.strip() for name in read_header(path) if name and name.strip()]
+        except (ImportError, ValueError, OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("錯誤", f"無法讀取檔案：{e}")
+            return
+        if not header:
+            messagebox.showwarning("提示", "檔案沒有表頭！")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"📂 欄位對應 - {os.path.basename(path)}")
+        dialog.transient(self.root)
+
+        frame = ttk.Frame(dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(frame, text="表頭：" + "、".join(header), wraplength=480).grid(
+            row=0, column=0, columnspan=2, sticky=tk.W, pady=(0, 4))
+        ttk.Label(frame, text="多個欄位以 + 串接（例如 姓名+生日），也可以用欄名 A、B…").grid(
+            row=1, column=0, columnspan=2, sticky=tk.W, pady=(0, 8))
+
+        guessed = guess_mapping(header)
+        entries = {}
+        for row, field in enumerate(FIELDS, start=2):
+            ttk.Label(frame, text=FIELD_LABELS[field]).grid(row=row, column=0, sticky=tk.W, pady=2)
+            entry = ttk.Entry(frame, width=40)
+            entry.insert(0, '+'.join(guessed[field]))
+            entry.grid(row=row, column=1, pady=2)
+            entries[field] = entry
+
+        def load():
+            mapping = {field: [column.strip() for column in entry.get().split('+') if column.strip()]
+                       for field, entry in entries.items()}
+            reference_data = self.ref_text.get(1.0, tk.END).strip() or None
+            formatter = OrderFormatter()
+            try:
+                self.update_status("🔄 匯入中...")
+                self.root.update()
+                load_table(formatter, path, mapping=mapping)
+            except (ImportError, ValueError, OSError, UnicodeDecodeError) as e:
+                messagebox.showerror("錯誤", f"匯入失敗：{e}", parent=dialog)
+                self.update_status(f"❌ 匯入失敗：{e}")
+                return
+
+            dialog.destroy()
+            imported = self.screen_imported(formatter)
+            if len(formatter.orders) == 0 and imported:
+                messagebox.showinfo("重複匯入", f"📥 所有訂單都已匯入過，沒有新訂單。\n\n{imported}")
+                self.update_status(f"📥 {imported}")
+                return
+            if len(formatter.orders) == 0:
+                reason = "\n".join(d.message for d in formatter.diagnostics[:10]) or "請確認欄位對應是否正確"
+                messagebox.showwarning("資料解析失敗", f"⚠️ 沒有可解析的訂單：\n\n{reason}")
+                self.update_status("❌ 資料解析失敗")
+                return
+
+            self.formatter = formatter
+            self._loaded_source = None
+            self.show_diagnostics(in_text=False)
+            try:
+                self.display_report(reference_data)
+            except Exception as e:
+                messagebox.showerror("錯誤", f"處理失敗：{str(e)}")
+                self.update_status(f"❌ 處理失敗：{str(e)}")
+
+        ttk.Button(frame, text="📥 匯入", command=load, style='Primary.TButton').grid(
+            row=len(FIELDS) + 2, column=0, columnspan=2, pady=(10, 0), sticky=tk.E)
 
     def save_report(self):
         """儲存報表"""
@@ -708,6 +977,7 @@ class OrderFormatterGUI:
             initialfile=default_filename,
             filetypes=[
                 ("Markdown 檔案", "*.md"),
+                ("離線網頁報表", "*.html"),
                 ("文字檔案", "*.txt"),
                 ("所有檔案", "*.*")
             ]
@@ -715,23 +985,275 @@ class OrderFormatterGUI:
 
         if filename:
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(self.current_report)
+                if filename.lower().endswith(('.html', '.htm')):
+                    # 網頁報表直接由 formatter 逐段寫檔
+                    reference_data = self.ref_text.get(1.0, tk.END).strip() or None
+                    self.formatter.write_html(filename, reference_data)
+                else:
+                    with open(filename, 'w', encoding='utf-8') as f:
+                        f.write(self.current_report)
                 self.update_status(f"💾 報表已儲存：{os.path.basename(filename)}")
                 messagebox.showinfo("成功", f"報表已儲存至：\n{filename}")
             except Exception as e:
                 messagebox.showerror("錯誤", f"儲存失敗：{str(e)}")
 
+    def show_query_window(self):
+        """開啟篩選查詢視窗（品項、人物、對象、願望）"""
+        if not self.formatter:
+            messagebox.showwarning("提示", "請先生成報表！")
+            return
+
+        query_window = tk.Toplevel(self.root)
+        query_window.title("🔎 篩選查詢")
+        query_window.geometry("900x550")
+
+        form_frame = ttk.Frame(query_window, padding="10")
+        form_frame.pack(fill=tk.X)
+
+        fields = {}
+        for column, (key, label) in enumerate([
+            ('item', '品項'), ('person', '人物'), ('target', '對象'), ('wish', '願望關鍵字')
+        ]):
+            ttk.Label(form_frame, text=label).grid(row=0, column=column * 2, sticky=tk.W, padx=(0, 3))
+            if key == 'item':
+                entry = ttk.Combobox(
+                    form_frame,
+                    values=[''] + sorted(self.formatter.item_stats.keys()),
+                    width=14
+                )
+            else:
+                entry = ttk.Entry(form_frame, width=14)
+            entry.grid(row=0, column=column * 2 + 1, padx=(0, 10))
+            fields[key] = entry
+
+        result_label = ttk.Label(query_window, text="", padding=(10, 0))
+        result_label.pack(fill=tk.X)
+
+        tree_frame = ttk.Frame(query_window, padding="10")
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ('index', 'item', 'main_person', 'target_person', 'wish')
+        tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
+        for key, heading, width in [
+            ('index', '編號', 60), ('item', '品項', 110), ('main_person', '主要人物', 200),
+            ('target_person', '對象', 200), ('wish', '願望', 300)
+        ]:
+            tree.heading(key, text=heading)
+            tree.column(key, width=width, anchor=tk.W)
+
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        row_orders = {}  # Treeview 列 -> 訂單編號
+
+        def edit_selected(event=None):
+            selected = tree.focus()
+            if selected in row_orders:
+                self.edit_order(row_orders[selected], on_change=run_query)
+
+        tree.bind('<Double-1>', edit_selected)
+
+        def run_query(event=None):
+            criteria = {key: entry.get().strip() or None for key, entry in fields.items()}
+            if not any(criteria.values()):
+                result_label.config(text="請輸入至少一個條件")
+                return
+
+            start = datetime.now()
+            rows = self.formatter.query(**criteria)
+            elapsed_ms = (datetime.now() - start).total_seconds() * 1000
+
+            tree.delete(*tree.get_children())
+            row_orders.clear()
+            # 只顯示前 2000 筆，避免 Treeview 塞入過多資料卡住視窗
+            for row in rows[:2000]:
+                iid = tree.insert('', tk.END, values=[row[key] for key in columns])
+                row_orders[iid] = row['order_index']
+
+            shown = "（顯示前 2000 筆）" if len(rows) > 2000 else ""
+            result_label.config(text=f"🔎 共 {len(rows)} 筆符合{shown}，耗時 {elapsed_ms:.1f} ms")
+            self.update_status(f"🔎 篩選查詢：{len(rows)} 筆符合")
+
+        ttk.Button(
+            form_frame,
+            text="🔎 查詢",
+            command=run_query,
+            style='Primary.TButton'
+        ).grid(row=0, column=8)
+
+        for entry in fields.values():
+            entry.bind('<Return>', run_query)
+
+        ttk.Label(query_window, text="💡 雙擊明細可修改或刪除該筆訂單", padding=(10, 0, 10, 8)).pack(fill=tk.X)
+
+    def edit_order(self, order_index, on_change=None):
+        """修改或刪除單筆訂單，只重算這筆訂單並重新輸出報表"""
+        order = self.formatter.get_order(order_index)
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"✏️ 修改訂單 #{order_index}")
+        dialog.transient(self.root)
+
+        frame = ttk.Frame(dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        entries = {}
+        for row, (key, label) in enumerate([
+            ('raw_items', '品項'), ('main_person', '姓名/生日'), ('target_person', '對象/生日'), ('wish', '願望')
+        ]):
+            ttk.Label(frame, text=label).grid(row=row, column=0, sticky=tk.W, pady=2)
+            entry = ttk.Entry(frame, width=50)
+            entry.insert(0, order[key])
+            entry.grid(row=row, column=1, pady=2)
+            entries[key] = entry
+
+        def refresh(message):
+            reference_data = self.ref_text.get(1.0, tk.END).strip() or None
+            self.current_report = self.formatter.generate_full_report(reference_data)
+            self.invalidate_payloads()
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(1.0, self.current_report)
+            self.show_diagnostics(self._diagnostics_in_text)
+            self.update_status(message)
+            dialog.destroy()
+            if on_change:
+                on_change()
+
+        def save():
+            self.formatter.update_order(order_index, **{key: entry.get().strip() for key, entry in entries.items()})
+            start, end = self.formatter.expanded_range(order_index)
+            refresh(f"✏️ 已修改訂單 #{order_index}（明細 {start}~{end}）")
+
+        def delete():
+            if messagebox.askyesno("確認", f"確定要刪除訂單 #{order_index}？", parent=dialog):
+                self.formatter.remove_order(order_index)
+                refresh(f"🗑️ 已刪除訂單 #{order_index}")
+
+        button_frame = ttk.Frame(frame)
+        button_frame.grid(row=4, column=0, columnspan=2, pady=(10, 0), sticky=tk.E)
+        ttk.Button(button_frame, text="🗑️ 刪除訂單", command=delete).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="💾 儲存", command=save, style='Primary.TButton').pack(side=tk.LEFT)
+
+    def invalidate_payloads(self):
+        """報表變動後清除剪貼簿內容快取與暫存檔（剪貼簿中的那一份保留到剪貼簿換掉為止）"""
+        self._payloads = {}
+        self._payload_generation += 1
+        self._remove_temp_files()
+
+    def _remove_temp_files(self, keep_clipboard=True):
+        """刪除沒有用到的暫存檔：keep_clipboard 為 True 時保留快取中與剪貼簿中的檔案"""
+        keep = set()
+        if keep_clipboard:
+            keep = {path for _, path in self._payloads.values() if path}
+            keep.add(self._clipboard_path)
+        for path in self._temp_files - keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._temp_files &= keep
+
+    def on_close(self):
+        """關閉視窗：刪除所有暫存檔"""
+        self._remove_temp_files(keep_clipboard=False)
+        self.root.destroy()
+
+    def copy_payload(self, kind, render, on_done):
+        """
+        把內容放入剪貼簿，不卡住視窗
+        - 同一份報表已準備過的內容直接沿用
+        - 否則在背景執行緒產生（內容太大時另外寫成暫存檔），主執行緒以 after 輪詢結果
+        - render 不可讀取會被修改的訂單資料，呼叫端要先在主執行緒取好快照
+        - 完成後呼叫 on_done(暫存檔路徑或 None)；產生期間報表有變動時丟棄結果
+        """
+        payload = self._payloads.get(kind)
+        if payload is not None:
+            self._put_clipboard(payload, on_done)
+            return
+        if self._copy_busy:
+            self.update_status("⏳ 正在準備上一次要複製的內容，請稍候...")
+            return
+
+        generation = self._payload_generation
+        results = queue.Queue()
+
+        def work():
+            try:
+                text = render()
+                path = None
+                if len(text) > CLIPBOARD_MAX_CHARS:
+                    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt',
+                                                     prefix=f'{kind}_', delete=False) as f:
+                        f.write(text)
+                    path, text = f.name, None
+                results.put(((text, path), None))
+            except Exception as e:
+                results.put((None, e))
+
+        def poll():
+            try:
+                payload, error = results.get_nowait()
+            except queue.Empty:
+                self.root.after(50, poll)
+                return
+
+            self._copy_busy = False
+            self.progress.stop()
+            self.progress.pack_forget()
+            self._finish_copy(kind, generation, payload, error, on_done)
+
+        self._copy_busy = True
+        self.progress.pack(side=tk.RIGHT, padx=5, before=self.status_label)
+        self.progress.start(10)
+        self.update_status("⏳ 正在準備要複製的內容...")
+        threading.Thread(target=work, daemon=True).start()
+        self.root.after(50, poll)
+
+    def _finish_copy(self, kind, generation, payload, error, on_done):
+        """背景產生的內容回到主執行緒：產生期間修改過訂單時內容已過時，不放入剪貼簿"""
+        if payload is not None and payload[1]:
+            self._temp_files.add(payload[1])
+        if generation != self._payload_generation:
+            self._remove_temp_files()
+            self.update_status("⚠️ 準備內容時訂單已變動，請再複製一次")
+            return
+        if error is not None:
+            messagebox.showerror("錯誤", f"複製失敗：{error}")
+            self.update_status(f"❌ 複製失敗：{error}")
+            return
+        self._payloads[kind] = payload
+        self._put_clipboard(payload, on_done)
+
+    def _put_clipboard(self, payload, on_done):
+        text, path = payload
+        self.root.clipboard_clear()
+        self.root.clipboard_append(path or text)
+        # 剪貼簿換掉後，先前在剪貼簿中、又已不在快取的暫存檔才可以刪除
+        self._clipboard_path = path
+        self._remove_temp_files()
+        on_done(path)
+
+    @staticmethod
+    def _large_payload_note(path):
+        """內容太大改存暫存檔時附加在提示訊息後的說明"""
+        if not path:
+            return ""
+        return f"\n\n⚠️ 內容較大，已存成檔案，剪貼簿內為檔案路徑：\n{path}"
+
     def copy_to_clipboard(self):
         """複製完整報表到剪貼簿"""
         if not self.current_report:
             messagebox.showwarning("提示", "請先生成報表！")
             return
 
-        self.root.clipboard_clear()
-        self.root.clipboard_append(self.current_report)
-        self.update_status("📋 完整報表已複製到剪貼簿")
-        messagebox.showinfo("成功", "完整報表已複製到剪貼簿！")
+        def done(path):
+            self.update_status("📋 完整報表已複製到剪貼簿" + ("（檔案路徑）" if path else ""))
+            messagebox.showinfo("成功", "完整報表已複製到剪貼簿！" + self._large_payload_note(path))
+
+        report = self.current_report
+        self.copy_payload('report', lambda: report, done)
 
     def copy_plain_details(self):
         """複製純明細內容到剪貼簿（不含標題和統計）"""
@@ -739,18 +1261,21 @@ class OrderFormatterGUI:
             messagebox.showwarning("提示", "請先生成報表！")
             return
 
-        # 生成純明細內容
-        plain_details = self.formatter.generate_plain_details()
+        count = len(self.formatter.expanded_orders)
 
-        self.root.clipboard_clear()
-        self.root.clipboard_append(plain_details)
-        self.update_status(f"📄 已複製 {len(self.formatter.expanded_orders)} 筆純明細到剪貼簿")
-        messagebox.showinfo(
-            "成功",
-            f"已複製純明細內容！\n\n"
-            f"共 {len(self.formatter.expanded_orders)} 筆訂單明細\n"
-            f"格式：編號、品項、姓名/生日、對象/生日、願望"
-        )
+        def done(path):
+            self.update_status(f"📄 已複製 {count} 筆純明細到剪貼簿" + ("（檔案路徑）" if path else ""))
+            messagebox.showinfo(
+                "成功",
+                f"已複製純明細內容！\n\n"
+                f"共 {count} 筆訂單明細\n"
+                f"格式：編號、品項、姓名/生日、對象/生日、願望"
+                + self._large_payload_note(path)
+            )
+
+        # 背景執行緒只讀快照：修改訂單時明細會在主執行緒重新編號
+        rows = [row.copy() for row in self.formatter.expanded_orders]
+        self.copy_payload('details', lambda: OrderFormatter.DETAIL_LINE.render_lines(rows), done)
 
     def copy_plain_statistics(self):
         """複製純品項統計表到剪貼簿（Tab分隔格式，方便貼到Excel）"""
@@ -758,25 +1283,29 @@ class OrderFormatterGUI:
             messagebox.showwarning("提示", "請先生成報表！")
             return
 
-        # 生成純品項統計內容
-        plain_stats = self.formatter.generate_plain_statistics()
+        count = len(self.formatter.item_stats)
 
-        self.root.clipboard_clear()
-        self.root.clipboard_append(plain_stats)
-        self.update_status(f"📊 已複製 {len(self.formatter.item_stats)} 種品項統計到剪貼簿")
-        messagebox.showinfo(
-            "成功",
-            f"已複製純品項統計表！\n\n"
-            f"共 {len(self.formatter.item_stats)} 種品項\n"
-            f"格式：品項名稱、數量、單價、小計金額\n"
-            f"可直接貼到 Excel 或記事本"
-        )
+        def done(path):
+            self.update_status(f"📊 已複製 {count} 種品項統計到剪貼簿")
+            messagebox.showinfo(
+                "成功",
+                f"已複製純品項統計表！\n\n"
+                f"共 {count} 種品項\n"
+                f"格式：品項名稱、數量、單價、小計金額\n"
+                f"可直接貼到 Excel 或記事本"
+                + self._large_payload_note(path)
+            )
+
+        # 統計表只有品項數那麼多列，直接在主執行緒產生
+        statistics = self.formatter.generate_plain_statistics()
+        self.copy_payload('statistics', lambda: statistics, done)
 
 
 def main():
     """主程式入口"""
     root = tk.Tk()
     app = OrderFormatterGUI(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
 
     # 視窗置中
     root.update_idletasks()
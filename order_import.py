@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 試算表／CSV 匯入
+直接讀取表單匯出的 .xlsx（openpyxl read_only 逐列讀取）與 .csv，
+依欄位對應組成 [品項, 主要人物, 對象, 願望] 逐列交給 OrderFormatter.load_rows，
+不需要先複製貼上成一整段文字
+
+欄位對應：{'item': ['品項'], 'main': ['姓名', '生日'], 'target': ['對象'], 'wish': ['願望']}
+每個欄位可對應多個欄（以空白串接），欄可用表頭名稱或 Excel 欄名（A、B、…）指定
+"""
+
+import codecs
+import csv
+import io
+import os
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+
+from order_formatter import OrderFormatter
+
+FIELDS = ('item', 'main', 'target', 'wish')
+FIELD_LABELS = {'item': '品項', 'main': '主要人物', 'target': '對象', 'wish': '願望'}
+REQUIRED_FIELDS = ('item', 'main')
+
+# 猜測欄位對應用的表頭關鍵字（依序比對，先符合者優先）
+HEADER_KEYWORDS = (
+    ('target', ('對象',)),
+    ('wish', ('願望', '愿望', '心願', '祈求')),
+    ('item', ('品項', '商品', '項目', '購買')),
+    ('main', ('主要人物', '姓名', '名字', '本人', '生日', '出生')),
+)
+
+TABLE_EXTENSIONS = ('.csv', '.xlsx')
+
+# 判斷 CSV 編碼時讀取的位元組數
+_SNIFF_BYTES = 65536
+
+
+def cell_text(value) -> str:
+    """試算表儲存格轉成文字（日期轉成 年/月/日，整數值的浮點數去掉 .0）"""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y/%m/%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _detect_encoding(binary) -> str:
+    """看開頭一段內容判斷 CSV 編碼：UTF-8（表單匯出）或 cp950（舊版 Excel 另存）"""
+    head = binary.read(_SNIFF_BYTES)
+    binary.seek(0)
+    try:
+        # 只看開頭時最後一個字可能被切斷，用增量解碼器避免誤判
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp950'
+
+
+def iter_csv_rows(source, encoding: Optional[str] = None) -> Iterator[List[str]]:
+    """逐列讀取 CSV（source 為檔案路徑或二進位檔案物件），第一列為表頭"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield from iter_csv_rows(f, encoding)
+        return
+
+    text = io.TextIOWrapper(source, encoding=encoding or _detect_encoding(source), newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        # 不要連同呼叫端的檔案物件一起關閉
+        text.detach()
+
+
+def iter_xlsx_rows(source, sheet: Optional[str] = None) -> Iterator[List[str]]:
+    """以 read_only 模式逐列讀取 xlsx（需要 openpyxl），第一列為表頭"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("讀取 xlsx 需要安裝 openpyxl：pip install openpyxl")
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        for row in worksheet.iter_rows(values_only=True):
+            yield [cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_table_rows(source, filename: Optional[str] = None, sheet: Optional[str] = None) -> Iterator[List[str]]:
+    """依副檔名選擇讀取方式；source 為路徑時可省略 filename"""
+    extension = os.path.splitext(filename or source)[1].lower()
+    if hasattr(source, 'seek'):
+        # 同一個上傳檔可能先讀過表頭
+        source.seek(0)
+    if extension == '.csv':
+        return iter_csv_rows(source)
+    if extension == '.xlsx':
+        return iter_xlsx_rows(source, sheet)
+    raise ValueError(f"不支援的檔案類型：{extension or filename}（可用：{', '.join(TABLE_EXTENSIONS)}）")
+
+
+def guess_mapping(header: List[str]) -> Dict[str, List[str]]:
+    """依表頭關鍵字猜測欄位對應，例如 姓名、生日 兩欄都對應到主要人物"""
+    mapping = {field: [] for field in FIELDS}
+    for name in header:
+        name = name.strip()
+        for field, keywords in HEADER_KEYWORDS:
+            if any(keyword in name for keyword in keywords):
+                mapping[field].append(name)
+                break
+    return mapping
+
+
+def _column_letter_index(ref: str) -> Optional[int]:
+    """Excel 欄名轉成從 0 起算的欄號（A -> 0），不是欄名時回傳 None"""
+    if not ref or len(ref) > 3 or not ref.isascii() or not ref.isalpha() or not ref.isupper():
+        return None
+    index = 0
+    for char in ref:
+        index = index * 26 + ord(char) - ord('A') + 1
+    return index - 1
+
+
+def resolve_mapping(header: List[str], mapping: Dict[str, List[str]]) -> Dict[str, List[int]]:
+    """把欄位對應換成欄號；表頭名稱優先，其次為 Excel 欄名"""
+    positions = {}
+    for position, name in enumerate(header):
+        positions.setdefault(name.strip(), position)
+
+    resolved = {}
+    for field in FIELDS:
+        columns = []
+        for ref in mapping.get(field) or []:
+            position = positions.get(ref.strip())
+            if position is None:
+                position = _column_letter_index(ref.strip())
+            if position is None:
+                raise ValueError(f"找不到{FIELD_LABELS[field]}對應的欄位：{ref}")
+            columns.append(position)
+        resolved[field] = columns
+
+    missing = [FIELD_LABELS[field] for field in REQUIRED_FIELDS if not resolved[field]]
+    if missing:
+        raise ValueError(f"請指定{'、'.join(missing)}對應的欄位")
+    return resolved
+
+
+def mapped_rows(rows: Iterator[List[str]], columns: Dict[str, List[int]]) -> Iterator[List[str]]:
+    """依欄號把每一列組成 [品項, 主要人物, 對象, 願望]"""
+    getters = [columns[field] for field in FIELDS]
+    for row in rows:
+        width = len(row)
+        yield [
+            ' '.join(value for value in (row[i].strip() for i in positions if i < width) if value)
+            for positions in getters
+        ]
+
+
+def read_header(source, filename: Optional[str] = None, sheet: Optional[str] = None) -> List[str]:
+    """只讀取表頭（給介面顯示欄位選單）"""
+    rows = iter_table_rows(source, filename, sheet)
+    try:
+        return next(rows, [])
+    finally:
+        rows.close()
+
+
+def load_table(formatter: OrderFormatter, source, filename: Optional[str] = None,
+               mapping: Optional[Dict[str, List[str]]] = None, sheet: Optional[str] = None,
+               batch: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    把試算表／CSV 逐列載入 formatter，回傳實際使用的欄位對應
+    mapping 省略時依表頭猜測
+    """
+    rows = iter_table_rows(source, filename, sheet)
+    try:
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("檔案是空的")
+        mapping = mapping or guess_mapping(header)
+        columns = resolve_mapping(header, mapping)
+        # 表頭是第 1 列，資料從第 2 列開始
+        formatter.load_rows(mapped_rows(rows, columns), batch=batch, first_line=2)
+    finally:
+        rows.close()
+    return mapping
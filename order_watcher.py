@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 監看資料夾，自動匯入新的訂單檔
+- 新檔案或內容有變動的檔案才會處理；檔案只是往後追加時，只解析新增的部分
+- 只解析到最後一筆完整的訂單（見 complete_orders_end），寫到一半的訂單留到下次掃描；
+  檔案停止寫入超過 settle 秒後，沒有結尾的最後一筆才視為已寫完
+- 輸出到監看資料夾時，彙總報表、統計檔與狀態檔不列入掃描
+- 同一波連續寫入會先等檔案穩定（debounce）再處理
+- 每次有變動後，以「寫暫存檔再替換」的方式更新彙總報表與統計檔
+- 處理進度記在狀態檔中，重新啟動也不會重複匯入已處理過的內容
+
+啟動：python order_watcher.py 收單資料夾 -o 彙總輸出 --pattern "*.txt"
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from order_formatter import OrderFormatter, complete_orders_end, normalize_order_text
+
+STATE_FILENAME = '.order_watcher_state.json'
+REPORT_FILENAME = '彙總報表.md'
+STATISTICS_FILENAME = '彙總統計.txt'
+
+# 原子寫入的暫存檔前綴（掃描時略過）
+TEMP_PREFIX = '.tmp_'
+
+# 判斷檔案是否只是往後追加時，比對已處理內容最後這一段的雜湊
+TAIL_CHECK_BYTES = 4096
+
+
+def atomic_write(path: str, content: str):
+    """先寫入同資料夾的暫存檔再替換，讀取端不會看到寫到一半的檔案"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _tail_digest(data: bytes) -> str:
+    return hashlib.sha1(data[-TAIL_CHECK_BYTES:]).hexdigest()
+
+
+class FileContribution:
+    """單一檔案目前為止對彙總的貢獻（可整筆扣回）"""
+
+    def __init__(self):
+        self.offset = 0            # 已處理到的位元組位置（最後一筆完整訂單之後）
+        self.tail = ''             # 已處理內容最後一段的雜湊
+        self.size = 0
+        self.mtime = 0.0
+        self.orders = 0
+        self.units = 0
+        self.item_stats = Counter()
+        self.item_amounts = Counter()
+        self.anomalies = []
+
+    def to_dict(self) -> Dict:
+        return {
+            'offset': self.offset, 'tail': self.tail, 'size': self.size, 'mtime': self.mtime,
+            'orders': self.orders, 'units': self.units,
+            'item_stats': dict(self.item_stats), 'item_amounts': dict(self.item_amounts),
+            'anomalies': self.anomalies,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'FileContribution':
+        contribution = cls()
+        contribution.offset = data['offset']
+        contribution.tail = data['tail']
+        contribution.size = data['size']
+        contribution.mtime = data['mtime']
+        contribution.orders = data['orders']
+        contribution.units = data['units']
+        contribution.item_stats = Counter(data['item_stats'])
+        contribution.item_amounts = Counter(data['item_amounts'])
+        contribution.anomalies = data['anomalies']
+        return contribution
+
+
+class FolderWatcher:
+    """
+    監看資料夾並維護所有訂單檔的即時彙總
+    - pattern：要處理的檔名樣式（例如 *.txt）
+    - debounce：檔案大小與修改時間維持不變多少秒後才處理
+    - settle：最後一筆訂單沒有結尾（換行、空行）時，檔案停止寫入多少秒後才當作已寫完
+    """
+
+    def __init__(self, folder: str, output_dir: str, pattern: str = '*.txt',
+                 debounce: float = 2.0, reference_data: Optional[str] = None, quiet: bool = False,
+                 settle: float = 60.0):
+        self.folder = folder
+        self.output_dir = output_dir
+        self.pattern = pattern
+        self.debounce = debounce
+        self.settle = settle
+        self.reference_data = reference_data
+        self.quiet = quiet
+        self.state_path = os.path.join(output_dir, STATE_FILENAME)
+        # 輸出到監看資料夾時，自己寫出的檔案不能再被當成訂單讀回來
+        same_folder = os.path.realpath(output_dir) == os.path.realpath(folder)
+        self.ignored = {STATE_FILENAME, REPORT_FILENAME, STATISTICS_FILENAME} if same_folder else set()
+
+        self.files: Dict[str, FileContribution] = {}
+        self.pending: Dict[str, tuple] = {}   # 檔名 -> (大小, 修改時間, 第一次看到此狀態的時間)
+        self.totals = FileContribution()
+        self._load_state()
+
+    # ===== 狀態檔 =====
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for name, entry in data.get('files', {}).items():
+            contribution = FileContribution.from_dict(entry)
+            self.files[name] = contribution
+            self._apply(contribution, 1)
+
+    def _save_state(self):
+        data = {
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'files': {name: c.to_dict() for name, c in self.files.items()},
+        }
+        atomic_write(self.state_path, json.dumps(data, ensure_ascii=False))
+
+    # ===== 彙總維護 =====
+
+    def _apply(self, contribution: FileContribution, sign: int):
+        """把一個檔案（或一段新增內容）的貢獻加進 / 扣出總計"""
+        self.totals.orders += sign * contribution.orders
+        self.totals.units += sign * contribution.units
+        for name, quantity in contribution.item_stats.items():
+            self.totals.item_stats[name] += sign * quantity
+        for name, amount in contribution.item_amounts.items():
+            self.totals.item_amounts[name] += sign * amount
+        # 歸零的品項從總計中移除
+        self.totals.item_stats = +self.totals.item_stats
+        self.totals.item_amounts = Counter({k: v for k, v in self.totals.item_amounts.items()
+                                            if k in self.totals.item_stats})
+
+    def _parse_chunk(self, name: str, text: str, order_offset: int) -> FileContribution:
+        """解析一段新內容，回傳它的貢獻（異常訂單編號換算成檔案內的編號）"""
+        formatter = OrderFormatter()
+        formatter.load_data(normalize_order_text(text), batch=name)
+
+        chunk = FileContribution()
+        chunk.orders = len(formatter.orders)
+        chunk.units = len(formatter.expanded_orders)
+        chunk.item_stats = Counter(formatter.item_stats)
+        chunk.item_amounts = Counter(formatter.item_amounts)
+        for anomaly in formatter.anomalies:
+            anomaly = dict(anomaly)
+            anomaly['original_index'] += order_offset
+            anomaly['source'] = name
+            chunk.anomalies.append(anomaly)
+        return chunk
+
+    def _process_file(self, name: str, size: int, mtime: float, now: float) -> bool:
+        """處理一個已穩定的檔案，回傳彙總是否有變動"""
+        path = os.path.join(self.folder, name)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        contribution = self.files.get(name)
+        appended = (
+            contribution is not None
+            and len(data) >= contribution.offset
+            and _tail_digest(data[:contribution.offset]) == contribution.tail
+        )
+
+        if appended:
+            action = '追加'
+        else:
+            # 新檔案，或檔案被改寫（不是單純往後追加）：扣回舊貢獻後整份重新解析
+            action = '新增' if contribution is None else '重新解析'
+            if contribution is not None:
+                self._apply(contribution, -1)
+            contribution = FileContribution()
+            self.files[name] = contribution
+
+        # 只取到最後一筆完整的訂單，寫到一半的部分留到檔案下次變動（或停止寫入超過 settle 秒）時再處理
+        new_text = data[contribution.offset:].decode('utf-8', errors='surrogateescape')
+        complete = len(new_text) if now - mtime >= self.settle else complete_orders_end(new_text)
+        new_bytes = new_text[:complete].encode('utf-8', errors='surrogateescape')
+        end = contribution.offset + len(new_bytes)
+        contribution.size = size
+        contribution.mtime = mtime
+        if not new_bytes.strip():
+            contribution.offset = end
+            contribution.tail = _tail_digest(data[:end])
+            return False
+
+        chunk = self._parse_chunk(name, new_bytes.decode('utf-8-sig', errors='replace'), contribution.orders)
+        contribution.offset = end
+        contribution.tail = _tail_digest(data[:end])
+        contribution.orders += chunk.orders
+        contribution.units += chunk.units
+        contribution.item_stats.update(chunk.item_stats)
+        contribution.item_amounts.update(chunk.item_amounts)
+        contribution.anomalies.extend(chunk.anomalies)
+        self._apply(chunk, 1)
+
+        self._log(f"📥 {action} {name}：{chunk.orders} 筆訂單 / {chunk.units} 支"
+                  + (f"，⚠️ 異常 {len(chunk.anomalies)} 筆" if chunk.anomalies else "")
+                  + ("，最後一筆尚未寫完，下次再處理" if new_text[complete:].strip() else ""))
+        return True
+
+    def _forget_file(self, name: str):
+        """檔案被刪除時，扣回它的貢獻"""
+        contribution = self.files.pop(name)
+        self._apply(contribution, -1)
+        self._log(f"🗑️ 移除 {name}：扣回 {contribution.orders} 筆訂單")
+
+    # ===== 掃描 =====
+
+    def scan(self, now: float = None, force: bool = False) -> int:
+        """
+        掃描一次資料夾，處理已穩定的新檔案 / 變動檔案，回傳處理的檔案數
+        force=True 時不等待 debounce（給 --once 單次執行使用）
+        """
+        now = now or time.time()
+        seen = set()
+        ready = []
+
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if (not entry.is_file() or entry.name in self.ignored or entry.name.startswith(TEMP_PREFIX)
+                        or not fnmatch.fnmatch(entry.name, self.pattern)):
+                    continue
+                stat = entry.stat()
+                seen.add(entry.name)
+
+                known = self.files.get(entry.name)
+                if known and known.size == stat.st_size and known.mtime == stat.st_mtime:
+                    self.pending.pop(entry.name, None)
+                    if known.offset < known.size and now - stat.st_mtime >= self.settle:
+                        # 留下沒有結尾的最後一筆，檔案已停止寫入夠久：當作寫完處理
+                        ready.append((entry.name, stat.st_size, stat.st_mtime))
+                    continue
+
+                signature = (stat.st_size, stat.st_mtime)
+                pending = self.pending.get(entry.name)
+                if pending is None or pending[:2] != signature:
+                    # 第一次看到這個狀態，開始計算穩定時間
+                    self.pending[entry.name] = (*signature, now)
+                    if not force:
+                        continue
+                elif now - pending[2] < self.debounce and not force:
+                    continue
+                ready.append((entry.name, *signature))
+
+        changed = False
+        for name in [n for n in self.files if n not in seen]:
+            self._forget_file(name)
+            changed = True
+
+        processed = 0
+        for name, size, mtime in sorted(ready):
+            self.pending.pop(name, None)
+            try:
+                changed = self._process_file(name, size, mtime, now) or changed
+                processed += 1
+            except OSError as e:
+                self._log(f"❌ 無法讀取 {name}：{e}")
+
+        if changed:
+            self.write_outputs()
+        if changed or processed:
+            self._save_state()
+        return processed
+
+    def run(self, interval: float = 1.0):
+        """持續監看，直到按 Ctrl+C"""
+        self._log(f"👀 監看 {self.folder}（{self.pattern}），輸出到 {self.output_dir}")
+        try:
+            while True:
+                self.scan()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self._log("👋 已停止監看")
+
+    # ===== 輸出 =====
+
+    def write_outputs(self):
+        """重新輸出彙總報表與統計檔（原子替換）"""
+        formatter = OrderFormatter()
+        formatter.item_stats.update(self.totals.item_stats)
+        formatter.item_amounts.update(self.totals.item_amounts)
+        formatter.anomalies = [a for c in self.files.values() for a in c.anomalies]
+
+        report = []
+        report.append("\n# 📈 彙總摘要\n")
+        report.append(f"- **更新時間**：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        report.append(f"- **檔案數**：{len(self.files)} 個")
+        report.append(f"- **總訂單數**：{self.totals.orders} 筆")
+        report.append(f"- **總品項數**（展開後）：{self.totals.units} 支")
+        report.append(f"- **品項種類數**：{len(self.totals.item_stats)} 種")
+        report.append(f"- **總金額**：${sum(self.totals.item_amounts.values())}")
+        report.append(f"- **異常訂單數**：{len(formatter.anomalies)} 筆")
+
+        report.append("\n---\n")
+        report.append("\n# 📁 各檔案明細\n")
+        report.append("| 檔案 | 訂單數 | 品項數 | 金額 | 異常 |")
+        report.append("|------|--------|--------|------|------|")
+        for name in sorted(self.files):
+            c = self.files[name]
+            report.append(f"| {name} | {c.orders} | {c.units} | ${sum(c.item_amounts.values())} | {len(c.anomalies)} |")
+
+        report.append("\n---\n")
+        report.append(formatter.generate_statistics())
+        if self.reference_data:
+            report.append("\n---\n")
+            report.append(formatter.compare_with_reference(self.reference_data))
+        report.append("\n---\n")
+        report.append(formatter.generate_anomaly_report())
+        if formatter.anomalies:
+            report.append("\n| 來源檔案 | 檔案內編號 |\n|----------|------------|")
+            report.extend(f"| {a['source']} | {a['original_index']} |" for a in formatter.anomalies)
+
+        atomic_write(os.path.join(self.output_dir, REPORT_FILENAME), '\n'.join(report))
+        atomic_write(os.path.join(self.output_dir, STATISTICS_FILENAME), formatter.generate_plain_statistics())
+
+    def _log(self, message: str):
+        if not self.quiet:
+            print(f"{datetime.now().strftime('%H:%M:%S')} {message}", file=sys.stderr)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """監看模式的命令列參數（order_watcher.py 與 order_cli.py watch 共用）"""
+    parser.add_argument('folder', help="要監看的資料夾")
+    parser.add_argument('-o', '--output-dir', help="彙總輸出資料夾（預設為監看資料夾）")
+    parser.add_argument('--pattern', default='*.txt', help="要處理的檔名樣式（預設 *.txt）")
+    parser.add_argument('--debounce', type=float, default=2.0, help="檔案維持不變幾秒後才處理（預設 2）")
+    parser.add_argument('--interval', type=float, default=1.0, help="掃描間隔秒數（預設 1）")
+    parser.add_argument('--settle', type=float, default=60.0,
+                        help="最後一筆訂單沒有結尾（換行、空行）時，檔案停止寫入幾秒後才當作已寫完（預設 60）")
+    parser.add_argument('-r', '--reference', help="參考數據檔案（彙總報表中加入差異比對）")
+    parser.add_argument('--once', action='store_true', help="只掃描處理一次就結束（適合排程）")
+    parser.add_argument('-q', '--quiet', action='store_true', help="不輸出處理紀錄")
+
+
+def run(args) -> int:
+    """依命令列參數啟動監看"""
+    if not os.path.isdir(args.folder):
+        print(f"❌ 找不到資料夾：{args.folder}", file=sys.stderr)
+        return 2
+
+    output_dir = args.output_dir or args.folder
+    os.makedirs(output_dir, exist_ok=True)
+
+    reference_data = None
+    if args.reference:
+        with open(args.reference, 'r', encoding='utf-8-sig') as f:
+            reference_data = f.read().strip() or None
+
+    watcher = FolderWatcher(args.folder, output_dir, pattern=args.pattern, debounce=args.debounce,
+                            reference_data=reference_data, quiet=args.quiet, settle=args.settle)
+    if args.once:
+        watcher.scan(force=True)
+        watcher.write_outputs()
+    else:
+        watcher.run(interval=args.interval)
+    return 0
+
+
+def main(argv: List[str] = None) -> int:
+    """主程式"""
+    parser = argparse.ArgumentParser(description="訂單資料整理工具 - 監看資料夾自動匯入")
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
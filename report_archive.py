@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 歷史報表封存
+每批的完整報表與解析後的訂單壓縮（lzma 或 gzip）後附加到同一個封存檔，另有一份小的索引檔記錄
+每筆封存的日期、批次、客人與品項，以及在封存檔中的位置
+
+- 封存檔只往後附加，每筆紀錄前有標頭（識別字、壓縮方式、長度），索引檔遺失或損壞時可重新掃描重建
+- 查詢先看索引（客人、品項、日期），只解壓縮符合的那幾筆，不必打開全部的報表
+- 舊的「訂單報表_YYYYMMDD_HHMMSS.md」也可以匯入：從明細區塊還原訂單與索引
+- 附加與編號分配期間持有 archive.lock 檔案鎖，網頁版與命令列同時封存也不會拿到相同編號
+
+目錄結構：
+    封存資料夾/archive.dat   壓縮後的紀錄（附加寫入）
+    封存資料夾/archive.idx   索引（JSON Lines，每筆封存一行）
+    封存資料夾/archive.lock  寫入時的檔案鎖
+"""
+
+import gzip
+import json
+import lzma
+import mmap
+import os
+import re
+import struct
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from order_formatter import OrderFormatter, parse_person
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.expanduser('~'), '.order_formatter', 'archive')
+DATA_FILENAME = 'archive.dat'
+INDEX_FILENAME = 'archive.idx'
+LOCK_FILENAME = 'archive.lock'
+
+# 壓縮方式代碼 -> (說明, 壓縮, 解壓縮)
+ARCHIVE_CODECS = {
+    'xz': ('lzma（壓縮率高）', lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    'gz': ('gzip（較快）', lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+}
+DEFAULT_CODEC = 'xz'
+
+# 紀錄標頭：識別字 4 bytes、壓縮方式 2 bytes、壓縮後長度 8 bytes
+_MAGIC = b'ORA1'
+_HEADER = struct.Struct('>4s2sQ')
+
+# 舊報表檔名中的時間，例如 訂單報表_20260105_183012.md
+_REPORT_FILENAME_TIME = re.compile(r'(\d{8})_(\d{6})')
+
+
+@contextmanager
+def _file_lock(path: str):
+    """跨行程（與跨執行緒）的排他鎖，離開 with 區塊時釋放"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ArchiveEntry(NamedTuple):
+    """索引中的一筆封存（不含報表內容）"""
+    number: int             # 封存編號（從 1 起算）
+    name: str               # 名稱（輸入檔名或使用者指定）
+    created: str            # 封存時間 YYYY-MM-DD HH:MM:SS
+    batch: str              # 批次標籤
+    orders: int
+    units: int
+    amount: int
+    customers: Tuple[str, ...]  # 主要人物識別鍵（PersonInfo.key）
+    items: Dict[str, int]       # 品項 -> 數量
+    codec: str
+    offset: int             # 壓縮內容在封存檔中的位置
+    length: int             # 壓縮後的長度
+
+    @property
+    def date(self) -> str:
+        return self.created[:10]
+
+    def to_json(self) -> str:
+        data = self._asdict()
+        data['customers'] = list(self.customers)
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line: str) -> 'ArchiveEntry':
+        data = json.loads(line)
+        data['customers'] = tuple(data['customers'])
+        return cls(**data)
+
+
+def _order_records(formatter: OrderFormatter) -> List[Dict]:
+    """封存用的訂單欄位（原始欄位即可重建 formatter，展開明細不另外保存）"""
+    return [
+        {
+            'id': order.get('id', ''),
+            'index': order['index'],
+            'raw_items': order['raw_items'],
+            'main_person': order['main_person'],
+            'target_person': order['target_person'],
+            'wish': order['wish'],
+            'batch': order['batch'],
+        }
+        for order in formatter.orders
+    ]
+
+
+def parse_report_details(report: str) -> List[Dict]:
+    """
+    從完整報表（Markdown）的訂單明細區塊還原訂單：每 5 行一支（編號、品項、主要人物、對象、願望），
+    連續且人物、願望相同的明細視為同一筆訂單
+    """
+    start = report.find('# 📋 訂單明細表')
+    if start < 0:
+        return []
+    end = report.find('\n# ', start + 1)
+    section = report[start:end if end >= 0 else len(report)]
+    lines = section.split('\n---\n', 1)[-1].split('\n')
+
+    # 依明細編號 1、2、3…… 往下找，編號後面固定 4 行（對象可能是空行，不能用空行分段）
+    orders = []
+    previous = None
+    expected = 1
+    position = 0
+    while position + 4 < len(lines):
+        if lines[position].strip() != str(expected):
+            position += 1
+            continue
+        item, main_person, target_person, wish = lines[position + 1:position + 5]
+        key = (main_person, target_person, wish)
+        if key != previous:
+            orders.append({'items': {}, 'main_person': main_person, 'target_person': target_person, 'wish': wish})
+            previous = key
+        items = orders[-1]['items']
+        items[item] = items.get(item, 0) + 1
+        expected += 1
+        position += 5
+
+    for order in orders:
+        order['raw_items'] = '+'.join(f"{name}x{quantity}" for name, quantity in order.pop('items').items())
+    return orders
+
+
+class ReportArchive:
+    """歷史報表封存（附加寫入的壓縮紀錄 + 索引）"""
+
+    def __init__(self, directory: str = DEFAULT_ARCHIVE_DIR):
+        self.directory = directory
+        self.data_path = os.path.join(directory, DATA_FILENAME)
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self.lock_path = os.path.join(directory, LOCK_FILENAME)
+        self._entries = []
+        self._index_size = -1  # 已讀入的索引檔大小，其他行程附加後會重新讀取
+
+    @property
+    def entries(self) -> List[ArchiveEntry]:
+        """所有封存（依封存順序），索引檔有變動時自動重新讀取"""
+        self.refresh()
+        return self._entries
+
+    def refresh(self):
+        """索引檔大小有變動時重新讀取（只讀索引，不碰封存檔）"""
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if size == self._index_size:
+            return
+        entries = []
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        if size:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = ArchiveEntry.from_json(line)
+                    except (ValueError, TypeError, KeyError):
+                        continue  # 寫到一半的最後一行
+                    if entry.offset + entry.length <= data_size:
+                        entries.append(entry)
+        self._entries = entries
+        self._index_size = size
+
+    def add(self, formatter: OrderFormatter, report: Optional[str] = None, name: str = '',
+            reference_data: Optional[str] = None, codec: str = DEFAULT_CODEC,
+            created: Optional[datetime] = None) -> ArchiveEntry:
+        """
+        封存一批訂單：完整報表（未提供時現場生成）與原始訂單欄位
+        例如：archive.add(formatter, name='今日收單.txt')
+        """
+        if report is None:
+            report = formatter.generate_full_report(reference_data)
+        items = {item_name: quantity for item_name, quantity in sorted(formatter.item_stats.items()) if quantity}
+        customers = {order['main_info'].key for order in formatter.orders}
+        return self._append(
+            name=name or formatter.batch, created=created, batch=formatter.batch, report=report,
+            orders=_order_records(formatter), units=len(formatter.expanded_orders),
+            amount=sum(formatter.item_amounts.values()), customers=customers, items=items, codec=codec,
+        )
+
+    def add_report_file(self, path: str, codec: str = DEFAULT_CODEC) -> ArchiveEntry:
+        """匯入舊的報表檔（Markdown），時間取自檔名（訂單報表_YYYYMMDD_HHMMSS.md），沒有時用檔案修改時間"""
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            report = f.read()
+        match = _REPORT_FILENAME_TIME.search(os.path.basename(path))
+        created = None
+        if match:
+            try:
+                created = datetime.strptime(''.join(match.groups()), '%Y%m%d%H%M%S')
+            except ValueError:
+                created = None
+        created = created or datetime.fromtimestamp(os.path.getmtime(path))
+        return self.add_report_text(report, os.path.basename(path), created, codec)
+
+    def add_report_text(self, report: str, name: str, created: Optional[datetime] = None,
+                        codec: str = DEFAULT_CODEC) -> ArchiveEntry:
+        """封存只有報表文字的批次（訂單與索引從明細區塊還原，金額依目前價目表估算）"""
+        orders = parse_report_details(report)
+        formatter = OrderFormatter()
+        formatter.batch = (created or datetime.now()).strftime('%Y-%m-%d')
+        if orders:
+            formatter.load_rows([order['raw_items'], order['main_person'], order['target_person'], order['wish']]
+                                for order in orders)
+        return self.add(formatter, report=report, name=name, codec=codec, created=created)
+
+    def _append(self, name: str, created: Optional[datetime], batch: str, report: str, orders: List[Dict],
+                units: int, amount: int, customers, items: Dict[str, int], codec: str) -> ArchiveEntry:
+        if codec not in ARCHIVE_CODECS:
+            raise ValueError(f"不支援的壓縮方式：{codec}（可用：{', '.join(ARCHIVE_CODECS)}）")
+        created_text = (created or datetime.now()).isoformat(sep=' ', timespec='seconds')
+        payload = json.dumps({'name': name, 'created': created_text, 'batch': batch, 'report': report,
+                              'orders': orders}, ensure_ascii=False).encode('utf-8')
+        compressed = ARCHIVE_CODECS[codec][1](payload)
+
+        os.makedirs(self.directory, exist_ok=True)
+        # 壓縮在鎖外完成；附加、編號與寫索引在鎖內，其他行程寫入的封存先讀進來再編號
+        with _file_lock(self.lock_path):
+            self.refresh()
+            number = (self._entries[-1].number if self._entries else 0) + 1
+            with open(self.data_path, 'ab') as f:
+                f.write(_HEADER.pack(_MAGIC, codec.encode('ascii'), len(compressed)))
+                offset = f.tell()
+                f.write(compressed)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # 先寫入封存檔再寫索引：中途中斷時只會多出沒有索引的紀錄（可用 rebuild_index 找回）
+            entry = ArchiveEntry(number, name, created_text, batch, len(orders), units, amount,
+                                 tuple(sorted(customers)), items, codec, offset, len(compressed))
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                # 上次寫到一半（沒有換行）的索引行不能和這一行接在一起
+                prefix = '\n' if 0 < self._index_size and not self._index_ends_with_newline() else ''
+                f.write(prefix + entry.to_json() + '\n')
+            self._entries.append(entry)
+            self._index_size = os.path.getsize(self.index_path)
+        return entry
+
+    def _index_ends_with_newline(self) -> bool:
+        with open(self.index_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def read(self, entry: ArchiveEntry) -> Dict:
+        """解壓縮單筆封存：{'name', 'created', 'batch', 'report', 'orders'}（只讀這一筆的位元組）"""
+        with open(self.data_path, 'rb') as f:
+            f.seek(entry.offset)
+            compressed = f.read(entry.length)
+        return json.loads(ARCHIVE_CODECS[entry.codec][2](compressed).decode('utf-8'))
+
+    def report(self, entry: ArchiveEntry) -> str:
+        return self.read(entry)['report']
+
+    def load_formatter(self, entry: ArchiveEntry) -> OrderFormatter:
+        """用封存的原始訂單欄位重建 formatter（可重新生成各種報表與輸出）"""
+        payload = self.read(entry)
+        formatter = OrderFormatter()
+        formatter.batch = payload['batch']
+        formatter.load_rows([order['raw_items'], order['main_person'], order['target_person'], order['wish']]
+                            for order in payload['orders'])
+        return formatter
+
+    def get(self, number: int) -> ArchiveEntry:
+        """依封存編號取得索引（找不到時丟出 KeyError）"""
+        entries = self.entries
+        if 1 <= number <= len(entries) and entries[number - 1].number == number:
+            return entries[number - 1]
+        for entry in entries:
+            if entry.number == number:
+                return entry
+        raise KeyError(f"找不到封存編號 {number}")
+
+    def find(self, customer: str = None, item: str = None, since: str = None, until: str = None,
+             name: str = None) -> List[ArchiveEntry]:
+        """
+        只用索引篩選封存（新的在前）：customer 比對主要人物識別鍵的一部分（例如姓名或生日），
+        item 比對品項名稱的一部分，since／until 為 YYYY-MM-DD（含），name 比對名稱或批次標籤
+        """
+        customer = (customer or '').strip().upper()
+        item = (item or '').strip()
+        name = (name or '').strip()
+        matched = []
+        for entry in reversed(self.entries):
+            if since and entry.date < since:
+                continue
+            if until and entry.date > until:
+                continue
+            if name and name not in entry.name and name not in entry.batch:
+                continue
+            if item and not any(item in item_name for item_name in entry.items):
+                continue
+            if customer and not any(customer in key.upper() for key in entry.customers):
+                continue
+            matched.append(entry)
+        return matched
+
+    def find_orders(self, customer: str = None, item: str = None, since: str = None,
+                    until: str = None) -> Iterator[Tuple[ArchiveEntry, Dict]]:
+        """找出符合條件的訂單：先用索引挑出封存，只解壓縮那幾筆再逐筆比對"""
+        query = (customer or '').strip().upper()
+        item = (item or '').strip()
+        for entry in self.find(customer, item, since, until):
+            for order in self.read(entry)['orders']:
+                if item and item not in order['raw_items']:
+                    continue
+                if query and query not in parse_person(order['main_person']).key.upper():
+                    continue
+                yield entry, order
+
+    def rebuild_index(self) -> int:
+        """
+        依封存檔重新建立索引檔（索引遺失或損壞時），回傳找回的筆數
+        損壞的紀錄（例如寫到一半中斷）略過，往後找下一個紀錄標頭繼續，之後寫入的封存不會跟著遺失
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with _file_lock(self.lock_path):
+            entries = []
+            size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+            if size:
+                with open(self.data_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    position = 0
+                    while position + _HEADER.size <= size:
+                        entry = self._scan_record(data, position, size, len(entries) + 1)
+                        if entry is not None:
+                            entries.append(entry)
+                            position = entry.offset + entry.length
+                            continue
+                        position = data.find(_MAGIC, position + 1)
+                        if position < 0:
+                            break
+
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(entry.to_json() + '\n')
+            os.replace(temp_path, self.index_path)
+            self._index_size = -1
+        return len(entries)
+
+    @staticmethod
+    def _scan_record(data, position: int, size: int, number: int) -> Optional[ArchiveEntry]:
+        """讀取 position 處的一筆紀錄並重建索引；標頭不符、長度不足或無法解壓縮時回傳 None"""
+        magic, codec, length = _HEADER.unpack_from(data, position)
+        offset = position + _HEADER.size
+        if magic != _MAGIC or offset + length > size:
+            return None
+        try:
+            codec = codec.decode('ascii')
+            payload = json.loads(ARCHIVE_CODECS[codec][2](data[offset:offset + length]).decode('utf-8'))
+            orders = payload['orders']
+            formatter = OrderFormatter()
+            formatter.load_rows([order['raw_items'], order['main_person'], order['target_person'], order['wish']]
+                                for order in orders)
+            return ArchiveEntry(
+                number, payload['name'], payload['created'], payload['batch'],
+                len(orders), len(formatter.expanded_orders), sum(formatter.item_amounts.values()),
+                tuple(sorted({order['main_info'].key for order in formatter.orders})),
+                {name: quantity for name, quantity in sorted(formatter.item_stats.items()) if quantity},
+                codec, offset, length,
+            )
+        except (KeyError, TypeError, ValueError, EOFError, OSError, lzma.LZMAError, zlib.error):
+            return None
+
+    def stats(self) -> Dict:
+        """封存概況（只看索引與檔案大小，不解壓縮）"""
+        entries = self.entries
+        return {
+            'entries': len(entries),
+            'orders': sum(entry.orders for entry in entries),
+            'data_bytes': os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0,
+            'index_bytes': max(self._index_size, 0),
+        }
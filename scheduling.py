@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單資料整理工具 - 法事排程
+每個品項每天能做的數量有限，把批次展開後的每一支分配到各天，並盡量讓同一位客人的品項排在同一天
+
+- 以客人（或訂單）為一組，依第一次出現的順序處理（先下單先排）
+- 每組從各品項「還有空位的第一天」開始，往後最多看 lookahead 天，找到能整組放下的一天
+- 整組放不下（單組需求超過每日產能，或前幾天都已排滿）時才拆開，各品項分別排進最早還有空位的日子
+- 各品項的「第一個有空位的日子」只會往後移，總工作量約與支數加天數成正比
+
+每天的排程是一份展開明細（與 expanded_orders 相同的欄位），可直接交給統計、標籤與工作單輸出
+"""
+
+import json
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from order_formatter import OrderFormatter, parse_reference_data
+
+# 分組方式代碼 -> 說明
+GROUPINGS = {
+    'customer': '同一客人排同一天',
+    'order': '同一訂單排同一天',
+}
+
+DEFAULT_GROUPING = 'customer'
+
+# 整組排入時最多往後找幾天
+LOOKAHEAD_DAYS = 7
+
+
+def parse_capacity(capacity_text: str) -> Dict[str, int]:
+    """每日產能文字與參考數據格式相同，例如：帕猜佛蠟燭 60 支、拆散 10 支"""
+    return parse_reference_data(capacity_text)
+
+
+class ScheduleDay(NamedTuple):
+    """一天的排程"""
+    day: int            # 第幾天（從 1 起算）
+    date: str           # 日期 YYYY-MM-DD
+    rows: List[Dict]    # 當天的展開明細（同一組的明細相鄰）
+
+    @property
+    def label(self) -> str:
+        return f"第 {self.day} 天（{self.date}）"
+
+    def item_counts(self) -> Dict[str, int]:
+        counts = defaultdict(int)
+        for row in self.rows:
+            counts[row['item']] += 1
+        return dict(counts)
+
+
+class Schedule:
+    """排程結果"""
+
+    def __init__(self, grouping: str, capacities: Dict[str, int], days: List[ScheduleDay],
+                 groups: int, split_groups: int):
+        self.grouping = grouping
+        self.capacities = capacities
+        self.days = days
+        self.groups = groups
+        self.split_groups = split_groups
+
+    @property
+    def units(self) -> int:
+        return sum(len(day.rows) for day in self.days)
+
+    def summary(self) -> str:
+        """一行文字摘要，例如：共 314 支排入 5 天 • 客人 86 組，其中 2 組拆到不同天"""
+        unit = '客人' if self.grouping == 'customer' else '訂單'
+        return (f"共 {self.units} 支排入 {len(self.days)} 天 • {unit} {self.groups} 組，"
+                f"其中 {self.split_groups} 組拆到不同天")
+
+    def to_dict(self) -> Dict:
+        """可 JSON 序列化的排程"""
+        return {
+            'grouping': self.grouping,
+            'capacities': self.capacities,
+            'summary': {'units': self.units, 'days': len(self.days), 'groups': self.groups,
+                        'split_groups': self.split_groups},
+            'days': [{'day': day.day, 'date': day.date, 'item_counts': day.item_counts(), 'rows': day.rows}
+                     for day in self.days],
+        }
+
+    def render_markdown(self) -> str:
+        """Markdown 排程：每天的品項統計（與品項統計表相同格式）與當天明細"""
+        def cell(text):
+            return str(text).replace('|', '\\|')
+
+        result = ["# 📅 法事排程\n", f"**{self.summary()}**\n"]
+        if self.capacities:
+            result.append("**每日產能**：" + '、'.join(f"{item} {capacity} 支"
+                                                   for item, capacity in sorted(self.capacities.items())) + "\n")
+
+        for day in self.days:
+            result.append(f"\n## {day.label} — {len(day.rows)} 支\n")
+            result.append(render_day_statistics(day))
+            result.append("\n| 編號 | 品項 | 主要人物 | 對象 | 願望 |")
+            result.append("|------|------|----------|------|------|")
+            for row in day.rows:
+                result.append(f"| {row['index']} | {cell(row['item'])} | {cell(row['main_person'])} | "
+                              f"{cell(row['target_person'])} | {cell(row['wish'])} |")
+        return '\n'.join(result)
+
+    def render_plain(self) -> str:
+        """Tab 分隔：日期在最前面，其餘欄位與純明細相同"""
+        lines = []
+        for day in self.days:
+            prefix = day.date + '\t'
+            lines.extend(prefix + OrderFormatter.DETAIL_LINE.render(row) for row in day.rows)
+        return '\n'.join(lines)
+
+
+def render_day_statistics(day: ScheduleDay) -> str:
+    """當天的品項統計表（Markdown，格式同品項統計總表）"""
+    quantities = defaultdict(int)
+    amounts = defaultdict(int)
+    prices = {}
+    for row in day.rows:
+        quantities[row['item']] += 1
+        amounts[row['item']] += row['price']
+        prices[row['item']] = row['price']
+
+    rows = [(item, quantities[item], prices[item], amounts[item]) for item in sorted(quantities)]
+    result = ["| 品項名稱 | 數量 | 單價 | 小計金額 |", "|----------|------|------|----------|"]
+    if rows:
+        result.append(OrderFormatter.STATISTICS_ROW.render_lines(rows))
+    result.append(f"| **總計** | **{len(day.rows)}** | - | **${sum(amounts.values())}** |")
+    return '\n'.join(result)
+
+
+def _group_rows(formatter: OrderFormatter, grouping: str) -> List[List[Dict]]:
+    """一次掃描展開明細，依客人或訂單分組（保留第一次出現的順序）"""
+    groups = {}
+    customer_of = {}
+    for row in formatter.expanded_orders:
+        order_index = row['order_index']
+        if grouping == 'order':
+            key = order_index
+        else:
+            key = customer_of.get(order_index)
+            if key is None:
+                key = customer_of[order_index] = formatter.get_order(order_index)['main_info'].key
+        rows = groups.get(key)
+        if rows is None:
+            rows = groups[key] = []
+        rows.append(row)
+    return list(groups.values())
+
+
+def schedule_units(formatter: OrderFormatter, capacities: Dict[str, int], grouping: str = DEFAULT_GROUPING,
+                   start: Optional[date] = None, lookahead: int = LOOKAHEAD_DAYS) -> Schedule:
+    """
+    依每日產能把展開明細排進各天，capacities 為 {品項: 每日數量}（沒列出的品項不限量）
+    例如：schedule_units(formatter, {'帕猜佛蠟燭': 60, '拆散': 10}, start=date(2026, 11, 1))
+    """
+    if grouping not in GROUPINGS:
+        raise ValueError(f"不支援的分組方式：{grouping}（可用：{', '.join(GROUPINGS)}）")
+    invalid = [item for item, capacity in capacities.items() if capacity <= 0]
+    if invalid:
+        raise ValueError(f"每日產能必須大於 0：{'、'.join(invalid)}")
+
+    left = []          # 每天各品項剩餘的產能
+    day_rows = []      # 每天排入的明細
+    first_open = defaultdict(int)  # 品項 -> 第一個還有空位的日子
+
+    def ensure(day: int):
+        while len(left) <= day:
+            left.append(dict(capacities))
+            day_rows.append([])
+
+    def advance(item: str):
+        day = first_open[item]
+        ensure(day)
+        while left[day][item] == 0:
+            day += 1
+            ensure(day)
+        first_open[item] = day
+
+    groups = _group_rows(formatter, grouping)
+    split_groups = 0
+    for rows in groups:
+        counts = defaultdict(int)
+        for row in rows:
+            if row['item'] in capacities:
+                counts[row['item']] += 1
+
+        # 找一天整組放下
+        placed = None
+        if all(count <= capacities[item] for item, count in counts.items()):
+            first = max((first_open[item] for item in counts), default=0)
+            for day in range(first, first + lookahead):
+                ensure(day)
+                if all(left[day][item] >= count for item, count in counts.items()):
+                    placed = day
+                    break
+
+        if placed is not None:
+            day_rows[placed].extend(rows)
+            for item, count in counts.items():
+                left[placed][item] -= count
+                advance(item)
+            continue
+
+        # 拆開：各品項排進最早還有空位的日子，不限量的品項跟著這組最早的一天
+        split_groups += 1
+        assigned = []
+        for row in rows:
+            item = row['item']
+            if item in capacities:
+                advance(item)
+                day = first_open[item]
+                left[day][item] -= 1
+                assigned.append((day, row))
+            else:
+                assigned.append((None, row))
+        earliest = min((day for day, _ in assigned if day is not None), default=0)
+        ensure(earliest)
+        for day, row in assigned:
+            day_rows[earliest if day is None else day].append(row)
+
+    start = start or date.today()
+    days = [ScheduleDay(position + 1, (start + timedelta(days=position)).isoformat(), rows)
+            for position, rows in enumerate(day_rows) if rows]
+    return Schedule(grouping, dict(capacities), days, len(groups), split_groups)
+
+
+def schedule_json(schedule: Schedule) -> str:
+    return json.dumps(schedule.to_dict(), ensure_ascii=False, indent=2)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""測試共用設定：讓測試可以直接匯入專案根目錄的模組"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def sample_orders():
+    """範例資料（與「📋 貼上範例資料」相同）"""
+    with open(os.path.join(ROOT, '範例資料.txt'), encoding='utf-8') as f:
+        return f.read()
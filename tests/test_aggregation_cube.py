@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""多維彙總：訂單數是不重複的訂單，不是品項行數"""
+
+from order_formatter import AggregationCube, OrderFormatter, merge_formatters
+
+ORDERS = (
+    "鬼王x2+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利\n"
+    "鬼王x1\t王小明 1990/5/20\t李美麗 1992/8/15\t身體健康"
+)
+
+
+def load(text=ORDERS):
+    formatter = OrderFormatter()
+    formatter.load_data(text)
+    return formatter
+
+
+def test_order_with_several_items_counts_once():
+    cube = load().cube
+    assert cube.rollup('main') == {('王小明/1990.05.20',): [4, 1050, 2]}
+    assert cube.rollup('item') == {('鬼王',): [3, 750, 2], ('三鬼頭',): [1, 300, 1]}
+    assert cube.rollup() == {(): [4, 1050, 2]}
+
+
+def test_markdown_total_counts_distinct_orders():
+    total = load().cube.render_markdown('item').splitlines()[-1]
+    assert total == "| **總計** | **4** | **$1050** | **2** |"
+
+
+def test_repeated_item_lines_in_one_order():
+    cube = AggregationCube()
+    cube.add('鬼王', 'A', 'B', 'b', 2, 500, order=1)
+    cube.add('鬼王', 'A', 'B', 'b', 1, 250, order=1)
+    assert cube.rollup('item') == {('鬼王',): [3, 750, 1]}
+    cube.remove('鬼王', 'A', 'B', 'b', 2, 500, order=1)
+    assert cube.rollup('item') == {('鬼王',): [1, 250, 1]}
+    cube.remove('鬼王', 'A', 'B', 'b', 1, 250, order=1)
+    assert cube.cells == {}
+
+
+def test_remove_order_retracts_once():
+    formatter = load()
+    formatter.remove_order(formatter.orders[0]['index'])
+    assert formatter.cube.rollup('main') == {('王小明/1990.05.20',): [1, 250, 1]}
+    assert formatter.cube.rollup('item') == {('鬼王',): [1, 250, 1]}
+
+
+def test_matches_full_scan(sample_orders):
+    formatter = load(sample_orders)
+    expected = {}
+    for order in formatter.orders:
+        expected.setdefault(order['main_info'].key, set()).add(order['index'])
+    rollup = formatter.cube.rollup('main')
+    assert {key: measures[2] for (key,), measures in rollup.items()} == \
+        {key: len(indices) for key, indices in expected.items()}
+    assert formatter.cube.rollup()[()][2] == len(formatter.orders)
+
+
+def test_merge_keeps_orders_distinct(sample_orders):
+    first, second = load(sample_orders), load(sample_orders)
+    merged = merge_formatters(first, second)
+    assert merged.cube.rollup()[()] == [2 * len(first.expanded_orders),
+                                        2 * sum(first.item_amounts.values()), len(merged.orders)]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""庫存分配：三種優先順序與剩餘庫存"""
+
+import pytest
+
+from allocation import allocate, parse_stock
+from order_formatter import OrderFormatter, normalize_order_text
+
+ORDERS = (
+    "鬼王x3\t王小明 1990/5/20\t—\t事業順利\n"
+    "鬼王x1+拆散x1\t陳大文 1985/3/2\t—\t身體健康\n"
+    "鬼王x1\t王小明 1990/5/20\t—\t平安\n"
+    "鬼王x1\t林小華 2000/1/1\t—\t平安"
+)
+
+
+@pytest.fixture
+def formatter():
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(ORDERS))
+    return formatter
+
+
+def backordered_orders(allocation):
+    return [row['order_index'] for row in allocation.backordered]
+
+
+def test_enough_stock_fulfils_everything(formatter):
+    allocation = allocate(formatter, parse_stock("鬼王 10 支"))
+    assert not allocation.has_backorders
+    assert len(allocation.fulfilled) == len(formatter.expanded_orders)
+    assert allocation.remaining == {'鬼王': 4}
+
+
+def test_order_priority_serves_earliest_orders(formatter):
+    allocation = allocate(formatter, {'鬼王': 4})
+    assert backordered_orders(allocation) == [3, 4]
+    assert allocation.items[0][1:] == (4, 6, 4, 2, 0)
+    assert "待補貨 2 支（2 筆訂單）" in allocation.summary()
+
+
+def test_customer_priority_takes_turns(formatter):
+    # 王小明、陳大文、林小華各先分一支，第四支回到王小明
+    allocation = allocate(formatter, {'鬼王': 4}, priority='customer')
+    fulfilled = [row['order_index'] for row in allocation.fulfilled if row['item'] == '鬼王']
+    assert sorted(fulfilled) == [1, 1, 2, 4]
+
+
+def test_whole_order_priority_prefers_small_orders(formatter):
+    allocation = allocate(formatter, {'鬼王': 4}, priority='whole_order')
+    # 需求一支的訂單 2、3、4 整筆出貨，訂單 1 只分到剩下的一支
+    assert backordered_orders(allocation) == [1, 1]
+    assert allocation.remaining == {'鬼王': 0}
+
+
+def test_unknown_priority(formatter):
+    with pytest.raises(ValueError):
+        allocate(formatter, {'鬼王': 1}, priority='random')
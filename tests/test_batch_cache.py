@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""批次快取：同一來源的解析結果只保存、只計算一次"""
+
+import threading
+
+from batch_cache import BatchCache, batch_key
+from order_formatter import OrderFormatter, estimate_size
+
+STRUCTURE_BYTES = 1000
+
+
+def fixed_sizer(formatter, reports):
+    report_sizes = {name: len(text) for name, text in reports.items()}
+    return {'structures': {'orders': STRUCTURE_BYTES}, 'reports': report_sizes,
+            'total_bytes': STRUCTURE_BYTES + sum(report_sizes.values()), 'traced': {}}
+
+
+def make_formatter():
+    formatter = OrderFormatter()
+    formatter.load_data("鬼王x2\t王小明 1990/5/20\t—\t事業順利")
+    return formatter
+
+
+def test_references_share_one_parsed_entry():
+    cache = BatchCache(sizer=fixed_sizer)
+    source = batch_key('orders')
+    formatter = make_formatter()
+
+    first = cache.put('s1', batch_key(source, 'ref A'), formatter, {'full_report': 'a' * 10}, source=source)
+    second = cache.put('s1', batch_key(source, 'ref B'), make_formatter(), {'full_report': 'b' * 20}, source=source)
+
+    assert second.formatter is first.formatter is formatter
+    assert cache.parsed(source).formatter is formatter
+    assert cache.total_bytes == STRUCTURE_BYTES + 10 + 20
+    assert cache.status()['parsed'] == 1
+
+
+def test_parsed_entry_released_with_last_batch():
+    cache = BatchCache(sizer=fixed_sizer, session_ttl=0)
+    source = batch_key('orders')
+    cache.put('s1', batch_key(source, 'ref A'), make_formatter(), {'full_report': 'a' * 10}, source=source)
+    cache.put('s2', batch_key(source, 'ref B'), make_formatter(), {'full_report': 'b' * 20}, source=source)
+
+    cache.expire_idle_sessions(now=10 ** 10)
+    assert cache.parsed(source) is None
+    assert cache.total_bytes == 0
+
+
+def test_eviction_keeps_parsed_entry_in_use():
+    source = batch_key('orders')
+    cache = BatchCache(max_bytes=STRUCTURE_BYTES + 25, sizer=fixed_sizer)
+    cache.put('s1', batch_key(source, 'ref A'), make_formatter(), {'full_report': 'a' * 10}, source=source)
+    cache.put('s2', batch_key(source, 'ref B'), make_formatter(), {'full_report': 'b' * 20}, source=source)
+
+    # 超過上限：淘汰較舊的報表批次，解析結果仍被較新的批次使用
+    assert cache.get('s1', batch_key(source, 'ref A')) is None
+    assert cache.parsed(source) is not None
+    assert cache.total_bytes == STRUCTURE_BYTES + 20
+
+
+def test_measured_sizes_are_not_double_counted():
+    cache = BatchCache()
+    source = batch_key('orders')
+    formatter = make_formatter()
+    first = cache.put('s1', batch_key(source, None), formatter,
+                      {'full_report': formatter.generate_full_report()}, source=source)
+    before = cache.total_bytes
+    second = cache.put('s1', batch_key(source, '鬼王 2 支'), formatter,
+                       {'full_report': formatter.generate_full_report('鬼王 2 支')}, source=source)
+    parsed = cache.parsed(source)
+    assert cache.total_bytes == parsed.size + first.size + second.size
+    assert cache.total_bytes - before < before
+
+
+def test_artifacts_count_toward_the_cap():
+    source = batch_key('orders')
+    artifact = b'x' * 50
+    cache = BatchCache(max_bytes=STRUCTURE_BYTES + 25 + estimate_size(artifact), sizer=fixed_sizer)
+    old_key, new_key = batch_key(source, 'ref A'), batch_key(source, 'ref B')
+    cache.put('s1', old_key, make_formatter(), {'full_report': 'a' * 10}, source=source)
+    cache.put('s2', new_key, make_formatter(), {'full_report': 'b' * 20}, source=source)
+    assert cache.artifact(new_key, 'labels:A4') is None
+
+    assert cache.add_artifact(new_key, 'labels:A4', artifact) is artifact
+    assert cache.artifact(new_key, 'labels:A4') is artifact
+    # 下載檔讓總量超過上限，較舊的批次被淘汰
+    assert cache.get('s1', old_key) is None
+    batch = cache.get('s2', new_key)
+    assert batch.memory['artifacts'] == {'labels:A4': estimate_size(artifact)}
+    assert cache.total_bytes == STRUCTURE_BYTES + batch.size == STRUCTURE_BYTES + 20 + estimate_size(artifact)
+
+    # 已淘汰的批次不保存下載檔
+    assert cache.add_artifact(old_key, 'html', b'y') == b'y'
+    assert cache.artifact(old_key, 'html') is None
+
+
+def test_sizer_runs_outside_cache_lock():
+    started, release = threading.Event(), threading.Event()
+
+    def slow_sizer(formatter, reports):
+        started.set()
+        release.wait(5)
+        return fixed_sizer(formatter, reports)
+
+    cache = BatchCache(sizer=slow_sizer)
+    worker = threading.Thread(target=cache.put, args=('s1', 'k', make_formatter(), {'full_report': 'a'}))
+    worker.start()
+    assert started.wait(5)
+
+    # 估算大小期間其他 session 仍可查詢快取
+    statuses = []
+    reader = threading.Thread(target=lambda: statuses.append(cache.status()))
+    reader.start()
+    reader.join(1)
+    assert statuses and not reader.is_alive()
+
+    release.set()
+    worker.join(5)
+    assert cache.get('s1', 'k') is not None
+
+
+def test_concurrent_builders_parse_once():
+    cache = BatchCache(sizer=fixed_sizer)
+    source = batch_key('orders')
+    key = batch_key(source, 'ref')
+    builds, results = [], []
+    barrier = threading.Barrier(4)
+
+    def build(session_id):
+        barrier.wait()
+        with cache.building(source):
+            batch = cache.get(session_id, key)
+            if batch is None:
+                builds.append(session_id)
+                batch = cache.put(session_id, key, make_formatter(), {'full_report': 'a'}, source=source)
+        results.append(batch.formatter)
+
+    threads = [threading.Thread(target=build, args=(f's{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(builds) == 1
+    assert len(results) == 4 and all(formatter is results[0] for formatter in results)
+    assert cache._building == {}
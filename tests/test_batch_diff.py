@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""批次比對：未變動、新增、刪除、修改與品項淨變化"""
+
+from batch_diff import diff_batches, load_batch
+from order_formatter import OrderFormatter, normalize_order_text
+
+OLD = (
+    "鬼王x2+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利\n"
+    "拆散x1\t陳大文 1985/3/2\t—\t身體健康\n"
+    "鬼王x1\t林小華 2000/1/1\t—\t平安"
+)
+
+
+def load(text):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(text))
+    return formatter
+
+
+def test_identical_batches_have_no_changes(sample_orders):
+    diff = diff_batches(load(sample_orders), load(sample_orders))
+    assert not diff.has_changes
+    assert diff.unchanged == len(load(sample_orders).orders)
+    assert diff.item_changes == []
+    assert "完全相同" in diff.render_markdown()
+
+
+def test_added_removed_and_modified():
+    new = load(
+        "鬼王x1\t林小華 2000/1/1\t—\t平安\n"
+        "鬼王x3+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利\n"
+        "拆散x2\t張三 1970/1/1\t—\t平安"
+    )
+    diff = diff_batches(load(OLD), new)
+
+    assert diff.unchanged == 1
+    assert [order['main_person'] for order in diff.added] == ['張三 1970/1/1']
+    assert [order['main_person'] for order in diff.removed] == ['陳大文 1985/3/2']
+    assert [(change.old['index'], change.new['index'], change.fields) for change in diff.modified] == [(1, 2, ['品項'])]
+    changes = {change.item: change for change in diff.item_changes}
+    assert (changes['鬼王'].quantity_diff, changes['鬼王'].amount_diff) == (1, 250)
+    assert (changes['拆散'].old_quantity, changes['拆散'].new_quantity) == (1, 2)
+    assert '三鬼頭' not in changes
+    assert diff.new_amount - diff.old_amount == 500
+
+
+def test_repeated_orders_pair_one_to_one():
+    line = "鬼王x1\t林小華 2000/1/1\t—\t平安"
+    diff = diff_batches(load('\n'.join([line] * 3)), load('\n'.join([line] * 2)))
+    assert diff.unchanged == 2
+    assert len(diff.removed) == 1 and not diff.added and not diff.modified
+
+
+def test_load_batch_from_json_export(tmp_path):
+    formatter = load(OLD)
+    path = tmp_path / 'old.json'
+    path.write_text(formatter.export('json'), encoding='utf-8')
+    diff = diff_batches(load_batch(str(path)), formatter)
+    assert not diff.has_changes and diff.unchanged == 3
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""解析診斷：依行號排序，修改或移除訂單時只更新該訂單的訊息"""
+
+from order_formatter import OrderFormatter
+
+ORDERS = (
+    "鬼王x1\t王小明\t—\t平安\n"
+    "\n"
+    "未知品x1\t陳大文 1985/3/2\t—\t平安\n"
+    "鬼王x1\t林小華 2000/1/1\t—\t平安"
+)
+
+
+def load(text=ORDERS):
+    formatter = OrderFormatter()
+    formatter.load_data(text)
+    return formatter
+
+
+def kinds(formatter):
+    return [(d.line, d.kind, d.order_index) for d in formatter.diagnostics]
+
+
+def test_diagnostics_sorted_by_line():
+    formatter = load()
+    lines = [d.line for d in formatter.diagnostics]
+    assert lines == sorted(lines)
+    assert ('missing_birthday', 1) in [(d.kind, d.order_index) for d in formatter.diagnostics]
+    assert ('unknown_item', 2) in [(d.kind, d.order_index) for d in formatter.diagnostics]
+
+
+def test_update_and_remove_only_touch_that_order():
+    formatter = load()
+    before = kinds(formatter)
+
+    formatter.update_order(2, raw_items='鬼王x1')
+    assert [entry for entry in kinds(formatter) if entry[2] == 2] == []
+    assert [entry for entry in kinds(formatter) if entry[2] != 2] == [entry for entry in before if entry[2] != 2]
+
+    formatter.update_order(3, raw_items='未知品x1')
+    assert (4, 'unknown_item', 3) in kinds(formatter)
+    assert [d.line for d in formatter.diagnostics] == sorted(d.line for d in formatter.diagnostics)
+
+    formatter.remove_order(1)
+    assert all(order_index != 1 for _, _, order_index in kinds(formatter))
+
+
+def test_reimport_skipped_message_survives_removal():
+    formatter = load()
+    duplicate = formatter.orders[0]
+    formatter.mark_imported({duplicate['id']: '批次 A'}, skip=True)
+    skipped = [d for d in formatter.diagnostics if d.kind == 'reimport_skipped']
+    assert len(skipped) == 1 and skipped[0].order_index is None and skipped[0].line == 1
+    assert not any(d.order_index == 1 for d in formatter.diagnostics)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""桌面版剪貼簿暫存檔：剪貼簿還指向的檔案不能先刪，關閉視窗時全部清掉（不需要顯示器）"""
+
+import pytest
+
+gui = pytest.importorskip('order_formatter_gui')
+
+
+class FakeRoot:
+    def __init__(self):
+        self.clipboard = None
+        self.destroyed = False
+
+    def clipboard_clear(self):
+        self.clipboard = None
+
+    def clipboard_append(self, text):
+        self.clipboard = text
+
+    def destroy(self):
+        self.destroyed = True
+
+
+def make_app():
+    app = gui.OrderFormatterGUI.__new__(gui.OrderFormatterGUI)
+    app.root = FakeRoot()
+    app._payloads = {}
+    app._payload_generation = 0
+    app._temp_files = set()
+    app._clipboard_path = None
+    app.statuses = []
+    app.update_status = app.statuses.append
+    return app
+
+
+def copy_large(app, tmp_path, kind):
+    """模擬背景執行緒寫好暫存檔後，主執行緒放入快取與剪貼簿"""
+    path = tmp_path / f'{kind}_{app._payload_generation}.txt'
+    path.write_text('x', encoding='utf-8')
+    app._temp_files.add(str(path))
+    app._payloads[kind] = (None, str(path))
+    app._put_clipboard(app._payloads[kind], lambda _: None)
+    return path
+
+
+def test_clipboard_file_survives_invalidation(tmp_path):
+    app = make_app()
+    path = copy_large(app, tmp_path, 'details')
+    app.invalidate_payloads()
+    assert path.exists()
+    assert app.root.clipboard == str(path)
+
+    # 剪貼簿換成別的內容後才刪除
+    app._put_clipboard(('短內容', None), lambda _: None)
+    assert not path.exists()
+    assert app._temp_files == set()
+
+
+def test_cached_file_kept_until_invalidated(tmp_path):
+    app = make_app()
+    details = copy_large(app, tmp_path, 'details')
+    report = copy_large(app, tmp_path, 'report')
+    # details 仍在快取中，可以再次貼上
+    assert details.exists() and report.exists()
+    app.invalidate_payloads()
+    assert not details.exists() and report.exists()
+
+
+def test_close_removes_remaining_files(tmp_path):
+    app = make_app()
+    first = copy_large(app, tmp_path, 'details')
+    app.invalidate_payloads()
+    second = copy_large(app, tmp_path, 'report')
+    app.on_close()
+    assert not first.exists() and not second.exists()
+    assert app.root.destroyed
+
+
+def test_stale_result_discarded(tmp_path):
+    app = make_app()
+    generation = app._payload_generation
+    path = tmp_path / 'details_0.txt'
+    path.write_text('x', encoding='utf-8')
+
+    # 背景執行緒產生內容期間修改了訂單
+    app.invalidate_payloads()
+    app._finish_copy('details', generation, (None, str(path)), None, lambda _: pytest.fail("不應放入剪貼簿"))
+    assert app.root.clipboard is None
+    assert app._payloads == {}
+    assert not path.exists()
+    assert "已變動" in app.statuses[-1]
+
+
+def test_current_result_cached_and_copied():
+    app = make_app()
+    copied = []
+    app._finish_copy('statistics', app._payload_generation, ('總計\t1', None), None, copied.append)
+    assert app.root.clipboard == '總計\t1'
+    assert app._payloads['statistics'] == ('總計\t1', None)
+    assert copied == [None]
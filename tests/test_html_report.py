@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""離線網頁報表：下載用的位元組與串流輸出一致"""
+
+from html_report import render_html_report
+from order_formatter import OrderFormatter, normalize_order_text
+
+
+def test_render_html_report_matches_export(sample_orders):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(sample_orders))
+
+    page = render_html_report(formatter, "鬼王 2 支")
+    assert isinstance(page, bytes)
+    assert page.decode('utf-8') == formatter.export('html', "鬼王 2 支")
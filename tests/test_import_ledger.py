@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""匯入紀錄：訂單識別碼、重複匯入略過或標示、暫存與寫入"""
+
+import pytest
+
+from import_ledger import ImportLedger
+from order_formatter import OrderFormatter, normalize_order_text
+
+FIRST = (
+    "鬼王x2+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利\n"
+    "拆散x1\t陳大文 1985/3/2\t—\t身體健康"
+)
+OVERLAP = (
+    "拆散x1\t陳大文 1985/3/2\t—\t身體健康\n"
+    "鬼王x1\t林小華 2000/1/1\t—\t平安"
+)
+
+
+def load(text, batch='2026-10-19'):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(text), batch=batch)
+    return formatter
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    with ImportLedger(str(tmp_path / 'ledger' / 'imported.sqlite3')) as ledger:
+        yield ledger
+
+
+def test_order_ids_depend_only_on_content():
+    first, again = load(FIRST), load(OVERLAP, batch='2026-10-20')
+    assert first.orders[1]['id'] == again.orders[0]['id']
+    repeated = load("鬼王x1\t林小華 2000/1/1\t—\t平安\n鬼王x1\t林小華 2000/1/1\t—\t平安")
+    base = repeated.orders[0]['id']
+    assert repeated.orders[1]['id'] == f"{base}-2"
+
+
+def test_skip_already_imported_orders(ledger):
+    assert ledger.record(load(FIRST), source='first.txt') == 2
+
+    formatter = load(OVERLAP)
+    screen = ledger.screen(formatter, skip=True)
+    assert [order['main_person'] for order in screen.duplicates] == ['陳大文 1985/3/2']
+    assert screen.new == 1
+    assert [order['main_person'] for order in formatter.orders] == ['林小華 2000/1/1']
+    assert "已略過" in screen.summary()
+    assert [(d.kind, 'first.txt' in d.message) for d in formatter.diagnostics] == [('reimport_skipped', True)]
+
+
+def test_flag_keeps_orders(ledger):
+    ledger.record(load(FIRST))
+    formatter = load(OVERLAP)
+    screen = ledger.screen(formatter, skip=False)
+    assert len(screen.duplicates) == 1
+    assert len(formatter.orders) == 2
+
+
+def test_pending_is_visible_until_rollback(ledger):
+    ledger.screen(load(FIRST))
+    # 同一次處理的下一個檔案已看得到暫存的訂單
+    assert len(ledger.screen(load(OVERLAP)).duplicates) == 1
+    assert ledger.count() == 0
+    ledger.rollback()
+    assert ledger.screen(load(OVERLAP)).duplicates == []
+    before = ledger.version()
+    assert ledger.commit() == 2
+    assert ledger.count() == 2 and ledger.version() != before
+
+
+def test_forget_batch(ledger):
+    ledger.record(load(FIRST, batch='A'))
+    ledger.record(load(OVERLAP, batch='B'))
+    assert sorted(batch for batch, _, _ in ledger.batches()) == ['A', 'B']
+    assert ledger.forget_batch('A') == 2
+    assert ledger.count() == 1
+    assert ledger.lookup([order['id'] for order in load(FIRST).orders]) == {}
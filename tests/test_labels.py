@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""標籤貼紙：範本編譯、逐頁輸出與下載用的位元組"""
+
+import io
+
+import pytest
+
+from labels import LABEL_SHEETS, LabelTemplate, render_labels, shorten_wish, write_labels
+from order_formatter import OrderFormatter, normalize_order_text
+
+
+@pytest.fixture
+def formatter(sample_orders):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(sample_orders))
+    return formatter
+
+
+def test_render_labels_matches_streamed_pages(formatter):
+    buffer = io.StringIO()
+    pages = write_labels(formatter, buffer, 'a4-3x8')
+    units = len(formatter.expanded_orders)
+    assert pages == -(-units // LABEL_SHEETS['a4-3x8'].per_page)
+    assert buffer.getvalue().count('<div class="label">') == units
+
+    data = render_labels(formatter, 'a4-3x8')
+    assert isinstance(data, bytes)
+    assert data == buffer.getvalue().encode('utf-8')
+
+
+def test_template_fields_are_escaped():
+    template = LabelTemplate('{index}|{item}|{main}|{wish}', wish_limit=5)
+    rows = [{'index': 1, 'order_index': 1, 'item': '<鬼王>', 'price': 250, 'main_person': 'A&B',
+             'target_person': '—', 'wish': '願望：身體健康平安順利'}]
+    assert list(template.render(rows)) == ['<div class="label">1|&lt;鬼王&gt;|A&amp;B|身體健康…</div>']
+
+
+def test_template_rejects_unknown_fields():
+    with pytest.raises(ValueError):
+        LabelTemplate('{phone}')
+    with pytest.raises(ValueError):
+        LabelTemplate('{index:>5}')
+
+
+def test_shorten_wish():
+    assert shorten_wish('願望： 事業  順利') == '事業 順利'
+    assert shorten_wish('一二三四五六', limit=4) == '一二三…'
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""線性掃描的解析輔助函式：結果應與原本的正規表示式相同，過長的行不解析"""
+
+import random
+import re
+import time
+
+import pytest
+
+from order_formatter import (
+    MAX_LINE_LENGTH, OrderFormatter, _is_item_line, _marked_quantity, _reference_count_first,
+    _reference_count_last, _reference_marked, _spaced_quantity, parse_reference_data,
+)
+
+# 原本的正規表示式與取值方式：(名稱, 數量) 或 None
+OLD_PATTERNS = [
+    (_marked_quantity, re.compile(r'(.+?)\s*[xX×*]\s*(\d+)'), 1, 2),
+    (_spaced_quantity, re.compile(r'(.+?)\s+(\d{1,3})$'), 1, 2),
+    (_reference_marked, re.compile(r'^(.+?)\s*[xX×*]\s*(\d+)$'), 1, 2),
+    (_reference_count_first, re.compile(r'^(\d+)\s*支\s*(.+)$'), 2, 1),
+    (_reference_count_last, re.compile(r'^(.+?)\s*(\d+)\s*支?$'), 1, 2),
+]
+OLD_ITEM_LINE = re.compile(r'^[^\d]+\s*[xX×*]\s*\d+')
+
+
+def old_result(pattern, name_group, quantity_group, text):
+    match = pattern.search(text)
+    if match is None:
+        return None
+    return match.group(name_group).strip(), int(match.group(quantity_group))
+
+
+CASES = [
+    '鬼王x2', '三鬼頭 x 121', '鬼王X3', '拆散×1', '拆散*4', '鬼王x', 'x2', '鬼王 2', '鬼王 1234',
+    '鬼王  12 ', '87支鬼王', '87 支 鬼王', '鬼王 87 支', '鬼王87支', '支', '87支', '鬼王x2x3',
+    '帕猜佛蠟燭x7+拆散x1', '1990/5/20', '王小明 1990', ' ', '', '鬼王x０３', '鬼王 ３',
+]
+
+
+@pytest.mark.parametrize('text', CASES)
+@pytest.mark.parametrize('scanner, pattern, name_group, quantity_group', OLD_PATTERNS,
+                         ids=[entry[0].__name__ for entry in OLD_PATTERNS])
+def test_scanner_matches_old_pattern(scanner, pattern, name_group, quantity_group, text):
+    assert scanner(text) == old_result(pattern, name_group, quantity_group, text)
+
+
+@pytest.mark.parametrize('text', CASES + ['願望：事業順利', '王小明 1990/5/20', '鬼王 x 2 願望'])
+def test_item_line_matches_old_pattern(text):
+    assert _is_item_line(text) == bool(OLD_ITEM_LINE.match(text))
+
+
+def test_random_strings_match_old_patterns():
+    rng = random.Random(36)
+    alphabet = 'ab鬼王支xX×* 12０ \t'
+    for _ in range(5000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        for scanner, pattern, name_group, quantity_group in OLD_PATTERNS:
+            assert scanner(text) == old_result(pattern, name_group, quantity_group, text), (scanner.__name__, text)
+        assert _is_item_line(text) == bool(OLD_ITEM_LINE.match(text)), text
+
+
+def test_reference_formats():
+    assert parse_reference_data("三鬼頭x121、87支鬼王\n拆散 3 支，帕猜佛蠟燭 x 7") == \
+        {'三鬼頭': 121, '鬼王': 87, '拆散': 3, '帕猜佛蠟燭': 7}
+
+
+def test_pathological_lines_are_guarded():
+    # 讓 (.+?) 大量回溯的長行：很多字、沒有數量
+    long_line = '鬼王 ' * (MAX_LINE_LENGTH // 3) + 'x'
+    near_limit = ('鬼' * (MAX_LINE_LENGTH - 100)) + ' 願望'
+
+    started = time.perf_counter()
+    formatter = OrderFormatter()
+    formatter.load_data('\n'.join([f"{long_line}\t王小明 1990/5/20\t—\t平安",
+                                   f"{near_limit}x\t王小明 1990/5/20\t—\t平安",
+                                   "鬼王x1\t陳大文 1985/3/2\t—\t平安"]))
+    parse_reference_data(('鬼王 ' * 5000) + '支')
+    assert time.perf_counter() - started < 2.0
+
+    assert [d.kind for d in formatter.diagnostics if d.line == 1] == ['line_too_long']
+    # 接近上限的行仍照常解析
+    assert [order['main_person'] for order in formatter.orders] == ['王小明 1990/5/20', '陳大文 1985/3/2']
+    assert formatter.item_stats['鬼王'] == 1
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""合併已解析的批次：結果應與整批一起解析相同"""
+
+from order_formatter import OrderFormatter, merge_formatters, normalize_order_text
+
+BATCHES = [
+    "鬼王x2+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利\n"
+    "鬼王x1+鬼王x2\t陳大文 1985/3/2\t—\t身體健康",
+    "鬼王x1\t林小華 2000/1/1\t—\t平安\n"
+    "鬼王x2+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利",
+    "未知品x1\t張三\t—\t平安\n"
+    "拆散x3\t林小華 2000/1/1\t—\t平安",
+]
+
+
+def load(text):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(text), batch='2026-10-19')
+    return formatter
+
+
+def snapshot(formatter):
+    return {
+        'orders': [(o['index'], o['id'], o['raw_items'], o['main_person'], o['target_person'], o['wish'])
+                   for o in formatter.orders],
+        'expanded': formatter.expanded_orders,
+        'item_stats': dict(formatter.item_stats),
+        'item_amounts': dict(formatter.item_amounts),
+        'anomalies': formatter.anomalies,
+        'diagnostics': [(d.kind, d.order_index) for d in formatter.diagnostics],
+        'cube': formatter.cube.rollup('item', 'main'),
+        'total': formatter.cube.rollup(),
+    }
+
+
+def test_merge_equals_single_parse():
+    merged = merge_formatters(*(load(text) for text in BATCHES))
+    assert snapshot(merged) == snapshot(load('\n'.join(BATCHES)))
+    assert merged.query(person='王小明') == load('\n'.join(BATCHES)).query(person='王小明')
+
+
+def test_merge_is_associative_and_leaves_inputs_alone(sample_orders):
+    a, b, c = load(sample_orders), load(BATCHES[0]), load(BATCHES[1])
+    before = snapshot(a)
+    left = merge_formatters(merge_formatters(a, b), c)
+    right = merge_formatters(a, merge_formatters(b, c))
+    assert snapshot(left) == snapshot(right)
+    assert snapshot(a) == before
+
+
+def test_merge_continues_after_edits():
+    formatter = load(BATCHES[0])
+    formatter.remove_order(1)
+    formatter.merge(load(BATCHES[1]))
+    assert [order['index'] for order in formatter.orders] == [2, 3, 4]
+    assert [row['index'] for row in formatter.expanded_orders] == list(range(1, len(formatter.expanded_orders) + 1))
+
+
+def test_merge_with_itself():
+    formatter = load(BATCHES[0])
+    formatter.merge(formatter)
+    assert snapshot(formatter) == snapshot(load('\n'.join([BATCHES[0]] * 2)))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""HTTP 批次處理服務：請求解析與排隊名額"""
+
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import order_api
+from order_api import BatchHTTPServer, BatchService, ServiceBusy, parse_request_body
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"x"', b'42', b'null'])
+def test_json_body_must_be_object(body):
+    with pytest.raises(ValueError):
+        parse_request_body('application/json', body, {})
+
+
+def test_json_body_fields():
+    body = json.dumps({'orders': '鬼王x2\t王小明 1990/5/20', 'batch': 'A'}).encode('utf-8')
+    fields = parse_request_body('application/json', body, {'reference': ['鬼王 2 支']})
+    assert fields == {'orders': '鬼王x2\t王小明 1990/5/20', 'reference': '鬼王 2 支', 'batch': 'A'}
+
+
+def thread_service(workers=1, max_queue=0, timeout=60.0):
+    """改用執行緒池，測試可以替換 process_batch"""
+    service = BatchService(workers=workers, max_queue=max_queue, timeout=timeout)
+    service.executor.shutdown()
+    service.executor = ThreadPoolExecutor(max_workers=workers)
+    return service
+
+
+def test_non_object_json_gets_400():
+    service = thread_service()
+    server = BatchHTTPServer(('127.0.0.1', 0), service, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+        connection.request('POST', '/report', body=b'[1, 2]', headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        assert response.status == 400
+        assert 'error' in json.loads(response.read().decode('utf-8'))
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+@pytest.mark.parametrize('length', ['abc', '1e3'])
+def test_invalid_content_length_gets_400(length):
+    service = thread_service()
+    server = BatchHTTPServer(('127.0.0.1', 0), service, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+        connection.putrequest('POST', '/report')
+        connection.putheader('Content-Length', length)
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 400
+        assert 'Content-Length' in json.loads(response.read().decode('utf-8'))['error']
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+def test_timed_out_batch_keeps_its_slot(monkeypatch):
+    release = threading.Event()
+
+    def slow_batch(order_text, reference_data, fmt, batch=None):
+        release.wait(5)
+        return order_text.encode('utf-8'), 'text/plain'
+
+    monkeypatch.setattr(order_api, 'process_batch', slow_batch)
+    service = thread_service(workers=1, max_queue=0, timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            service.submit('a', None, 'md')
+        # 逾時的批次仍在執行：狀態照實回報，新的批次不能超收
+        assert service.status()['running'] == 1
+        with pytest.raises(ServiceBusy):
+            service.submit('b', None, 'md')
+
+        release.set()
+        service.executor.shutdown(wait=True)
+        assert service.status()['running'] == 0
+        assert service.active == 0
+    finally:
+        release.set()
+        service.shutdown()
+
+
+def test_completed_batch_releases_slot(monkeypatch):
+    monkeypatch.setattr(order_api, 'process_batch',
+                        lambda order_text, reference_data, fmt, batch=None: (b'ok', 'text/plain'))
+    service = thread_service(workers=1, max_queue=0)
+    try:
+        for _ in range(3):
+            assert service.submit('a', None, 'md') == (b'ok', 'text/plain')
+        status = service.status()
+        assert (status['completed'], status['running'], status['failed']) == (3, 0, 0)
+    finally:
+        service.shutdown()
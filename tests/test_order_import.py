@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""試算表／CSV 匯入：表頭猜測、欄位對應、編碼判斷"""
+
+import io
+
+import pytest
+
+from order_formatter import OrderFormatter
+from order_import import guess_mapping, load_table, read_header, resolve_mapping
+
+CSV = (
+    "時間戳記,購買品項,姓名,生日,對象,願望\n"
+    "2026/10/1,鬼王x2+三鬼頭x1,王小明,1990/5/20,李美麗 1992/8/15,事業順利\n"
+    "2026/10/1,拆散x1,陳大文,1985/3/2,,身體健康\n"
+)
+
+
+def test_guess_mapping_from_header():
+    mapping = guess_mapping(['時間戳記', '購買品項', '姓名', '生日', '對象', '願望'])
+    assert mapping == {'item': ['購買品項'], 'main': ['姓名', '生日'], 'target': ['對象'], 'wish': ['願望']}
+
+
+def test_resolve_mapping_accepts_column_letters():
+    header = ['品項', '姓名']
+    assert resolve_mapping(header, {'item': ['A'], 'main': ['姓名', 'C']}) == \
+        {'item': [0], 'main': [1, 2], 'target': [], 'wish': []}
+    with pytest.raises(ValueError):
+        resolve_mapping(header, {'item': ['品項']})
+    with pytest.raises(ValueError):
+        resolve_mapping(header, {'item': ['數量'], 'main': ['姓名']})
+
+
+@pytest.mark.parametrize('encoding', ['utf-8-sig', 'cp950'])
+def test_load_csv(encoding):
+    formatter = OrderFormatter()
+    load_table(formatter, io.BytesIO(CSV.encode(encoding)), '表單.csv', batch='2026-10-01')
+
+    assert [(order['raw_items'], order['main_person'], order['wish']) for order in formatter.orders] == [
+        ('鬼王x2+三鬼頭x1', '王小明 1990/5/20', '事業順利'),
+        ('拆散x1', '陳大文 1985/3/2', '身體健康'),
+    ]
+    assert dict(formatter.item_stats) == {'鬼王': 2, '三鬼頭': 1, '拆散': 1}
+    assert formatter.orders[0]['batch'] == '2026-10-01'
+
+
+def test_read_header_then_load_same_upload():
+    upload = io.BytesIO(CSV.encode('utf-8'))
+    assert read_header(upload, '表單.csv')[1] == '購買品項'
+    formatter = OrderFormatter()
+    load_table(formatter, upload, '表單.csv', mapping={'item': ['B'], 'main': ['C', 'D']})
+    assert len(formatter.orders) == 2
+    assert formatter.orders[0]['target_person'] == '—'
+
+
+def test_unsupported_extension():
+    with pytest.raises(ValueError):
+        load_table(OrderFormatter(), io.BytesIO(b''), '表單.ods')
+
+
+def test_load_xlsx():
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in CSV.splitlines():
+        sheet.append(row.split(','))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    formatter = OrderFormatter()
+    load_table(formatter, buffer, '表單.xlsx')
+    assert [order['main_person'] for order in formatter.orders] == ['王小明 1990/5/20', '陳大文 1985/3/2']
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""監看資料夾：不讀回自己的輸出、只解析寫完的訂單"""
+
+import os
+import time
+
+from order_formatter import OrderFormatter, complete_orders_end, normalize_order_text
+from order_watcher import STATISTICS_FILENAME, FolderWatcher, main
+
+MULTI_LINE_FIRST = "鬼王x2\n王小明 1990/5/20\n李美麗 1992/8/15\n願望：事業順利\n\n"
+MULTI_LINE_SECOND = "三鬼頭x1\n陳大文 1985/3/2\n"
+MULTI_LINE_REST = "願望：身體健康\n平安順利\n\n"
+
+
+def parse(text):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(text))
+    return formatter
+
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+
+def write_settled(path, text):
+    """寫入並把修改時間調到兩分鐘前（已停止寫入，沒有結尾的最後一筆也算寫完）"""
+    path.write_text(text, encoding='utf-8')
+    past = time.time() - 120
+    os.utime(path, (past, past))
+
+
+def test_complete_orders_end_tab_format():
+    text = "鬼王x2\t王小明 1990/5/20\t—\t事業\n三鬼頭x1\t陳大"
+    assert complete_orders_end(text) == text.index('三鬼頭')
+    assert complete_orders_end("鬼王x2\t王小明 1990/5/20") == 0
+
+
+def test_complete_orders_end_multi_line():
+    assert complete_orders_end(MULTI_LINE_FIRST + MULTI_LINE_SECOND) == len(MULTI_LINE_FIRST)
+    # 願望可以有多行：要等到空行或下一筆品項行才算寫完
+    text = MULTI_LINE_FIRST + MULTI_LINE_SECOND + "願望：身體健康\n"
+    assert complete_orders_end(text) == len(MULTI_LINE_FIRST)
+    text = MULTI_LINE_FIRST.rstrip('\n') + "\n" + MULTI_LINE_SECOND
+    assert complete_orders_end(text) == text.index('三鬼頭')
+
+
+def test_once_in_place_does_not_read_back_outputs(tmp_path, sample_orders):
+    write_settled(tmp_path / '訂單.txt', sample_orders)
+    expected = parse(sample_orders)
+    for _ in range(3):
+        assert main([str(tmp_path), '--once', '-q']) == 0
+    assert (tmp_path / STATISTICS_FILENAME).exists()
+
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path), quiet=True)
+    assert set(watcher.files) == {'訂單.txt'}
+    assert watcher.totals.orders == len(expected.orders)
+    assert sum(watcher.totals.item_amounts.values()) == sum(expected.item_amounts.values())
+
+
+def test_state_with_ingested_outputs_is_repaired(tmp_path, sample_orders):
+    # 舊版本把統計檔當成訂單讀進狀態檔：下次掃描時扣回
+    write_settled(tmp_path / '訂單.txt', sample_orders)
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path), quiet=True)
+    watcher.scan(force=True)
+    watcher.write_outputs()
+    watcher.ignored = set()
+    watcher.scan(force=True)
+    assert STATISTICS_FILENAME in watcher.files
+
+    repaired = FolderWatcher(str(tmp_path), str(tmp_path), quiet=True)
+    repaired.scan(force=True)
+    assert set(repaired.files) == {'訂單.txt'}
+    assert repaired.totals.orders == len(parse(sample_orders).orders)
+
+
+def test_multi_line_order_split_across_writes(tmp_path):
+    folder, output = tmp_path / 'in', tmp_path / 'out'
+    folder.mkdir()
+    path = folder / '訂單.txt'
+    watcher = FolderWatcher(str(folder), str(output), quiet=True)
+    os.makedirs(output)
+
+    append(path, MULTI_LINE_FIRST + MULTI_LINE_SECOND)
+    watcher.scan(force=True)
+    assert watcher.totals.orders == 1
+
+    append(path, MULTI_LINE_REST)
+    watcher.scan(force=True)
+    whole = parse(MULTI_LINE_FIRST + MULTI_LINE_SECOND + MULTI_LINE_REST)
+    assert watcher.totals.orders == len(whole.orders) == 2
+    assert watcher.totals.item_stats == whole.item_stats
+    assert watcher.files['訂單.txt'].anomalies == []
+
+
+def test_tab_line_split_across_writes(tmp_path):
+    path = tmp_path / '訂單.txt'
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path / 'out'), quiet=True)
+    os.makedirs(tmp_path / 'out')
+
+    append(path, "鬼王x2\t王小明 1990/5/20\t—\t事業順利\n三鬼")
+    watcher.scan(force=True)
+    assert dict(watcher.totals.item_stats) == {'鬼王': 2}
+
+    append(path, "頭x3\t陳大文 1985/3/2\t—\t健康\n")
+    watcher.scan(force=True)
+    assert dict(watcher.totals.item_stats) == {'鬼王': 2, '三鬼頭': 3}
+
+
+def test_unterminated_last_order_waits_for_settle(tmp_path):
+    path = tmp_path / '訂單.txt'
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path / 'out'), quiet=True, settle=60)
+    os.makedirs(tmp_path / 'out')
+
+    append(path, MULTI_LINE_FIRST + MULTI_LINE_SECOND + "願望：身體健康")
+    now = time.time()
+    watcher.scan(now=now, force=True)
+    assert watcher.totals.orders == 1
+
+    # 檔案沒有再變動：停止寫入超過 settle 秒後，最後一筆當作寫完
+    mtime = os.stat(path).st_mtime
+    watcher.scan(now=mtime + 30)
+    assert watcher.totals.orders == 1
+    watcher.scan(now=mtime + 61)
+    assert watcher.totals.orders == 2
+    assert watcher.files['訂單.txt'].offset == os.path.getsize(path)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""人物解析：範例資料中的各種生日寫法、括號附註與英文名"""
+
+import re
+
+import pytest
+
+from order_formatter import OrderFormatter, normalize_order_text, parse_person
+
+
+@pytest.mark.parametrize('text, name, roman, birthday', [
+    ('王小明 1996.01.17', '王小明', '', '1996.01.17'),
+    ('許甄尹/Janny/ HSU CHEN YING 19880610', '許甄尹', 'JANNY HSU CHEN YING', '1988.06.10'),
+    ('林 1988/11/07', '林', '', '1988.11.07'),
+    ('陳大文 1985/7/29', '陳大文', '', '1985.07.29'),
+    ('李美麗 1990,07,06', '李美麗', '', '1990.07.06'),
+    ('張三 1986/ 01 /26', '張三', '', '1986.01.26'),
+    ('邱子育（Pinky Chiu）2000.1.24 ', '邱子育', 'PINKY CHIU', '2000.01.24'),
+    ('蔡欣懌 TSAI HSINYIH 1985年11月9日', '蔡欣懌', 'TSAI HSINYIH', '1985.11.09'),
+    ('顏子芯 YAN ZIH SIN  1981年3月9日', '顏子芯', 'YAN ZIH SIN', '1981.03.09'),
+    ('曾曉嘉 (Bianca Tsang)1985年6月8日', '曾曉嘉', 'BIANCA TSANG', '1985.06.08'),
+    ('黃雨柔 （Ally Huang)1990/07/09', '黃雨柔', 'ALLY HUANG', '1990.07.09'),
+    ('江采薰(JIANG, CAI-SYUN)1991/09/29', '江采薰', 'JIANG CAI SYUN', '1991.09.29'),
+    ('林 1988/11/07（農曆）', '林', '', '1988.11.07'),
+    ('王小明（阿明）', '王小明', '', ''),
+    ('許小莉 HSU HSIAO LI 1981/120/07', '許小莉', 'HSU HSIAO LI', ''),
+])
+def test_parse_person(text, name, roman, birthday):
+    info = parse_person(text)
+    assert (info.name, info.roman, info.birthday) == (name, roman, birthday)
+
+
+def test_every_sample_birthday_is_recognised(sample_orders):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(sample_orders))
+    people = {order[field] for order in formatter.orders for field in ('main_person', 'target_person')}
+
+    for person in people:
+        info = parse_person(person)
+        # 只有月份寫錯的 1981/120/07 無法辨識
+        if re.search(r'\d{4}', person) and '/120/' not in person:
+            assert info.birthday, person
+        assert not re.search(r'[年月日]|農曆', info.name), person
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""歷史報表封存：查詢、同時寫入的編號、損壞後重建索引"""
+
+import multiprocessing
+import os
+import re
+
+from order_formatter import OrderFormatter, normalize_order_text
+from report_archive import ReportArchive, parse_report_details
+
+ORDERS = (
+    "鬼王x2+三鬼頭x1\t王小明 1990/5/20\t李美麗 1992/8/15\t事業順利\n"
+    "拆散x1\t陳大文 1985/3/2\t—\t身體健康"
+)
+
+
+def without_time(report):
+    """報表摘要含生成時間，比對前去掉"""
+    return re.sub(r'生成時間\*\*：[^\n]*', '', report)
+
+
+def load(text=ORDERS):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(text))
+    return formatter
+
+
+def test_find_uses_index_and_reads_matching_orders(tmp_path):
+    archive = ReportArchive(str(tmp_path))
+    first = archive.add(load(), name='第一批', codec='gz')
+    second = archive.add(load("鬼王x1\t林小華 2000/1/1\t—\t平安"), name='第二批', codec='xz')
+
+    assert [entry.number for entry in archive.find(item='鬼王')] == [2, 1]
+    assert archive.find(customer='陳大文') == [first]
+    assert archive.find(item='不存在') == []
+    orders = list(ReportArchive(str(tmp_path)).find_orders(customer='林小華'))
+    assert [(entry.number, order['raw_items']) for entry, order in orders] == [(second.number, '鬼王x1')]
+
+
+def test_report_round_trip(tmp_path, sample_orders):
+    formatter = load(sample_orders)
+    archive = ReportArchive(str(tmp_path))
+    entry = archive.add(formatter, name='範例')
+    report = archive.report(entry)
+    assert without_time(report) == without_time(formatter.generate_full_report())
+    assert len(parse_report_details(report)) == len(formatter.orders)
+
+    imported = archive.add_report_text(report, '訂單報表_20260105_183012.md')
+    assert (imported.orders, imported.units) == (entry.orders, entry.units)
+    assert archive.load_formatter(imported).item_stats == formatter.item_stats
+
+
+def _add_entries(directory, worker, count):
+    archive = ReportArchive(directory)
+    for position in range(count):
+        archive.add(load(), name=f'行程{worker}-{position}', codec='gz')
+
+
+def test_concurrent_writers_get_unique_numbers(tmp_path):
+    directory = str(tmp_path)
+    processes = [multiprocessing.Process(target=_add_entries, args=(directory, worker, 8)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    archive = ReportArchive(directory)
+    entries = archive.entries
+    assert sorted(entry.number for entry in entries) == list(range(1, 33))
+    assert len({entry.name for entry in entries}) == 32
+    for entry in entries:
+        assert archive.read(entry)['name'] == entry.name
+
+
+def test_rebuild_skips_damaged_record(tmp_path):
+    archive = ReportArchive(str(tmp_path))
+    for name in ('一', '二', '三'):
+        archive.add(load(), name=name, codec='gz')
+    damaged = archive.get(2)
+
+    # 第二筆內容損壞，另外在檔尾加上一段寫到一半的紀錄與之後成功寫入的一筆
+    with open(archive.data_path, 'r+b') as f:
+        f.seek(damaged.offset + 10)
+        f.write(b'\0' * 20)
+    with open(archive.data_path, 'ab') as f:
+        f.write(b'ORA1gz\0\0\0\0\0\0\xff\xff' + b'partial')
+    os.remove(archive.index_path)
+    archive.add(load(), name='四', codec='gz')
+
+    assert archive.rebuild_index() == 3
+    rebuilt = ReportArchive(str(tmp_path))
+    assert [entry.name for entry in rebuilt.entries] == ['一', '三', '四']
+    assert [entry.number for entry in rebuilt.entries] == [1, 2, 3]
+    assert without_time(rebuilt.report(rebuilt.entries[-1])) == without_time(load().generate_full_report())
+
+
+def test_append_after_partial_index_line(tmp_path):
+    archive = ReportArchive(str(tmp_path))
+    archive.add(load(), name='一', codec='gz')
+    with open(archive.index_path, 'a', encoding='utf-8') as f:
+        f.write('{"number": 2, "na')
+    entry = ReportArchive(str(tmp_path)).add(load(), name='二', codec='gz')
+    assert entry.number == 2
+    assert [e.name for e in ReportArchive(str(tmp_path)).entries] == ['一', '二']
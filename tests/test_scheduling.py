@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""法事排程：每日產能、同組同一天與拆組"""
+
+from datetime import date
+
+import pytest
+
+from order_formatter import OrderFormatter, normalize_order_text
+from scheduling import schedule_units
+
+ORDERS = (
+    "鬼王x2+拆散x1\t王小明 1990/5/20\t—\t事業順利\n"
+    "鬼王x1\t陳大文 1985/3/2\t—\t身體健康\n"
+    "鬼王x1\t王小明 1990/5/20\t—\t平安\n"
+    "鬼王x5\t林小華 2000/1/1\t—\t平安"
+)
+
+
+@pytest.fixture
+def formatter():
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(ORDERS))
+    return formatter
+
+
+def test_every_unit_scheduled_within_capacity(sample_orders):
+    formatter = OrderFormatter()
+    formatter.load_data(normalize_order_text(sample_orders))
+    capacities = {item: 10 for item in formatter.item_stats}
+    schedule = schedule_units(formatter, capacities, start=date(2026, 11, 1))
+
+    assert schedule.units == len(formatter.expanded_orders)
+    assert sorted(row['index'] for day in schedule.days for row in day.rows) == \
+        [row['index'] for row in formatter.expanded_orders]
+    for day in schedule.days:
+        assert all(count <= capacities[item] for item, count in day.item_counts().items())
+    assert schedule.days[0].date == '2026-11-01'
+
+
+def test_customer_grouping_keeps_customer_on_one_day(formatter):
+    schedule = schedule_units(formatter, {'鬼王': 4}, start=date(2026, 11, 1))
+    day_of = {}
+    for day in schedule.days:
+        for row in day.rows:
+            day_of.setdefault(formatter.get_order(row['order_index'])['main_person'], set()).add(day.day)
+
+    # 王小明的兩筆訂單共三支鬼王排在同一天；林小華五支超過每日產能，只能拆開
+    assert day_of['王小明 1990/5/20'] == {1}
+    assert day_of['陳大文 1985/3/2'] == {1}
+    assert day_of['林小華 2000/1/1'] == {2, 3}
+    assert (schedule.groups, schedule.split_groups) == (3, 1)
+    # 不限量的拆散跟著同組
+    assert schedule.days[0].item_counts() == {'鬼王': 4, '拆散': 1}
+
+
+def test_order_grouping(formatter):
+    schedule = schedule_units(formatter, {'鬼王': 4}, grouping='order')
+    assert schedule.groups == 4
+    assert schedule.units == 10
+
+
+def test_invalid_capacity(formatter):
+    with pytest.raises(ValueError):
+        schedule_units(formatter, {'鬼王': 0})
+    with pytest.raises(ValueError):
+        schedule_units(formatter, {'鬼王': 1}, grouping='day')